@@ -0,0 +1,84 @@
+"""Compare per token sign and verify cost of the supported jwt algorithms
+
+Usage::
+
+    python benchmarks/jwt_algorithms.py [iterations]
+
+Keys are parsed once up front, as olcommon.http.configure.configure_registry
+does, so the numbers only include the cost of jwt.encode and jwt.decode.
+"""
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import rsa
+from datetime import datetime
+from datetime import timedelta
+from olcommon.http.jwt_keys import load_jwt_key
+
+import jwt
+import sys
+import timeit
+
+
+def generate_private_key(algorithm):
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == "ES384":
+        return ec.generate_private_key(ec.SECP384R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def to_pem(private_key):
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return private_pem, public_pem
+
+
+def bench(algorithm, iterations):
+    private_pem, public_pem = to_pem(generate_private_key(algorithm))
+    private_key = load_jwt_key(algorithm, private_pem)
+    public_key = load_jwt_key(algorithm, public_pem)
+    claims = {
+        "sub": "user1",
+        "aud": ["access"],
+        "iat": datetime.utcnow(),
+        "exp": datetime.utcnow() + timedelta(hours=1),
+    }
+    token = jwt.encode(claims, key=private_key, algorithm=algorithm)
+
+    def sign():
+        jwt.encode(claims, key=private_key, algorithm=algorithm)
+
+    def verify():
+        jwt.decode(token, key=public_key, algorithms=[algorithm], options={"verify_aud": False})
+
+    def verify_pem():
+        jwt.decode(token, key=public_pem, algorithms=[algorithm], options={"verify_aud": False})
+
+    return (
+        timeit.timeit(sign, number=iterations) / iterations,
+        timeit.timeit(verify, number=iterations) / iterations,
+        timeit.timeit(verify_pem, number=iterations) / iterations,
+    )
+
+
+def main(argv):
+    iterations = int(argv[1]) if len(argv) > 1 else 500
+    print(f"{'algorithm':<10} {'sign':>10} {'verify':>10} {'verify pem':>12}  (us per token)")
+    for algorithm in ("EdDSA", "ES256", "ES384", "RS256", "PS256"):
+        sign, verify, verify_pem = bench(algorithm, iterations)
+        print(f"{algorithm:<10} {sign * 1e6:>10.1f} {verify * 1e6:>10.1f} {verify_pem * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,123 @@
+"""Measure the time from configure_registry to the first request served
+
+Usage::
+
+    python benchmarks/registry_startup.py [runs]
+
+Each run is a fresh interpreter so module imports are paid as they would be
+in a new worker. An eager pyramid Registry is compared with
+olcommon.registry.Registry, which builds its engines and mailer on first use.
+Nothing connects to postgres or redis, the request is to ``/_check/app``.
+"""
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+CHILD = """
+import json
+import sys
+import time
+
+settings = json.loads(sys.argv[1])
+lazy = sys.argv[2] == "lazy"
+
+from olcommon.registry import Registry
+from olcommon.registry import configure_registry
+from olcommon.resource.site_base import SiteBase
+from pyramid.config import Configurator
+from webob import Request
+import pyramid.registry
+
+start = time.perf_counter()
+registry = Registry("bench") if lazy else pyramid.registry.Registry("bench")
+config = Configurator(registry=registry)
+config.setup_registry(settings=settings)
+registry["root_class"] = SiteBase
+configure_registry(registry, settings)
+registry_done = time.perf_counter()
+config.include("olcommon.http")
+app = config.make_wsgi_app()
+app_done = time.perf_counter()
+response = Request.blank("/_check/app").get_response(app)
+assert response.status_code == 200, response.status
+served = time.perf_counter()
+print(json.dumps({
+    "configure_registry": registry_done - start,
+    "make_wsgi_app": app_done - registry_done,
+    "first_request": served - app_done,
+    "total": served - start,
+}))
+"""
+
+
+def bench_settings():
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    return {
+        "is_debug": "false",
+        "postgresql_url": "postgresql+psycopg2://bench@localhost/bench",
+        "redis_url": "redis://localhost:6379/0",
+        "application_url": "http://localhost",
+        "application_id": "bench",
+        "site_email": "site@example.com",
+        "site_email_from_name": "Bench",
+        "site_noreply_email": "noreply@example.com",
+        "mail.host": "localhost",
+        "mail.port": "25",
+        "sendgrid_api_key": "",
+        "sendgrid_template_generic": "",
+        "rq_write_group_queues": "a b",
+        "docs_dist": "",
+        "template_dirs": "",
+        "session_secret": "x" * 32,
+        "jwt_algorithm": "EdDSA",
+        "jwt_leeway": "10",
+        "jwt_access_ttl": "300",
+        "jwt_refresh_ttl": "3600",
+        "jwt_private_key": private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode(),
+        "jwt_public_key": private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode(),
+    }
+
+
+def run(mode, settings):
+    env = dict(os.environ, use_debug_mailer="false")
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD, json.dumps(settings), mode],
+        env=env,
+    )
+    return json.loads(output)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    settings = bench_settings()
+    print(f"{'registry':<8} {'configure_registry':>19} {'make_wsgi_app':>14} {'first_request':>14} {'total':>10}")
+    for mode in ("eager", "lazy"):
+        results = [run(mode, settings) for _ in range(runs)]
+        medians = {
+            key: statistics.median(r[key] for r in results) * 1000
+            for key in results[0]
+        }
+        print(
+            f"{mode:<8} {medians['configure_registry']:>16.2f} ms"
+            f" {medians['make_wsgi_app']:>11.2f} ms"
+            f" {medians['first_request']:>11.2f} ms"
+            f" {medians['total']:>7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compare write group routing by the first md5 byte with jump hashing
+
+Usage::
+
+    python benchmarks/write_group_routing.py [keys]
+
+For 2 to 16 queues this reports the cost per key, the busiest queue's share
+over the mean, and the fraction of keys which move to another queue when
+one queue is added. With jump hashing that fraction should be close to
+1 / (queues + 1).
+"""
+
+from hashlib import md5
+from olcommon.write_groups import write_group_index
+from uuid import uuid4
+
+import math
+import sys
+import time
+
+
+def first_byte_index(key, groups):
+    """The routing used before jump hashing"""
+    key_hash = md5(key.bytes).digest()[0] / 256
+    return int(math.floor(key_hash * groups))
+
+
+def measure(route, keys, groups):
+    start = time.perf_counter()
+    before = [route(k, groups) for k in keys]
+    seconds = time.perf_counter() - start
+    after = [route(k, groups + 1) for k in keys]
+    counts = [0] * groups
+    for index in before:
+        counts[index] += 1
+    return {
+        "us_per_key": seconds / len(keys) * 1e6,
+        "max_over_mean": max(counts) / (len(keys) / groups),
+        "moved": sum(1 for (b, a) in zip(before, after) if b != a) / len(keys),
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    keys = [uuid4() for i in range(count)]
+    print(f"{count} random UUID keys")
+    print(f"{'queues':>6} {'router':>10} {'us/key':>8} {'max/mean':>9} {'moved':>7} {'ideal':>7}")
+    for groups in (2, 3, 4, 8, 12, 16):
+        for (name, route) in (("first byte", first_byte_index), ("jump", write_group_index)):
+            result = measure(route, keys, groups)
+            print(
+                f"{groups:>6} {name:>10} {result['us_per_key']:>8.2f} {result['max_over_mean']:>9.3f} "
+                f"{result['moved']:>7.1%} {1 / (groups + 1):>7.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
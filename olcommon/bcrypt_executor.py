@@ -0,0 +1,157 @@
+from .exc import BcryptExecutorBusyError
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import bcrypt
+import os
+import threading
+import time
+
+
+# bcrypt's own default cost
+DEFAULT_BCRYPT_ROUNDS = 12
+
+
+class BcryptExecutor:
+    """A bounded thread pool to run bcrypt hashing and checking on.
+
+    bcrypt releases the GIL so the pool runs hashes in parallel, while
+    ``max_workers`` caps how many CPU cores a burst of logins can take from
+    other requests. At most ``max_queue`` calls may be running or waiting,
+    further calls raise ``BcryptExecutorBusyError`` rather than piling up.
+
+    Attributes:
+        rounds (int): The bcrypt cost for new password hashes
+        queue_depth (int): The number of calls running or waiting
+        completed (int): The number of calls which have finished
+        rejected (int): The number of calls refused because the queue was full
+    """
+
+    def __init__(self, max_workers=2, max_queue=64, rounds=DEFAULT_BCRYPT_ROUNDS):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="bcrypt")
+
+    def submit(self, func, *args):
+        """Returns: A concurrent.futures.Future of func(*args)"""
+        with self.lock:
+            if self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise BcryptExecutorBusyError()
+            self.queue_depth += 1
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.queue_depth -= 1
+            self.completed += 1
+
+    def call(self, func, *args):
+        """Run func(*args) on the pool and wait for the result"""
+        return self.submit(func, *args).result()
+
+    async def call_async(self, func, *args):
+        """Run func(*args) on the pool and await the result"""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def gensalt(self):
+        return bcrypt.gensalt(self.rounds)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def stats(self):
+        """Returns: A dictionary of the executor counters"""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "rounds": self.rounds,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+def bcrypt_hash_rounds(password_hash):
+    """Returns: The cost of a bcrypt hash such as b"$2b$12$..." or None"""
+    try:
+        return int(password_hash.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def calibrate_bcrypt_rounds(target_seconds, min_rounds=10, max_rounds=16, probes=5):
+    """Find the highest bcrypt cost that hashes within target_seconds.
+
+    Each extra round doubles the hashing time, so the time of a hash at a
+    low cost is measured and extrapolated. The fastest of several probes is
+    used as a single timing is thrown off by whatever else the machine is
+    doing, and the error doubles with each extrapolated round.
+
+    Returns:
+        int: The cost, clamped between min_rounds and max_rounds
+    """
+    probe_rounds = 6
+    salt = bcrypt.gensalt(probe_rounds)
+    probe_seconds = None
+    for i in range(probes):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibrate", salt)
+        elapsed = time.perf_counter() - start
+        probe_seconds = elapsed if probe_seconds is None else min(probe_seconds, elapsed)
+    probe_seconds = max(probe_seconds, 1e-6)
+    rounds = probe_rounds
+    while rounds < max_rounds and probe_seconds * 2 ** (rounds + 1 - probe_rounds) <= target_seconds:
+        rounds += 1
+    return max(min_rounds, min(rounds, max_rounds))
+
+
+_executor = None
+_executor_kwargs = {}
+_executor_lock = threading.Lock()
+
+
+def configure_bcrypt_executor(**kwargs):
+    """Set the arguments for the process wide BcryptExecutor
+
+    Returns:
+        BcryptExecutor: The new executor
+    """
+    global _executor, _executor_kwargs
+    with _executor_lock:
+        _executor_kwargs = kwargs
+        old, _executor = _executor, BcryptExecutor(**kwargs)
+    if old is not None:
+        old.shutdown(wait=False)
+    return _executor
+
+
+def get_bcrypt_executor():
+    """Returns: The process wide BcryptExecutor, creating it if needed"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = BcryptExecutor(**_executor_kwargs)
+    return _executor
+
+
+def _reset_after_fork():
+    # Pool threads do not survive a fork. The child creates a new pool on first use.
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
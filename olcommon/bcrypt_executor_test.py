@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+
+from .bcrypt_executor import BcryptExecutor
+from .bcrypt_executor import bcrypt_hash_rounds
+from .bcrypt_executor import calibrate_bcrypt_rounds
+from .exc import BcryptExecutorBusyError
+from unittest.mock import patch
+
+import bcrypt
+import threading
+import unittest
+
+
+class TestCalibrateBcryptRounds(unittest.TestCase):
+    def calibrate(self, probe_times, target_seconds, **kwargs):
+        # perf_counter is read before and after each probe
+        ticks = []
+        now = 0.0
+        for elapsed in probe_times:
+            ticks += [now, now + elapsed]
+            now += elapsed
+        with patch("olcommon.bcrypt_executor.time.perf_counter", side_effect=ticks), \
+                patch("olcommon.bcrypt_executor.bcrypt.hashpw"):
+            return calibrate_bcrypt_rounds(target_seconds, probes=len(probe_times), **kwargs)
+
+    def test_extrapolates_from_fastest_probe(self):
+        # 3ms at cost 6 is 0.192s at cost 12, a slow probe is ignored
+        self.assertEqual(self.calibrate([0.003, 0.012, 0.004], 0.2), 12)
+        self.assertEqual(self.calibrate([0.003, 0.003, 0.003], 0.19), 11)
+
+    def test_clamped(self):
+        self.assertEqual(self.calibrate([0.003], 0.001), 10)
+        self.assertEqual(self.calibrate([0.003], 0.001, min_rounds=4), 6)
+        self.assertEqual(self.calibrate([0.003], 1000), 16)
+
+
+class TestBcryptHashRounds(unittest.TestCase):
+    def test_rounds(self):
+        self.assertEqual(bcrypt_hash_rounds(b"$2b$12$abcdefghijklmnopqrstuv"), 12)
+        self.assertIsNone(bcrypt_hash_rounds(b"not a hash"))
+
+
+class TestBcryptExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = BcryptExecutor(max_workers=1, max_queue=2, rounds=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_hash_and_check(self):
+        password_hash = self.executor.call(bcrypt.hashpw, b"secret", self.executor.gensalt())
+        self.assertEqual(bcrypt_hash_rounds(password_hash), 4)
+        self.assertTrue(self.executor.call(bcrypt.checkpw, b"secret", password_hash))
+        self.assertFalse(self.executor.call(bcrypt.checkpw, b"wrong", password_hash))
+        self.assertEqual(self.executor.stats()["completed"], 3)
+        self.assertEqual(self.executor.stats()["queue_depth"], 0)
+
+    def test_rejects_over_queue_limit(self):
+        release = threading.Event()
+        futures = [self.executor.submit(release.wait) for i in range(2)]
+        with self.assertRaises(BcryptExecutorBusyError):
+            self.executor.submit(release.wait)
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+        release.set()
+        for future in futures:
+            future.result()
+        self.executor.call(len, "")  # Room again once the queue drains
+        self.assertEqual(self.executor.stats()["queue_depth"], 0)
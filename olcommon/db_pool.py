@@ -0,0 +1,160 @@
+from .utils import yesish
+from sqlalchemy.pool import QueuePool
+
+import os
+import sqlalchemy
+import sqlalchemy.exc
+import threading
+import time
+import weakref
+
+
+class PoolMetrics:
+    """Counters for a pool, kept up to date by pool event listeners.
+
+    The same metrics carry over when the engine's pool is recreated, such
+    as by ``engine.dispose()``, so the counters cover the engine's life.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.checkout_seconds_max = 0.0
+        self.timeouts = 0
+        self.in_use = 0
+        self.in_use_max = 0
+        self.overflow_max = 0
+
+    def listen(self, pool, pool_size):
+        """Register the listeners on pool, counting any connections in use
+        beyond pool_size as overflow.
+        """
+        self.pool_size = pool_size
+        sqlalchemy.event.listen(pool, "connect", self.on_connect)
+        sqlalchemy.event.listen(pool, "checkout", self.on_checkout)
+        sqlalchemy.event.listen(pool, "checkin", self.on_checkin)
+
+    def unlisten(self, pool):
+        """Remove the listeners from pool"""
+        sqlalchemy.event.remove(pool, "connect", self.on_connect)
+        sqlalchemy.event.remove(pool, "checkout", self.on_checkout)
+        sqlalchemy.event.remove(pool, "checkin", self.on_checkin)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.in_use_max = max(self.in_use_max, self.in_use)
+            self.overflow_max = max(self.overflow_max, self.in_use - self.pool_size)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.checkout_seconds += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def stats(self):
+        """Returns: A dictionary of the counters"""
+        with self.lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkout_seconds": self.checkout_seconds,
+                "checkout_seconds_max": self.checkout_seconds_max,
+                "checkout_seconds_mean": (self.checkout_seconds / self.checkouts) if self.checkouts else 0.0,
+                "timeouts": self.timeouts,
+                "in_use_max": self.in_use_max,
+                "overflow_max": self.overflow_max,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool with PoolMetrics listening to its events.
+
+    Pool events fire once a connection is handed out, so the time a
+    checkout waits is measured around ``connect()``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_overflow = kwargs.get("max_overflow", 10)
+        self.metrics = PoolMetrics()
+        self.metrics.listen(self, self.size())
+
+    def recreate(self):
+        # The new pool is given this pool's listeners along with its
+        # dispatch, so it keeps these metrics rather than its own
+        pool = super().recreate()
+        pool.metrics.unlisten(pool)
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except sqlalchemy.exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def stats(self):
+        """Returns: A dictionary of the pool's current state and counters"""
+        stats = {
+            "pool_size": self.size(),
+            "max_overflow": self.max_overflow,
+            "in_use": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+        }
+        stats.update(self.metrics.stats())
+        return stats
+
+
+def create_db_engine(url, settings, prefix="db_"):
+    """Create an engine with an InstrumentedQueuePool configured from settings.
+
+    Reads ``{prefix}pool_size``, ``{prefix}max_overflow``,
+    ``{prefix}pool_timeout``, ``{prefix}pool_recycle`` and
+    ``{prefix}pool_pre_ping``. Unset values use SQLAlchemy's defaults.
+    """
+    kwargs = {}
+    for name in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle"):
+        value = settings.get(f"{prefix}{name}")
+        if value not in (None, ""):
+            kwargs[name] = int(value)
+    pre_ping = yesish(settings.get(f"{prefix}pool_pre_ping"))
+    if pre_ping is not None:
+        kwargs["pool_pre_ping"] = pre_ping
+    return sqlalchemy.create_engine(url, poolclass=InstrumentedQueuePool, **kwargs)
+
+
+def dispose_after_fork(engine):
+    """Replace the engine's pool in a forked child.
+
+    The child must not use connections inherited from the parent, as both
+    would talk over the same socket. ``dispose(close=False)`` drops them
+    without closing the parent's connections.
+    """
+    engine_ref = weakref.ref(engine)
+
+    def after_in_child():
+        engine = engine_ref()
+        if engine is not None:
+            engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=after_in_child)
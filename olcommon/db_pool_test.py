@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+
+from .db_pool import InstrumentedQueuePool
+from .db_pool import create_db_engine
+from .db_pool import dispose_after_fork
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import gc
+import os
+import sqlalchemy
+import sqlalchemy.exc
+import tempfile
+import unittest
+import weakref
+
+
+class TestInstrumentedQueuePool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        url = "sqlite:///" + os.path.join(self.tempdir.name, "test.db")
+        settings = {"db_pool_size": "2", "db_max_overflow": "1", "db_pool_timeout": "0"}
+        self.engine = create_db_engine(url, settings)
+        self.addCleanup(self.engine.dispose)
+
+    def test_pool_configured(self):
+        pool = self.engine.pool
+        self.assertIsInstance(pool, InstrumentedQueuePool)
+        self.assertEqual(pool.stats()["pool_size"], 2)
+        self.assertEqual(pool.stats()["max_overflow"], 1)
+
+    def test_checkout_stats(self):
+        first = self.engine.connect()
+        second = self.engine.connect()
+        third = self.engine.connect()
+        stats = self.engine.pool.stats()
+        self.assertEqual(stats["in_use"], 3)
+        self.assertEqual(stats["overflow"], 1)
+        self.assertEqual(stats["overflow_max"], 1)
+        self.assertEqual(stats["in_use_max"], 3)
+        self.assertEqual(stats["connects"], 3)
+        with self.assertRaises(sqlalchemy.exc.TimeoutError):
+            self.engine.connect()
+        for connection in (first, second, third):
+            connection.close()
+        with self.engine.connect():
+            pass
+        stats = self.engine.pool.stats()
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["checkouts"], 4)
+        self.assertEqual(stats["connects"], 3)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["checkout_seconds_max"], stats["checkout_seconds_mean"])
+
+    def test_metrics_kept_on_dispose(self):
+        with self.engine.connect():
+            pass
+        metrics = self.engine.pool.metrics
+        self.engine.dispose()
+        self.assertIs(self.engine.pool.metrics, metrics)
+        with self.engine.connect():
+            pass
+        # Counted once, by the carried over listeners
+        self.assertEqual(self.engine.pool.stats()["checkouts"], 2)
+        self.assertEqual(self.engine.pool.stats()["connects"], 2)
+
+
+class TestDisposeAfterFork(unittest.TestCase):
+    def test_child_disposes_without_closing(self):
+        engine = MagicMock()
+        with patch("olcommon.db_pool.os.register_at_fork") as register_at_fork:
+            dispose_after_fork(engine)
+        engine.dispose.assert_not_called()
+        after_in_child = register_at_fork.call_args.kwargs["after_in_child"]
+        self.assertEqual(set(register_at_fork.call_args.kwargs), {"after_in_child"})
+        after_in_child()
+        engine.dispose.assert_called_once_with(close=False)
+
+    def test_engine_not_kept_alive(self):
+        engine = MagicMock()
+        with patch("olcommon.db_pool.os.register_at_fork") as register_at_fork:
+            dispose_after_fork(engine)
+        after_in_child = register_at_fork.call_args.kwargs["after_in_child"]
+        engine_ref = weakref.ref(engine)
+        del engine
+        gc.collect()
+        self.assertIsNone(engine_ref())
+        after_in_child()
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork")
+    def test_fork(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            engine = create_db_engine("sqlite:///" + os.path.join(tempdir, "test.db"), {})
+            dispose_after_fork(engine)
+            connection = engine.connect()
+            parent_pool = engine.pool
+            (read_fd, write_fd) = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                # Child: a new pool with nothing checked out
+                ok = engine.pool is not parent_pool and engine.pool.checkedout() == 0
+                os.write(write_fd, b"1" if ok else b"0")
+                os._exit(0)
+            os.close(write_fd)
+            os.waitpid(pid, 0)
+            with os.fdopen(read_fd, "rb") as fin:
+                self.assertEqual(fin.read(), b"1")
+            # The parent's pool and connection are untouched
+            self.assertIs(engine.pool, parent_pool)
+            self.assertEqual(parent_pool.checkedout(), 1)
+            self.assertEqual(connection.execute(sqlalchemy.text("SELECT 1")).scalar(), 1)
+            connection.close()
+            engine.dispose()
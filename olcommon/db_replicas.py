@@ -0,0 +1,203 @@
+from sqlalchemy import event
+from sqlalchemy import text
+
+import logging
+import sqlalchemy.orm
+import threading
+import time
+
+
+logger = logging.getLogger("app")
+
+
+# Seconds the replica is behind the primary. A replica which has replayed
+# everything it received is not behind, even if the primary has been idle.
+REPLICA_LAG_SQL = text("""
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+
+class Replica:
+    """A replica engine and its health.
+
+    The name, used in logs, is the url without its password. Stats use the
+    alias, ``replica`` and the index in ``postgresql_replica_urls``, so they
+    don't reveal hosts.
+    """
+
+    def __init__(self, engine, alias):
+        self.engine = engine
+        self.alias = alias
+        self.name = engine.url.render_as_string(hide_password=True)
+        self.failed_until = 0.0
+        self.lag_seconds = None
+        self.lag_checked_at = 0.0
+        self.selections = 0
+        self.failures = 0
+        # Reentrant as a failed lag check also fires the handle_error event
+        self.lock = threading.RLock()
+
+    def as_dict(self, now):
+        return {
+            "healthy": self.failed_until <= now,
+            "lag_seconds": self.lag_seconds,
+            "lag_checked_seconds_ago": (now - self.lag_checked_at) if self.lag_checked_at else None,
+            "selections": self.selections,
+            "failures": self.failures,
+        }
+
+
+class ReplicaSet:
+    """Read replicas chosen round robin, skipping unhealthy ones.
+
+    A replica is skipped for ``retry_seconds`` after a connection error and
+    while it is more than ``max_lag`` seconds behind the primary. Lag is
+    measured on selection at most every ``lag_check_interval`` seconds.
+    ``choose()`` returns None when no replica can be used, so the caller
+    falls back to the primary.
+    """
+
+    def __init__(self, engines, max_lag=30, lag_check_interval=10, retry_seconds=30):
+        self.replicas = tuple(Replica(e, f"replica{i}") for (i, e) in enumerate(engines))
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_seconds = retry_seconds
+        self.next_index = 0
+        self.primary_fallbacks = 0
+        self.lock = threading.Lock()
+        for replica in self.replicas:
+            event.listen(replica.engine, "handle_error", self.error_handler(replica))
+
+    def error_handler(self, replica):
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_failed(replica)
+        return handle_error
+
+    def choose(self):
+        """Returns: The engine of the next usable replica or None"""
+        with self.lock:
+            start = self.next_index
+            self.next_index = (start + 1) % len(self.replicas) if self.replicas else 0
+        now = time.monotonic()
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.failed_until > now:
+                continue
+            if now - replica.lag_checked_at >= self.lag_check_interval:
+                self.check_lag(replica, now)
+            if replica.failed_until > now:
+                continue
+            if replica.lag_seconds is not None and replica.lag_seconds > self.max_lag:
+                continue
+            with replica.lock:
+                replica.selections += 1
+            return replica.engine
+        with self.lock:
+            self.primary_fallbacks += 1
+        return None
+
+    def check_lag(self, replica, now):
+        # Only one thread measures, others use the last value
+        if not replica.lock.acquire(blocking=False):
+            return
+        try:
+            replica.lag_checked_at = now
+            lag = self.measure_lag(replica)
+        except Exception:
+            logger.exception(f"Failed to check lag of replica {replica.name}")
+            lag = None
+        finally:
+            replica.lock.release()
+        if lag is None:
+            if replica.failed_until <= now:
+                self.mark_failed(replica)
+            return
+        was_lagging = replica.lag_seconds is not None and replica.lag_seconds > self.max_lag
+        replica.lag_seconds = lag
+        if lag > self.max_lag and not was_lagging:
+            logger.warning(f"Replica {replica.name} is {lag:.1f}s behind, not using it")
+
+    def measure_lag(self, replica):
+        with replica.engine.connect() as connection:
+            return float(connection.execute(REPLICA_LAG_SQL).scalar())
+
+    def mark_failed(self, replica):
+        with replica.lock:
+            replica.failures += 1
+            replica.failed_until = time.monotonic() + self.retry_seconds
+        logger.warning(f"Replica {replica.name} failed, not using it for {self.retry_seconds}s")
+
+    def stats(self):
+        """Returns: The health, lag and selection counts of each replica"""
+        now = time.monotonic()
+        return {
+            "max_lag": self.max_lag,
+            "primary_fallbacks": self.primary_fallbacks,
+            "replicas": {r.alias: r.as_dict(now) for r in self.replicas},
+        }
+
+
+def replica_safe(clause):
+    """Returns: If clause may run on a replica, that is a plain SELECT
+    without FOR UPDATE. Text clauses are not inspected so go to the primary.
+    """
+    return (
+        getattr(clause, "is_select", False)
+        and getattr(clause, "_for_update_arg", None) is None
+    )
+
+
+class RoutingSession(sqlalchemy.orm.Session):
+    """A session which sends reads to a replica when it is read only.
+
+    ``session.info["read_only"]`` is a bool, or a callable returning one,
+    which is resolved at the first statement. From then on the session
+    keeps to the same replica so reads are consistent. Anything other
+    than a plain SELECT goes to the primary, and after a write, flush or
+    lock the session is pinned to the primary for the rest of the
+    transaction so it reads its own writes.
+    """
+
+    def __init__(self, *args, replicas=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.replica_bind = None
+        event.listen(self, "before_flush", self.on_before_flush)
+        event.listen(self, "after_transaction_end", self.on_after_transaction_end)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replicas is not None:
+            if not replica_safe(clause):
+                self.pin_to_primary()
+            if self.replica_bind is None:
+                self.replica_bind = self.choose_replica_bind()
+            if self.replica_bind is not False:
+                return self.replica_bind
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    def pin_to_primary(self):
+        """Send all statements to the primary until the transaction ends"""
+        self.replica_bind = False
+
+    def on_before_flush(self, session, flush_context, instances):
+        self.pin_to_primary()
+
+    def on_after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            self.replica_bind = None
+
+    def close(self):
+        super().close()
+        self.replica_bind = None
+
+    def choose_replica_bind(self):
+        read_only = self.info.get("read_only", False)
+        if callable(read_only):
+            read_only = read_only()
+        if not read_only:
+            return False
+        return self.replicas.choose() or False
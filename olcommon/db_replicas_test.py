@@ -0,0 +1,121 @@
+# -*- coding:utf-8 -*-
+
+from .db_replicas import ReplicaSet
+from .db_replicas import RoutingSession
+from unittest.mock import patch
+
+import sqlalchemy
+import sqlalchemy.orm
+import unittest
+
+
+def sqlite_engine():
+    return sqlalchemy.create_engine("sqlite://", poolclass=sqlalchemy.pool.StaticPool)
+
+
+class TestReplicaSet(unittest.TestCase):
+    def setUp(self):
+        self.engines = [sqlite_engine(), sqlite_engine()]
+        self.replicas = ReplicaSet(self.engines, max_lag=30)
+        self.lag = {id(e): 0.0 for e in self.engines}
+        patcher = patch.object(ReplicaSet, "measure_lag", lambda s, r: self.lag[id(r.engine)])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_robin(self):
+        chosen = [self.replicas.choose() for _ in range(4)]
+        self.assertEqual(chosen, self.engines + self.engines)
+
+    def test_skips_failed(self):
+        self.replicas.mark_failed(self.replicas.replicas[0])
+        self.assertEqual([self.replicas.choose() for _ in range(2)], [self.engines[1]] * 2)
+        self.assertFalse(self.replicas.stats()["replicas"]["replica0"]["healthy"])
+
+    def test_skips_lagging(self):
+        self.lag[id(self.engines[1])] = 60.0
+        self.assertEqual([self.replicas.choose() for _ in range(2)], [self.engines[0]] * 2)
+        stats = self.replicas.stats()["replicas"]
+        self.assertEqual(stats["replica1"]["lag_seconds"], 60.0)
+
+    def test_falls_back_to_primary(self):
+        for replica in self.replicas.replicas:
+            self.replicas.mark_failed(replica)
+        self.assertIsNone(self.replicas.choose())
+        self.assertEqual(self.replicas.stats()["primary_fallbacks"], 1)
+
+    def test_failed_lag_check(self):
+        with patch.object(ReplicaSet, "measure_lag", side_effect=[Exception("down"), 0.0]):
+            self.assertIs(self.replicas.choose(), self.engines[1])
+        self.assertEqual(self.replicas.replicas[0].failures, 1)
+
+
+class TestRoutingSession(unittest.TestCase):
+    def setUp(self):
+        self.primary = sqlite_engine()
+        self.replica = sqlite_engine()
+        self.replicas = ReplicaSet([self.replica])
+        patcher = patch.object(ReplicaSet, "measure_lag", return_value=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.table = sqlalchemy.table("t", sqlalchemy.column("x"))
+
+    def session(self, read_only):
+        session = RoutingSession(bind=self.primary, replicas=self.replicas)
+        session.info["read_only"] = read_only
+        return session
+
+    def test_reads_go_to_replica_when_read_only(self):
+        session = self.session(lambda: True)
+        self.assertIs(session.get_bind(clause=sqlalchemy.select(self.table)), self.replica)
+        self.assertIs(session.get_bind(clause=self.table.insert()), self.primary)
+
+    def test_reads_go_to_primary_otherwise(self):
+        session = self.session(False)
+        self.assertIs(session.get_bind(clause=sqlalchemy.select(self.table)), self.primary)
+
+    def test_decided_once(self):
+        calls = []
+        session = self.session(lambda: calls.append(1) or True)
+        session.get_bind(clause=sqlalchemy.select(self.table))
+        session.get_bind(clause=sqlalchemy.select(self.table))
+        self.assertEqual(len(calls), 1)
+        session.close()
+        session.get_bind(clause=sqlalchemy.select(self.table))
+        self.assertEqual(len(calls), 2)
+
+    def test_locking_and_text_go_to_primary(self):
+        session = self.session(True)
+        select = sqlalchemy.select(self.table)
+        self.assertIs(session.get_bind(clause=select.with_for_update()), self.primary)
+        session.close()
+        self.assertIs(session.get_bind(clause=sqlalchemy.text("UPDATE t SET x = 1")), self.primary)
+
+    def test_pinned_to_primary_after_write(self):
+        session = self.session(True)
+        select = sqlalchemy.select(self.table)
+        self.assertIs(session.get_bind(clause=select), self.replica)
+        self.assertIs(session.get_bind(clause=self.table.update()), self.primary)
+        self.assertIs(session.get_bind(clause=select), self.primary)
+        session.close()
+        self.assertIs(session.get_bind(clause=select), self.replica)
+
+    def test_pinned_to_primary_after_flush(self):
+        Base = sqlalchemy.orm.declarative_base()
+
+        class Thing(Base):
+            __tablename__ = "thing"
+            id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+        primary = sqlite_engine()
+        Base.metadata.create_all(primary)
+        session = RoutingSession(bind=primary, replicas=self.replicas)
+        session.info["read_only"] = True
+        select = sqlalchemy.select(Thing)
+        self.assertIs(session.get_bind(clause=select), self.replica)
+        session.add(Thing(id=1))
+        session.flush()
+        self.assertIs(session.get_bind(clause=select), primary)
+        session.commit()
+        # A new transaction may use the replica again
+        self.assertIs(session.get_bind(clause=select), self.replica)
+        session.close()
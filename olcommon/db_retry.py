@@ -0,0 +1,68 @@
+"""Retry of transactions which fail with a serialization or deadlock error
+
+Postgres aborts one side of a conflicting pair of transactions with
+SQLSTATE 40001 (serialization_failure) or 40P01 (deadlock_detected). The
+work can succeed if it is simply run again, after a short random wait so
+the conflicting transactions don't collide again.
+"""
+
+from collections import Counter
+
+import random
+import threading
+
+
+RETRYABLE_PGCODES = frozenset(("40001", "40P01"))
+
+
+def is_retryable_error(error, tx=None):
+    """Returns: True if error is worth retrying in a new transaction
+
+    Args:
+        error (Exception): The error
+        tx (transaction.Transaction): The failed transaction, if it has not
+            been aborted yet, so its data managers can be asked too
+    """
+    if tx is not None:
+        try:
+            if tx.isRetryableError(error):
+                return True
+        except Exception:
+            pass
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        pgcode = getattr(getattr(error, "orig", None), "pgcode", None) or getattr(error, "pgcode", None)
+        if pgcode in RETRYABLE_PGCODES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def retry_backoff(attempt, base=0.05, cap=2.0):
+    """Returns: Seconds to wait before retry number attempt (from 0), with
+    full jitter over an exponentially growing window
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryStats:
+    """Counters of retries by source, such as "request" or "root_context"
+
+    For each source: ``retries`` is the number of retries made,
+    ``recovered`` the units of work which succeeded after a retry and
+    ``exhausted`` those which failed on their last attempt.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def count(self, source, name):
+        with self.lock:
+            self.counters.setdefault(source, Counter())[name] += 1
+
+    def stats(self):
+        """Returns: A copy of the counters by source"""
+        with self.lock:
+            return {source: dict(counter) for source, counter in self.counters.items()}
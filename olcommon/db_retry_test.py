@@ -0,0 +1,53 @@
+# -*- coding:utf-8 -*-
+
+from .db_retry import RetryStats
+from .db_retry import is_retryable_error
+from .db_retry import retry_backoff
+from unittest.mock import MagicMock
+
+import unittest
+
+
+class DBAPIError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.orig = MagicMock(pgcode=pgcode)
+
+
+class TestIsRetryableError(unittest.TestCase):
+    def test_pgcodes(self):
+        self.assertTrue(is_retryable_error(DBAPIError("40001")))
+        self.assertTrue(is_retryable_error(DBAPIError("40P01")))
+        self.assertFalse(is_retryable_error(DBAPIError("23505")))
+        self.assertFalse(is_retryable_error(ValueError()))
+
+    def test_cause(self):
+        try:
+            try:
+                raise DBAPIError("40001")
+            except DBAPIError as e:
+                raise ValueError() from e
+        except ValueError as e:
+            self.assertTrue(is_retryable_error(e))
+
+    def test_transaction_asked(self):
+        tx = MagicMock()
+        tx.isRetryableError.return_value = True
+        self.assertTrue(is_retryable_error(ValueError(), tx))
+
+
+class TestRetryBackoff(unittest.TestCase):
+    def test_bounds(self):
+        for attempt in range(10):
+            delay = retry_backoff(attempt, base=0.1, cap=1.0)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(1.0, 0.1 * 2 ** attempt))
+
+
+class TestRetryStats(unittest.TestCase):
+    def test_count(self):
+        stats = RetryStats()
+        stats.count("request", "retries")
+        stats.count("request", "retries")
+        stats.count("job", "exhausted")
+        self.assertEqual(stats.stats(), {"request": {"retries": 2}, "job": {"exhausted": 1}})
@@ -1,3 +1,12 @@
 
 class UserPasswordBaseInvalidTokenError(Exception):
     """The provided token was invalid."""
+
+
+class JWTNotConfiguredError(Exception):
+    """Raised when JWT is used without being configured, such as signing
+    without a private key"""
+
+
+class BcryptExecutorBusyError(Exception):
+    """Too many password hashes are already running or waiting."""
@@ -1,5 +1,6 @@
 # -*- coding:utf-8 -*-
 
+from ...exc import JWTNotConfiguredError  # noqa
 from ..login import ILoginProvider
 from datetime import timedelta
 from zope.interface import implementer
@@ -13,10 +14,6 @@ import logging
 logger = logging.getLogger("apweb")
 
 
-class JWTNotConfiguredError(Exception):
-    """Raised when an atempt to use JWT with it being configured"""
-
-
 def get_jwt_claims(request):
     """Return the JSON web token claim from the request object.
 
@@ -107,6 +104,9 @@ def configure_jwt(config):
 class RefreshTokenLoginProvider(object):
     """Provide to the login view ability to use a refresh token"""
 
+    def precondition(self, request):
+        return request.authorization is not None or "_jwt" in request.params
+
     def userid_for_login_request(self, request):
         claims = request.jwt_claims
         if claims is None:
@@ -1,5 +1,14 @@
+from ..db_retry import retry_backoff
+from ..exc import JWTNotConfiguredError
 from ..logging import ActorLoggerAdapter
+from ..utils import yesish
+from .jwt_cache import JWTClaimsCache
+from .jwt_keys import jwt_keyring_from_settings
+from .rate_limit import LoginRateLimiter
+from .read_only import mark_read_only
+from .security import PrincipalsCache
 from .security import SecurityPolicy
+from .security import get_permits_memo
 from chameleon import PageTemplateLoader
 from datetime import date
 from datetime import datetime
@@ -16,8 +25,11 @@ from pyramid.view import render_view_to_response
 import jwt
 import os
 import os.path
+import time
+import pyramid.events
 import pyramid.renderers
 import pyramid_mailer
+import pyramid_retry
 import pyramid_session_redis
 import zope.sqlalchemy
 import logging
@@ -39,8 +51,19 @@ def includeme(config):
 
 def configure_plugins(config):
     registry = config.registry
+    settings = config.get_settings()
     config.add_settings({"tm.manager_hook": "pyramid_tm.explicit_manager"})
+    if not settings.get("tm.commit_veto"):
+        config.add_settings({"tm.commit_veto": "olcommon.http.read_only.read_only_commit_veto"})
     config.include("pyramid_tm")
+
+    # Retry requests which fail with a serialization or deadlock error.
+    # pyramid_tm marks those errors retryable, pyramid_retry runs the request
+    # again in a new transaction.
+    config.add_settings({"retry.attempts": settings.get("retry.attempts") or settings.get("db_retry_attempts", 3)})
+    config.include("pyramid_retry")
+    config.add_subscriber(before_retry, pyramid_retry.IBeforeRetry)
+    config.add_subscriber(count_recovered_retry, pyramid.events.NewResponse)
     if registry["is_debug"]:
         config.include("pyramid_debugtoolbar")
         config.add_settings({"pyramid.reload_templates": "true"})
@@ -52,18 +75,37 @@ def configure_registry(config):
     registry = config.registry
     registry["docs_dist"] = settings["docs_dist"]
 
-    # Get and check jwt keys
-    registry["jwt_private_key"] = settings["jwt_private_key"]
-    assert registry["jwt_private_key"].strip()
-    registry["jwt_public_key"] = settings["jwt_public_key"]
-    assert registry["jwt_public_key"].strip()
-
     # jwt options
     registry["jwt_algorithm"] = settings["jwt_algorithm"]
     registry["jwt_leeway"] = timedelta(seconds=int(settings["jwt_leeway"]))
     registry["jwt_access_ttl"] = timedelta(seconds=int(settings["jwt_access_ttl"]))
     registry["jwt_refresh_ttl"] = timedelta(seconds=int(settings["jwt_refresh_ttl"]))
-    
+
+    # Get and check jwt keys. Keys are parsed once here rather than on each
+    # call to jwt.encode/jwt.decode, and are only used from the keyring.
+    # jwt_private_key and jwt_public_key stay the PEM strings from settings.
+    registry["jwt_keyring"] = jwt_keyring_from_settings(settings)
+    registry["jwt_private_key"] = settings.get("jwt_private_key")
+    registry["jwt_public_key"] = settings.get("jwt_public_key")
+
+    # Cache of verified jwt claims. Set jwt_claims_cache_size to 0 to disable
+    registry["jwt_claims_cache"] = JWTClaimsCache(
+        maxsize=int(settings.get("jwt_claims_cache_size", 1000)),
+    )
+
+    # Cache of principals by the site's principals_cache_key. Set
+    # principals_cache_ttl to 0 to disable
+    registry["principals_cache"] = PrincipalsCache(
+        maxsize=int(settings.get("principals_cache_size", 1000)),
+        ttl=int(settings.get("principals_cache_ttl", 60)),
+    )
+
+    # Limit login attempts by client address and submitted identity
+    registry["login_rate_limiter"] = LoginRateLimiter(
+        settings,
+        prefix=f'{registry["application_id"]}:login-rate',
+    )
+
     # Build template loader
     templates_extra_builtins = {
         "registry": registry,
@@ -100,16 +142,22 @@ def configure_rendering(config):
 
 def configure_request(config):
     registry = config.registry
+    settings = config.get_settings()
     config.add_request_method(get_logger, "get_logger")
     config.add_request_method(site_factory, "site", reify=True)
     config.set_root_factory(root_factory)
+    config.include(".login")
+    config.include(".read_only")
     config.add_request_method(get_user, "user", reify=True)
     config.add_request_method(get_principals, "principals", reify=True)
     config.add_request_method(db_session_from_request, "db_session", reify=True)
     config.add_request_method(redis_from_request, "redis", reify=True)
     config.add_request_method(get_jwt_claims, "jwt_claims", reify=True)
     config.add_request_method(generate_jwt, "generate_jwt")
-    config.set_security_policy(SecurityPolicy())
+    config.add_request_method(get_permits_memo, "permits_memo", reify=True)
+    config.set_security_policy(SecurityPolicy(
+        compile_static_acls=yesish(settings.get("acl_compile_static"), False),
+    ))
     config.add_request_method(mailer_from_reequest, "mailer", reify=True)
     config.add_tween(
         "olcommon.http.logging.logger_handler_tween_factory",
@@ -170,17 +218,48 @@ def get_user(request):
 
 
 def get_principals(request):
-    return request.site.get_principals(request.identity, request.user)
+    """Returns: A frozenset of principals for the request's identity.
 
+    Principals are cached in registry["principals_cache"] under the key
+    given by the site's principals_cache_key, when it gives one.
+    """
+    identity = request.identity
+    user = request.user
+    site = request.site
+    factory = lambda: site.get_principals(identity, user)
+    key = site.principals_cache_key(identity, user)
+    if key is None:
+        return frozenset(factory())
+    return request.registry["principals_cache"].get(key, factory)
 
 
 def db_session_from_request(request):
     """Create a dbsession for a given request"""
     db_session_factory = request.registry["db_session_factory"]
     db_session = db_session_factory()
+    mark_read_only(request, db_session)
     zope.sqlalchemy.register(db_session, transaction_manager=request.tm)
     return db_session
 
+
+def before_retry(event):
+    """Wait a jittered backoff before pyramid_retry tries a request again"""
+    request = event.request
+    attempt = request.environ.get("retry.attempt", 0)
+    request.registry["db_retry_stats"].count("request", "retries")
+    request.get_logger().warning(
+        f"Retrying request after {event.exception.__class__.__name__} "
+        f"(attempt {attempt + 1} of {request.environ.get('retry.attempts')})"
+    )
+    time.sleep(retry_backoff(attempt))
+
+
+def count_recovered_retry(event):
+    request = event.request
+    if request.environ.get("retry.attempt") and getattr(request, "exception", None) is None:
+        request.registry["db_retry_stats"].count("request", "recovered")
+
+
 def mailer_from_reequest(request):
     if request.registry["use_debug_mailer"]:
         return pyramid_mailer.mailer.DebugMailer('mail')  # Store mail in 'mail' dir in CWD
@@ -195,11 +274,14 @@ def redis_from_request(request):
 def get_jwt_claims(request):
     """Return the JSON web token claim from the request object.
 
-    Only supports public/private key pair forms of JWT and must have
-    request.registry.jwt_public_key and request.registry_jwt_algorithm defined.
+    Only supports public/private key pair forms of JWT. The token is verified
+    with the key in request.registry["jwt_keyring"] named by its kid header.
 
     A registry.jwt_leeway (timedelta) can be defined. By default it is 10 seconds
 
+    Verified claims are cached in registry["jwt_claims_cache"] until the
+    token expires so a repeated token is only decoded once.
+
     Args:
         request: A pyramid request object
 
@@ -208,10 +290,8 @@ def get_jwt_claims(request):
         None: Indicats that there was not valid JWT token given
     """
 
-    # Check that we have a public key
     registry = request.registry
-    public_key = registry["jwt_public_key"]
-    algorithm = registry["jwt_algorithm"]
+    keyring = registry["jwt_keyring"]
     leeway = registry["jwt_leeway"]
 
     # Extract raw token
@@ -227,11 +307,19 @@ def get_jwt_claims(request):
     if token is None:
         return None
 
+    cache = registry["jwt_claims_cache"]
+    claims = cache.get(token)
+    if claims is not None:
+        return claims
+
     try:
+        key = keyring.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise InvalidTokenError("Unknown kid")
         claims = jwt.decode(
             token,
-            key=public_key,
-            algorithms=[algorithm],
+            key=key.public_key,
+            algorithms=[key.algorithm],
             leeway=leeway,
             options={"verify_aud": False},
         )  # we verify the aud claim in the security policy
@@ -239,6 +327,8 @@ def get_jwt_claims(request):
         claims = None
     except InvalidTokenError as e:
         claims = None
+    else:
+        cache.set(token, claims, leeway)
 
     return claims
 
@@ -246,17 +336,21 @@ def get_jwt_claims(request):
 def generate_jwt(request, **claims):
     """Generate a JSON Web Token (JWT) with the given claims.
 
-    THe token generated contains the claims signed with request.registry.private_key
-    using the algorithm request.registry.algorithm
+    THe token generated contains the claims signed with the active key of
+    request.registry["jwt_keyring"] and carries its kid in the header.
 
     Returns:
         str: The encoded and signed json web token
     """
-    private_key = request.registry["jwt_private_key"]
-    algorithm = request.registry["jwt_algorithm"]
-    if private_key is None or algorithm is None:
+    key = request.registry["jwt_keyring"].active
+    if key.private_key is None:
         raise JWTNotConfiguredError()
-    token = jwt.encode(claims, key=private_key, algorithm=algorithm)
+    token = jwt.encode(
+        claims,
+        key=key.private_key,
+        algorithm=key.algorithm,
+        headers={"kid": key.kid},
+    )
     # Newer versions of jwt module return strings instead of bytes
     return token.decode() if isinstance(token, bytes) else token
 
@@ -0,0 +1,75 @@
+# -*- coding:utf-8 -*-
+
+from ..resource.site_base import SiteBase
+from .configure import get_principals
+from .security import PrincipalsCache
+from unittest.mock import MagicMock
+
+import unittest
+
+
+class Site(SiteBase):
+    def __init__(self):
+        self.calls = []
+
+    def get_principals(self, identity, user):
+        self.calls.append(identity)
+        return [f"user:{identity['sub']}", *(f"scope:{s}" for s in identity.get("scope", "").split())]
+
+
+def make_request(site, identity, nounce="n1"):
+    request = MagicMock()
+    request.site = site
+    request.identity = identity
+    request.user = MagicMock(nounce=nounce) if nounce else object()
+    request.registry = {"principals_cache": PrincipalsCache()}
+    return request
+
+
+class TestGetPrincipals(unittest.TestCase):
+    def test_cached_per_claims(self):
+        site = Site()
+        cache = PrincipalsCache()
+        identities = [
+            {"sub": "a", "scope": "read", "exp": 1},
+            {"sub": "a", "scope": "read", "exp": 2},  # A new token of the same grant
+            {"sub": "a", "scope": "read write", "exp": 3},
+        ]
+        results = []
+        for identity in identities:
+            request = make_request(site, identity)
+            request.registry["principals_cache"] = cache
+            results.append(get_principals(request))
+        self.assertEqual(results[0], frozenset(["user:a", "scope:read"]))
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], frozenset(["user:a", "scope:read", "scope:write"]))
+        self.assertEqual(len(site.calls), 2)
+
+    def test_nounce_change_invalidates(self):
+        site = Site()
+        cache = PrincipalsCache()
+        for nounce in ("n1", "n1", "n2"):
+            request = make_request(site, {"sub": "a"}, nounce)
+            request.registry["principals_cache"] = cache
+            get_principals(request)
+        self.assertEqual(len(site.calls), 2)
+
+    def test_not_cached_without_nounce(self):
+        site = Site()
+        request = make_request(site, {"sub": "a"}, nounce=None)
+        get_principals(request)
+        get_principals(request)
+        self.assertEqual(len(site.calls), 2)
+
+
+class ExtendingSite(Site):
+    def get_principals(self, identity, user):
+        principals = SiteBase.get_principals(self, identity, user)
+        principals.append(f"user:{identity['sub']}")
+        return principals
+
+
+class TestBasePrincipals(unittest.TestCase):
+    def test_base_list_extended_then_frozen(self):
+        request = make_request(ExtendingSite(), {"sub": "a"}, nounce=None)
+        self.assertEqual(get_principals(request), frozenset(["system.Everyone", "user:a"]))
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from hashlib import sha256
+
+import threading
+import time
+
+
+class JWTClaimsCache:
+    """A bounded LRU cache of verified JWT claims.
+
+    Entries are keyed by a digest of the raw token so the token itself is not
+    held in memory. Each entry is dropped once its ``exp`` claim plus the
+    leeway has passed, which is the point at which ``jwt.decode`` would
+    reject the token anyway. Tokens without an ``exp`` claim are only evicted
+    by the LRU.
+
+    Attributes:
+        maxsize (int): The maximum number of tokens to hold
+        hits (int): The number of lookups answered from the cache
+        misses (int): The number of lookups that needed a full decode
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        if isinstance(token, str):
+            token = token.encode("utf-8")
+        return sha256(token).digest()
+
+    def get(self, token, now=None):
+        """Return a copy of the cached claims for token or None"""
+        key = self.key(token)
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires_at = entry
+            if expires_at is not None and now >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return dict(claims)
+
+    def set(self, token, claims, leeway):
+        """Save verified claims for a token.
+
+        Args:
+            token (str): The raw token
+            claims (dict): The claims returned by ``jwt.decode``
+            leeway (timedelta): The leeway used to verify the token
+        """
+        if self.maxsize <= 0:
+            return
+        exp = claims.get("exp")
+        if exp is None:
+            expires_at = None
+        else:
+            expires_at = float(exp) + leeway.total_seconds()
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (dict(claims), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Returns: A dictionary of the cache counters"""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,45 @@
+# -*- coding:utf-8 -*-
+
+from .jwt_cache import JWTClaimsCache
+from datetime import timedelta
+
+import unittest
+
+
+class TestJWTClaimsCache(unittest.TestCase):
+    def test_miss_then_hit(self):
+        cache = JWTClaimsCache(maxsize=10)
+        self.assertIsNone(cache.get("token", now=100))
+        cache.set("token", {"sub": "foo", "exp": 200}, timedelta(seconds=10))
+        self.assertEqual(cache.get("token", now=100), {"sub": "foo", "exp": 200})
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_returns_copy(self):
+        cache = JWTClaimsCache(maxsize=10)
+        cache.set("token", {"sub": "foo"}, timedelta(seconds=10))
+        cache.get("token")["sub"] = "bar"
+        self.assertEqual(cache.get("token"), {"sub": "foo"})
+
+    def test_expiry_includes_leeway(self):
+        cache = JWTClaimsCache(maxsize=10)
+        cache.set("token", {"sub": "foo", "exp": 200}, timedelta(seconds=10))
+        self.assertIsNotNone(cache.get("token", now=209))
+        self.assertIsNone(cache.get("token", now=210))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = JWTClaimsCache(maxsize=2)
+        leeway = timedelta(seconds=10)
+        cache.set("one", {"sub": "1"}, leeway)
+        cache.set("two", {"sub": "2"}, leeway)
+        cache.get("one")
+        cache.set("three", {"sub": "3"}, leeway)
+        self.assertIsNotNone(cache.get("one"))
+        self.assertIsNone(cache.get("two"))
+        self.assertIsNotNone(cache.get("three"))
+
+    def test_disabled(self):
+        cache = JWTClaimsCache(maxsize=0)
+        cache.set("token", {"sub": "foo"}, timedelta(seconds=10))
+        self.assertIsNone(cache.get("token"))
@@ -0,0 +1,156 @@
+from collections import namedtuple
+from jwt.algorithms import get_default_algorithms
+
+
+# Public/private key pair algorithms that can be used as jwt_algorithm.
+# EdDSA and ES256 sign several times faster than the RSA family and have much
+# smaller keys and signatures, while RSA is the cheapest to verify. See
+# benchmarks/jwt_algorithms.py to compare them on the target hardware.
+SUPPORTED_JWT_ALGORITHMS = (
+    "EdDSA",
+    "ES256",
+    "ES384",
+    "ES512",
+    "RS256",
+    "RS384",
+    "RS512",
+    "PS256",
+    "PS384",
+    "PS512",
+)
+
+# The kid given to the key configured with jwt_public_key/jwt_private_key
+DEFAULT_JWT_KID = "default"
+
+
+JWTKey = namedtuple("JWTKey", ["kid", "algorithm", "public_key", "private_key"])
+
+
+def load_jwt_key(algorithm, pem):
+    """Parse a PEM encoded key into a key object for an algorithm.
+
+    PyJWT accepts the returned key object in ``jwt.encode`` and ``jwt.decode``
+    without parsing the PEM again on every call.
+
+    Args:
+        algorithm (str): One of SUPPORTED_JWT_ALGORITHMS
+        pem (str): The PEM encoded public or private key
+
+    Returns:
+        A cryptography key object
+
+    Raises:
+        ValueError: If the algorithm is not supported
+    """
+    if algorithm not in SUPPORTED_JWT_ALGORITHMS:
+        raise ValueError(f"Unsupported jwt_algorithm: {algorithm}")
+    return get_default_algorithms()[algorithm].prepare_key(pem.strip())
+
+
+class JWTKeyring:
+    """A set of JWT keys indexed by their ``kid`` header.
+
+    New tokens are signed with the active key. Tokens are verified with the
+    key named by their ``kid`` header, or the default key if they don't have
+    one (tokens issued before kid headers were used).
+
+    Rotating keys without invalidating every outstanding token at once:
+
+    1. Add the new key to ``jwt_keys`` and deploy, so every node can verify it.
+    2. Set ``jwt_active_kid`` to the new key and deploy.
+    3. Remove the old key once the tokens signed with it have expired.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.active_kid = None
+        self.default_kid = None
+        self._jwks = None
+
+    def add(self, kid, algorithm, public_pem, private_pem=None):
+        if kid in self.keys:
+            raise ValueError(f"Duplicate jwt kid: {kid}")
+        self.keys[kid] = JWTKey(
+            kid,
+            algorithm,
+            load_jwt_key(algorithm, public_pem),
+            load_jwt_key(algorithm, private_pem) if private_pem else None,
+        )
+        self._jwks = None
+
+    def get(self, kid):
+        """Returns: The JWTKey for a kid header value or None"""
+        if kid is None:
+            kid = self.default_kid
+        return self.keys.get(kid)
+
+    @property
+    def active(self):
+        """JWTKey: The key used to sign new tokens"""
+        return self.keys[self.active_kid]
+
+    def jwks(self):
+        """Returns: A JSON Web Key Set dictionary of the public keys"""
+        if self._jwks is None:
+            algorithms = get_default_algorithms()
+            self._jwks = {
+                "keys": [
+                    {
+                        **algorithms[key.algorithm].to_jwk(key.public_key, as_dict=True),
+                        "kid": key.kid,
+                        "alg": key.algorithm,
+                        "use": "sig",
+                    }
+                    for key in self.keys.values()
+                ]
+            }
+        return self._jwks
+
+
+def jwt_keyring_from_settings(settings):
+    """Build a JWTKeyring from application settings.
+
+    The settings ``jwt_public_key`` and ``jwt_private_key`` configure a single
+    key with the kid "default". Further keys are listed by kid in ``jwt_keys``
+    with ``jwt_key.{kid}.public_key``, ``jwt_key.{kid}.private_key`` (optional
+    for keys that only verify) and ``jwt_key.{kid}.algorithm`` (defaults to
+    ``jwt_algorithm``).
+
+    ``jwt_active_kid`` selects the signing key and ``jwt_default_kid`` the key
+    for tokens without a kid header. Both default to the "default" key if
+    configured, otherwise the first key in ``jwt_keys``.
+
+    Raises:
+        ValueError: If the keys are missing or misconfigured
+    """
+    algorithm = settings["jwt_algorithm"]
+    keyring = JWTKeyring()
+
+    if (settings.get("jwt_public_key") or "").strip():
+        keyring.add(
+            DEFAULT_JWT_KID,
+            algorithm,
+            settings["jwt_public_key"],
+            settings.get("jwt_private_key") or None,
+        )
+
+    for kid in (settings.get("jwt_keys") or "").split():
+        keyring.add(
+            kid,
+            settings.get(f"jwt_key.{kid}.algorithm") or algorithm,
+            settings[f"jwt_key.{kid}.public_key"],
+            settings.get(f"jwt_key.{kid}.private_key") or None,
+        )
+
+    if not keyring.keys:
+        raise ValueError("No jwt keys configured")
+    first_kid = next(iter(keyring.keys))
+    keyring.active_kid = settings.get("jwt_active_kid") or first_kid
+    keyring.default_kid = settings.get("jwt_default_kid") or first_kid
+    if keyring.active_kid not in keyring.keys:
+        raise ValueError(f"Unknown jwt_active_kid: {keyring.active_kid}")
+    if keyring.default_kid not in keyring.keys:
+        raise ValueError(f"Unknown jwt_default_kid: {keyring.default_kid}")
+    if keyring.active.private_key is None:
+        raise ValueError("The active jwt key has no private key")
+    return keyring
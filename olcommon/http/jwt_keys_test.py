@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+
+from . import jwt_keys
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+import jwt
+import unittest
+
+
+def generate_pem_pair():
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return private_pem, public_pem
+
+
+class TestJWTKeyring(unittest.TestCase):
+    def setUp(self):
+        self.old_private, self.old_public = generate_pem_pair()
+        self.new_private, self.new_public = generate_pem_pair()
+
+    def test_unsupported_algorithm(self):
+        with self.assertRaises(ValueError):
+            jwt_keys.load_jwt_key("HS256", "secret")
+
+    def test_legacy_settings(self):
+        keyring = jwt_keys.jwt_keyring_from_settings({
+            "jwt_algorithm": "EdDSA",
+            "jwt_private_key": self.old_private,
+            "jwt_public_key": self.old_public,
+        })
+        self.assertEqual(keyring.active_kid, "default")
+        self.assertEqual(keyring.get(None), keyring.active)
+
+    def test_rotation(self):
+        keyring = jwt_keys.jwt_keyring_from_settings({
+            "jwt_algorithm": "EdDSA",
+            "jwt_public_key": self.old_public,
+            "jwt_keys": "k2",
+            "jwt_key.k2.public_key": self.new_public,
+            "jwt_key.k2.private_key": self.new_private,
+            "jwt_active_kid": "k2",
+        })
+        self.assertEqual(keyring.active.kid, "k2")
+        self.assertEqual(keyring.get("default").private_key, None)
+
+        # Tokens signed with the old key without a kid still verify
+        old_key = jwt_keys.load_jwt_key("EdDSA", self.old_private)
+        token = jwt.encode({"sub": "foo"}, key=old_key, algorithm="EdDSA")
+        key = keyring.get(jwt.get_unverified_header(token).get("kid"))
+        self.assertEqual(jwt.decode(token, key=key.public_key, algorithms=[key.algorithm]), {"sub": "foo"})
+
+        jwks = keyring.jwks()
+        self.assertEqual([k["kid"] for k in jwks["keys"]], ["default", "k2"])
+        self.assertTrue(all("d" not in k for k in jwks["keys"]))
+
+    def test_active_needs_private_key(self):
+        with self.assertRaises(ValueError):
+            jwt_keys.jwt_keyring_from_settings({
+                "jwt_algorithm": "EdDSA",
+                "jwt_public_key": self.old_public,
+            })
+
+    def test_misconfiguration_raises(self):
+        with self.assertRaises(ValueError):
+            jwt_keys.load_jwt_key("HS256", self.old_public)
+        for settings in (
+            {"jwt_algorithm": "EdDSA"},
+            {"jwt_algorithm": "EdDSA", "jwt_public_key": self.old_public, "jwt_private_key": self.old_private, "jwt_active_kid": "nope"},
+            {"jwt_algorithm": "EdDSA", "jwt_public_key": self.old_public, "jwt_private_key": self.old_private, "jwt_default_kid": "nope"},
+        ):
+            with self.assertRaises(ValueError):
+                jwt_keys.jwt_keyring_from_settings(settings)
@@ -0,0 +1,124 @@
+from zope.interface import Interface
+
+import threading
+import time
+
+
+class ILoginProvider(Interface):
+    """A utility which can identify the user logging in with a request.
+
+    A provider may also define ``precondition(request)``, a cheap check such
+    as the presence of a header. When it returns False the provider is
+    skipped without calling ``userid_for_login_request``.
+    """
+
+    def userid_for_login_request(request):
+        """Return the userid logged in by the request or None"""
+
+
+class LoginProviderMetrics:
+    """Counters for a single login provider"""
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "skipped": self.skipped,
+            "seconds": self.seconds,
+            "hit_rate": self.hits / self.calls if self.calls else 0.0,
+            "mean_seconds": self.seconds / self.calls if self.calls else 0.0,
+        }
+
+
+class LoginProviderChain:
+    """An ordered tuple of login providers, tried in turn for a login request.
+
+    Records the latency and hit rate of each provider. The metrics of
+    providers in the previous chain, if given, are kept.
+    """
+
+    def __init__(self, providers, previous=None):
+        self.providers = tuple(providers)
+        kept = {}
+        if previous is not None:
+            kept = {id(p): m for (p, m) in zip(previous.providers, previous.metrics)}
+        self.metrics = tuple(kept.get(id(p)) or LoginProviderMetrics() for p in self.providers)
+        self.lock = previous.lock if previous is not None else threading.Lock()
+
+    def userid_for_login_request(self, request):
+        for provider, metrics in zip(self.providers, self.metrics):
+            precondition = getattr(provider, "precondition", None)
+            if precondition is not None and not precondition(request):
+                with self.lock:
+                    metrics.skipped += 1
+                continue
+            start = time.perf_counter()
+            userid = provider.userid_for_login_request(request)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                metrics.calls += 1
+                metrics.seconds += elapsed
+                if userid:
+                    metrics.hits += 1
+            if userid:
+                return userid
+        return None
+
+    def stats(self):
+        """Returns: A dictionary of metrics by provider name"""
+        return {
+            provider_name(provider): metrics.as_dict()
+            for provider, metrics in zip(self.providers, self.metrics)
+        }
+
+
+def provider_name(provider):
+    return getattr(provider, "name", None) or type(provider).__name__
+
+
+def register_login_provider(config, provider):
+    """Config directive to add a login provider. Providers are tried in the
+    order they are registered.
+    """
+    registry = config.registry
+
+    def register():
+        registry.registerUtility(provider, ILoginProvider, name=str(id(provider)))
+        # Recompile for providers added after the first commit
+        compile_login_providers(registry)
+
+    config.action(None, register)
+
+
+def compile_login_providers(registry):
+    """Build registry["login_providers"] from the ILoginProvider utilities,
+    in the order they were registered. Call again after registering a
+    provider with ``registry.registerUtility`` once the app is configured.
+    """
+    providers = []
+    for provider in registry.getAllUtilitiesRegisteredFor(ILoginProvider):
+        if not any(p is provider for p in providers):
+            providers.append(provider)
+    previous = registry.get("login_providers")
+    registry["login_providers"] = LoginProviderChain(providers, previous)
+
+
+def includeme(config):
+    registry = config.registry
+    registry["login_providers"] = LoginProviderChain(())
+    config.add_directive("register_login_provider", register_login_provider)
+
+    # Resolve the providers once every provider in the configuration has
+    # been registered, including utilities registered directly
+    config.action(
+        ("olcommon.login_providers",),
+        compile_login_providers,
+        args=(registry,),
+        order=10,
+    )
@@ -0,0 +1,89 @@
+# -*- coding:utf-8 -*-
+
+from .login import ILoginProvider
+from .login import LoginProviderChain
+from pyramid.config import Configurator
+
+import unittest
+
+
+class Provider:
+    def __init__(self, name, userid=None, precondition=None):
+        self.name = name
+        self.userid = userid
+        self.calls = []
+        if precondition is not None:
+            self.precondition = precondition
+
+    def userid_for_login_request(self, request):
+        self.calls.append(request)
+        return self.userid
+
+
+class TestLoginProviderChain(unittest.TestCase):
+    def test_falls_through_to_next_provider(self):
+        first = Provider("first")
+        second = Provider("second", userid="user-2")
+        third = Provider("third", userid="user-3")
+        chain = LoginProviderChain([first, second, third])
+        self.assertEqual(chain.userid_for_login_request("request"), "user-2")
+        self.assertEqual(first.calls, ["request"])
+        self.assertEqual(third.calls, [])
+        stats = chain.stats()
+        self.assertEqual((stats["first"]["calls"], stats["first"]["hits"]), (1, 0))
+        self.assertEqual((stats["second"]["calls"], stats["second"]["hits"]), (1, 1))
+        self.assertEqual(stats["third"]["calls"], 0)
+
+    def test_precondition_skips_provider(self):
+        skipped = Provider("skipped", userid="user-1", precondition=lambda request: False)
+        checked = Provider("checked", userid="user-2", precondition=lambda request: True)
+        chain = LoginProviderChain([skipped, checked])
+        self.assertEqual(chain.userid_for_login_request("request"), "user-2")
+        self.assertEqual(skipped.calls, [])
+        self.assertEqual(chain.stats()["skipped"]["skipped"], 1)
+        self.assertEqual(chain.stats()["skipped"]["calls"], 0)
+
+    def test_no_provider_matches(self):
+        chain = LoginProviderChain([Provider("first"), Provider("second")])
+        self.assertIsNone(chain.userid_for_login_request("request"))
+        self.assertEqual(chain.stats()["second"]["hit_rate"], 0.0)
+
+
+class TestIncludeme(unittest.TestCase):
+    def test_providers_compiled_in_registration_order(self):
+        config = Configurator()
+        config.include("olcommon.http.login")
+        first = Provider("first")
+        second = Provider("second", userid="user-2")
+        config.register_login_provider(first)
+        config.register_login_provider(second)
+        config.commit()
+        chain = config.registry["login_providers"]
+        self.assertEqual(chain.providers, (first, second))
+        self.assertEqual(chain.userid_for_login_request("request"), "user-2")
+
+    def test_utilities_registered_directly(self):
+        config = Configurator()
+        config.include("olcommon.http.login")
+        direct = Provider("direct")
+        config.registry.registerUtility(direct, ILoginProvider, name="direct")
+        second = Provider("second", userid="user-2")
+        config.register_login_provider(second)
+        config.commit()
+        self.assertEqual(config.registry["login_providers"].providers, (direct, second))
+
+    def test_providers_added_after_commit(self):
+        config = Configurator()
+        config.include("olcommon.http.login")
+        first = Provider("first")
+        config.register_login_provider(first)
+        config.commit()
+        config.registry["login_providers"].userid_for_login_request("request")
+
+        second = Provider("second", userid="user-2")
+        config.register_login_provider(second)
+        config.commit()
+        chain = config.registry["login_providers"]
+        self.assertEqual(chain.providers, (first, second))
+        self.assertEqual(chain.userid_for_login_request("request"), "user-2")
+        self.assertEqual(chain.stats()["first"]["calls"], 2)  # Metrics kept
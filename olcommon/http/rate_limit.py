@@ -0,0 +1,163 @@
+from hashlib import sha1
+from pyramid.httpexceptions import HTTPTooManyRequests
+
+import logging
+import secrets
+import threading
+
+
+logger = logging.getLogger("app")
+
+
+# Sliding window log limiter over one or more keys in a single atomic step.
+# KEYS: the keys to limit. ARGV[1]: a unique member for this attempt, then a
+# (limit, window in ms) pair for each key. The attempt is only recorded if
+# every key is under its limit. Returns 0 if allowed, otherwise the 1 based
+# index of the first key that is over its limit.
+SLIDING_WINDOW_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        return i
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[1])
+    redis.call('PEXPIRE', key, tonumber(ARGV[i * 2 + 1]))
+end
+return 0
+"""
+
+
+def parse_rate(value):
+    """Parse a rate such as "10/60" (10 attempts per 60 seconds)
+
+    Returns:
+        tuple: (limit, window_seconds) or None if value is empty
+    """
+    if not value or not value.strip():
+        return None
+    limit, window = value.strip().split("/")
+    return int(limit), int(window)
+
+
+class LoginRateLimiter:
+    """Limit login attempts by client address and by submitted identity.
+
+    Limits are read from the settings ``login_rate_limit.address`` and
+    ``login_rate_limit.identity`` and can be overridden for a route with
+    ``login_rate_limit.{route_name}.address`` etc. The submitted identity is
+    taken from the first of ``login_rate_limit.identity_fields`` (default
+    "email username") found in the request body.
+
+    If redis fails the attempt is allowed so logins keep working.
+
+    The limiter script is registered once, with the first client seen, and
+    then run against each request's client. Redis loads it again by itself if
+    the script cache was flushed.
+    """
+
+    def __init__(self, settings, prefix):
+        self.settings = settings
+        self.prefix = prefix
+        self.identity_fields = (settings.get("login_rate_limit.identity_fields") or "email username").split()
+        self.limits = {}
+        self.counters = {
+            "allowed": 0,
+            "rejected_address": 0,
+            "rejected_identity": 0,
+            "errors": 0,
+        }
+        self.lock = threading.Lock()
+        self.script = None
+
+    def limits_for_route(self, route_name):
+        try:
+            return self.limits[route_name]
+        except KeyError:
+            pass
+        limits = {}
+        for kind in ("address", "identity"):
+            value = self.settings.get(f"login_rate_limit.{route_name}.{kind}")
+            if value is None:
+                value = self.settings.get(f"login_rate_limit.{kind}")
+            limits[kind] = parse_rate(value)
+        self.limits[route_name] = limits
+        return limits
+
+    def sliding_window_script(self, redis):
+        script = self.script
+        if script is None:
+            with self.lock:
+                if self.script is None:
+                    self.script = redis.register_script(SLIDING_WINDOW_LUA)
+                script = self.script
+        return script
+
+    def submitted_identity(self, request):
+        try:
+            body = request.json_body
+        except ValueError:
+            body = request.POST
+        if not hasattr(body, "get"):
+            return None
+        for field in self.identity_fields:
+            value = body.get(field)
+            if isinstance(value, str) and value.strip():
+                return value.strip().lower()
+        return None
+
+    def check(self, request):
+        """Record a login attempt, raising HTTPTooManyRequests if over a limit"""
+        route = request.matched_route
+        limits = self.limits_for_route(route.name if route else "")
+
+        kinds = []
+        keys = []
+        args = [secrets.token_hex(8)]
+        if limits["address"] and request.client_addr:
+            kinds.append("address")
+            keys.append(f"{self.prefix}:address:{request.client_addr}")
+            args.extend((limits["address"][0], limits["address"][1] * 1000))
+        if limits["identity"]:
+            identity = self.submitted_identity(request)
+            if identity:
+                kinds.append("identity")
+                keys.append(f"{self.prefix}:identity:{sha1(identity.encode('utf-8')).hexdigest()}")
+                args.extend((limits["identity"][0], limits["identity"][1] * 1000))
+        if not keys:
+            return
+
+        try:
+            script = self.sliding_window_script(request.redis)
+            result = int(script(keys=keys, args=args, client=request.redis))
+        except Exception:
+            logger.exception("Login rate limiter failed, allowing attempt")
+            self.count("errors")
+            return
+
+        if result == 0:
+            self.count("allowed")
+            return
+
+        kind = kinds[result - 1]
+        self.count(f"rejected_{kind}")
+        logger.warning(
+            f"Login rate limit exceeded ({kind}).\n"
+            f"\tclient_addr: {request.client_addr}\n"
+            f"\turl: {request.url}"
+        )
+        raise HTTPTooManyRequests("Too many login attempts")
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Returns: A copy of the limiter counters"""
+        with self.lock:
+            return dict(self.counters)
@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+
+from .rate_limit import LoginRateLimiter
+from pyramid.httpexceptions import HTTPTooManyRequests
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import fakeredis
+import time
+import unittest
+
+
+SETTINGS = {
+    "login_rate_limit.address": "3/60",
+    "login_rate_limit.identity": "2/60",
+}
+
+
+class TestLoginRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def make_request(self, client_addr="10.0.0.1", email="alice@example.com", route_name="api"):
+        request = MagicMock()
+        request.redis = self.redis
+        request.client_addr = client_addr
+        request.matched_route.name = route_name
+        request.json_body = {"email": email} if email else {}
+        return request
+
+    def attempt(self, limiter, **kwargs):
+        try:
+            limiter.check(self.make_request(**kwargs))
+        except HTTPTooManyRequests:
+            return False
+        return True
+
+    def test_allows_then_blocks_identity(self):
+        limiter = LoginRateLimiter(SETTINGS, prefix="test")
+        self.assertEqual([self.attempt(limiter) for i in range(3)], [True, True, False])
+        # Case and whitespace don't make a new identity
+        self.assertFalse(self.attempt(limiter, email=" Alice@Example.com"))
+        self.assertEqual(limiter.stats()["allowed"], 2)
+        self.assertEqual(limiter.stats()["rejected_identity"], 2)
+
+    def test_address_limit_across_identities(self):
+        limiter = LoginRateLimiter(SETTINGS, prefix="test")
+        results = [self.attempt(limiter, email=f"user{i}@example.com") for i in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(limiter.stats()["rejected_address"], 1)
+        # Another address may still try
+        self.assertTrue(self.attempt(limiter, client_addr="10.0.0.2", email="user9@example.com"))
+
+    def test_identity_limit_across_addresses(self):
+        limiter = LoginRateLimiter(SETTINGS, prefix="test")
+        results = [self.attempt(limiter, client_addr=f"10.0.0.{i}") for i in range(3)]
+        self.assertEqual(results, [True, True, False])
+
+    def test_rejected_attempts_not_recorded(self):
+        limiter = LoginRateLimiter({"login_rate_limit.identity": "1/60"}, prefix="test")
+        self.assertTrue(self.attempt(limiter))
+        self.assertFalse(self.attempt(limiter))
+        self.assertEqual(self.redis.zcard(next(iter(self.redis.keys("test:identity:*")))), 1)
+
+    def test_window_expiry(self):
+        limiter = LoginRateLimiter({"login_rate_limit.identity": "1/1"}, prefix="test")
+        self.assertTrue(self.attempt(limiter))
+        self.assertFalse(self.attempt(limiter))
+        time.sleep(1.05)
+        self.assertTrue(self.attempt(limiter))
+
+    def test_route_override(self):
+        settings = dict(SETTINGS, **{"login_rate_limit.admin.identity": "1/60"})
+        limiter = LoginRateLimiter(settings, prefix="test")
+        self.assertTrue(self.attempt(limiter, route_name="admin"))
+        self.assertFalse(self.attempt(limiter, route_name="admin", email="alice@example.com"))
+
+    def test_redis_failure_allows(self):
+        limiter = LoginRateLimiter(SETTINGS, prefix="test")
+        request = self.make_request()
+        request.redis = MagicMock()
+        request.redis.register_script.side_effect = ConnectionError()
+        limiter.check(request)
+        self.assertEqual(limiter.stats()["errors"], 1)
+
+    def test_script_registered_once(self):
+        limiter = LoginRateLimiter(SETTINGS, prefix="test")
+        with patch.object(self.redis, "register_script", wraps=self.redis.register_script) as register_script:
+            self.assertTrue(self.attempt(limiter, email="alice@example.com"))
+            self.assertTrue(self.attempt(limiter, email="bob@example.com"))
+        register_script.assert_called_once()
+
+    def test_script_reloaded_after_flush(self):
+        limiter = LoginRateLimiter(SETTINGS, prefix="test")
+        self.assertTrue(self.attempt(limiter, email="alice@example.com"))
+        self.redis.script_flush()
+        self.assertTrue(self.attempt(limiter, email="bob@example.com"))
+        self.assertEqual(limiter.stats()["errors"], 0)
@@ -0,0 +1,129 @@
+"""Read only requests
+
+A request is read only when its view is declared with ``read_only=True``::
+
+    @view_config(route_name="api", name="report", read_only=True)
+
+or, for views which don't say, when it is a GET or HEAD on one of the
+routes in the ``read_only_routes`` setting. No routes are read only unless
+the setting names them. Read only requests send their database reads to a
+replica when ``postgresql_replica_urls`` is set.
+
+A read only request which changed nothing is aborted by
+``read_only_commit_veto`` rather than committed. The database transaction is
+rolled back and the site's commit hooks are skipped. Only database writes,
+recorded by ``track_writes``, and the site's commit work are seen, so a read
+only view must not send mail or use other transactional resources. Code
+writing through a raw connection should call ``mark_changed`` from here.
+
+The view is only known once traversal has finished, so queries run during
+traversal use the route rule.
+"""
+
+from functools import partial
+from pyramid_tm import maybe_tag_retryable
+
+import sqlalchemy
+import zope.sqlalchemy
+
+
+READ_ONLY_METHODS = frozenset(("GET", "HEAD"))
+
+
+def request_is_read_only(request):
+    read_only = getattr(request, "view_read_only", None)
+    if read_only is not None:
+        return read_only
+    route = request.matched_route
+    return (
+        route is not None
+        and request.method in READ_ONLY_METHODS
+        and route.name in request.registry["read_only_routes"]
+    )
+
+
+def mark_read_only(request, db_session):
+    """Have the session decide if it is read only at its first statement"""
+    db_session.info["read_only"] = partial(request_is_read_only, request)
+    track_writes(db_session)
+
+
+def track_writes(db_session):
+    """Set ``db_session.info["changed"]`` when the session flushes or
+    executes anything other than a SELECT
+    """
+    db_session.info["changed"] = False
+    sqlalchemy.event.listen(db_session, "after_flush", on_after_flush)
+    sqlalchemy.event.listen(db_session, "do_orm_execute", on_do_orm_execute)
+
+
+def on_after_flush(session, flush_context):
+    session.info["changed"] = True
+
+
+def on_do_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["changed"] = True
+
+
+def mark_changed(db_session, **kwargs):
+    """As ``zope.sqlalchemy.mark_changed``, also recording the change for
+    ``read_only_commit_veto``
+    """
+    db_session.info["changed"] = True
+    zope.sqlalchemy.mark_changed(db_session, **kwargs)
+
+
+def read_only_commit_veto(request, response):
+    """The pyramid_tm commit veto. Aborts read only requests that have
+    nothing to commit, otherwise behaves as pyramid_tm does without a veto.
+    """
+    exc_info = getattr(request, "exc_info", None)
+    if exc_info is not None:
+        # Without a veto pyramid_tm aborts when an exception view was used.
+        # It only marks the error retryable for pyramid_retry when there is
+        # no veto, so do that here.
+        maybe_tag_retryable(request, exc_info)
+        return True
+    return request_is_read_only(request) and not request_has_commit_work(request)
+
+
+def request_has_commit_work(request):
+    site = request.__dict__.get("site")  # Only if the site was created
+    if site is not None and site.has_pending_commit_work():
+        return True
+    db_session = request.__dict__.get("db_session")  # Only if it was created
+    return db_session is not None and session_has_writes(db_session)
+
+
+def session_has_writes(db_session):
+    """Returns: True if the session wrote or has changes to flush"""
+    return bool(
+        db_session.info.get("changed")
+        or db_session.new
+        or db_session.dirty
+        or db_session.deleted
+    )
+
+
+def read_only_view(view, info):
+    read_only = info.options.get("read_only")
+    if read_only is None:
+        return view
+
+    def wrapper(context, request):
+        request.view_read_only = read_only
+        return view(context, request)
+
+    return wrapper
+
+
+read_only_view.options = ("read_only",)
+
+
+def includeme(config):
+    settings = config.get_settings()
+    config.registry["read_only_routes"] = frozenset(
+        (settings.get("read_only_routes") or "").split()
+    )
+    config.add_view_deriver(read_only_view)
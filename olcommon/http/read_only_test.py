@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+
+from .read_only import mark_changed
+from .read_only import read_only_commit_veto
+from .read_only import read_only_view
+from .read_only import request_is_read_only
+from .read_only import track_writes
+from pyramid.config import Configurator
+from unittest.mock import MagicMock
+
+import pyramid_retry
+import sqlalchemy
+import sqlalchemy.orm
+import transaction
+import unittest
+import zope.sqlalchemy
+
+
+def make_request(method="GET", route_name="api"):
+    request = MagicMock(spec=["method", "matched_route", "registry", "exc_info", "tm"])
+    request.method = method
+    request.matched_route.name = route_name
+    request.registry = {"read_only_routes": frozenset(["api"])}
+    return request
+
+
+class TestRequestIsReadOnly(unittest.TestCase):
+    def test_get_on_read_only_route(self):
+        self.assertTrue(request_is_read_only(make_request("GET", "api")))
+        self.assertTrue(request_is_read_only(make_request("HEAD", "api")))
+
+    def test_post_or_other_route(self):
+        self.assertFalse(request_is_read_only(make_request("POST", "api")))
+        self.assertFalse(request_is_read_only(make_request("GET", "default")))
+
+    def test_declared_by_view(self):
+        view = MagicMock(return_value="response")
+        info = MagicMock()
+        info.options = {"read_only": False}
+        request = make_request("GET", "api")
+        self.assertEqual(read_only_view(view, info)(None, request), "response")
+        self.assertFalse(request_is_read_only(request))
+
+    def test_undeclared_view_is_unwrapped(self):
+        view = MagicMock()
+        info = MagicMock()
+        info.options = {}
+        self.assertIs(read_only_view(view, info), view)
+
+
+class TestIncludeme(unittest.TestCase):
+    def test_no_read_only_routes_by_default(self):
+        config = Configurator(settings={})
+        config.include("olcommon.http.read_only")
+        self.assertEqual(config.registry["read_only_routes"], frozenset())
+
+    def test_read_only_routes_setting(self):
+        config = Configurator(settings={"read_only_routes": "api report"})
+        config.include("olcommon.http.read_only")
+        self.assertEqual(config.registry["read_only_routes"], frozenset(["api", "report"]))
+
+
+Base = sqlalchemy.orm.declarative_base()
+
+
+class Thing(Base):
+    __tablename__ = "t"
+    x = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+
+def make_db_session():
+    engine = sqlalchemy.create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("CREATE TABLE t (x INTEGER PRIMARY KEY)"))
+    db_session = sqlalchemy.orm.Session(bind=engine)
+    track_writes(db_session)
+    return db_session
+
+
+class TestTrackWrites(unittest.TestCase):
+    def setUp(self):
+        self.db_session = make_db_session()
+        self.addCleanup(self.db_session.close)
+
+    def test_select_is_not_a_change(self):
+        self.db_session.execute(sqlalchemy.select(sqlalchemy.literal(1)))
+        self.assertFalse(self.db_session.info["changed"])
+
+    def test_execute_write(self):
+        self.db_session.execute(sqlalchemy.text("INSERT INTO t (x) VALUES (1)"))
+        self.assertTrue(self.db_session.info["changed"])
+
+    def test_flush(self):
+        self.db_session.add(Thing(x=1))
+        self.assertFalse(self.db_session.info["changed"])
+        self.db_session.flush()
+        self.assertTrue(self.db_session.info["changed"])
+
+    def test_mark_changed(self):
+        tm = transaction.TransactionManager(explicit=True)
+        tm.begin()
+        self.addCleanup(tm.abort)
+        zope.sqlalchemy.register(self.db_session, transaction_manager=tm)
+        mark_changed(self.db_session, transaction_manager=tm)
+        self.assertTrue(self.db_session.info["changed"])
+
+
+class TestReadOnlyCommitVeto(unittest.TestCase):
+    def make_request(self, method="GET", site=None, db_session=None):
+        request = make_request(method)
+        request.exc_info = None
+        request.tm = MagicMock()
+        if site is not None:
+            request.site = site
+        if db_session is not None:
+            request.db_session = db_session
+        return request
+
+    def db_session(self, changed=False):
+        db_session = make_db_session()
+        self.addCleanup(db_session.close)
+        db_session.info["changed"] = changed
+        return db_session
+
+    def test_vetoes_read_only_request_without_changes(self):
+        self.assertTrue(read_only_commit_veto(self.make_request(), None))
+        request = self.make_request(db_session=self.db_session())
+        self.assertTrue(read_only_commit_veto(request, None))
+
+    def test_commits_writes(self):
+        request = self.make_request("POST")
+        self.assertFalse(read_only_commit_veto(request, None))
+
+    def test_commits_database_changes(self):
+        request = self.make_request(db_session=self.db_session(changed=True))
+        self.assertFalse(read_only_commit_veto(request, None))
+
+    def test_commits_unflushed_changes(self):
+        db_session = self.db_session()
+        db_session.add(Thing(x=1))
+        request = self.make_request(db_session=db_session)
+        self.assertFalse(read_only_commit_veto(request, None))
+    def test_commits_pending_site_work(self):
+        site = MagicMock()
+        site.has_pending_commit_work.return_value = True
+        request = self.make_request(site=site)
+        self.assertFalse(read_only_commit_veto(request, None))
+
+    def test_aborts_exception_views(self):
+        request = self.make_request("POST")
+        request.exc_info = (Exception, Exception(), None)
+        self.assertTrue(read_only_commit_veto(request, None))
+
+    def test_exception_views_tagged_retryable(self):
+        request = self.make_request("POST")
+        error = Exception()
+        request.exc_info = (Exception, error, None)
+        request.tm.get.return_value.isRetryableError.return_value = True
+        self.assertTrue(read_only_commit_veto(request, None))
+        self.assertTrue(pyramid_retry.IRetryableError.providedBy(error))
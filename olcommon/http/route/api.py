@@ -1,5 +1,7 @@
 # -*- coding:utf-8 -*-
 
+from olcommon.exc import BcryptExecutorBusyError
+from olcommon.resource.site_base import SiteBase
 from olcommon.utils import PATTERN_API_DOMAIN
 from datetime import datetime
 from pyramid.decorator import reify
@@ -62,6 +64,19 @@ def preflight(context, request):
 
 
 
+@view_config(
+    route_name="api",
+    context=SiteBase,
+    name="jwks",
+    request_method="GET",
+    renderer="json",
+    http_cache=300,
+)
+def jwks(context, request):
+    """Publish the JSON Web Key Set of public keys used to verify tokens"""
+    return request.registry["jwt_keyring"].jwks()
+
+
 @view_config(route_name="api", context=Exception, renderer="json")
 class HandleException(object):
     """Handle and exception and return a json object in the jsend message spec format"""
@@ -154,6 +169,20 @@ class HandleClientError(HandleException):
         return getattr(self.context, 'title', None)
 
 
+@view_config(route_name="api", context=BcryptExecutorBusyError, renderer="json")
+class HandleBcryptExecutorBusyError(HandleException):
+    """Tell the client to retry a login when password hashing is saturated"""
+
+    status = "error"
+    default_message = "Too many logins in progress, try again shortly."
+    code = 503
+    retry_after = 1
+
+    def __call__(self):
+        self.request.response.headers["Retry-After"] = str(self.retry_after)
+        return super().__call__()
+
+
 @view_config(route_name="api", context="sqlalchemy.exc.IntegrityError", renderer="json")
 class HandleSQLAlchemyIntegrityError(HandleException):
     """Handle a client error and return a json object in the jsend message spec format"""
@@ -0,0 +1,23 @@
+# -*- coding:utf-8 -*-
+
+from ...exc import BcryptExecutorBusyError
+from .api import HandleBcryptExecutorBusyError
+from pyramid import testing
+from pyramid.testing import DummyRequest
+
+import unittest
+
+
+class TestHandleBcryptExecutorBusyError(unittest.TestCase):
+    def setUp(self):
+        testing.setUp()
+        self.addCleanup(testing.tearDown)
+
+    def test_service_unavailable_with_retry_after(self):
+        request = DummyRequest()
+        request.exc_info = None
+        result = HandleBcryptExecutorBusyError(BcryptExecutorBusyError(), request)()
+        self.assertEqual(request.response.status_code, 503)
+        self.assertEqual(request.response.headers["Retry-After"], "1")
+        self.assertEqual(result["code"], 503)
+        self.assertEqual(result["status"], "error")
@@ -5,6 +5,11 @@ from pyramid.view import view_config
 from pyramid.view import view_defaults
 
 
+# Views reporting on the internals of the app need this permission, which
+# the site's ACL grants to those who may see them.
+CHECK_STATS_PERMISSION = "view-check-stats"
+
+
 @view_defaults(route_name="check")
 class CheckView(object):
     def __init__(self, context, request):
@@ -30,6 +35,27 @@ class CheckView(object):
             )
         return Response(body="200 ok db", content_type="text/plain")
 
+    @view_config(name="db_pool", renderer="json", permission=CHECK_STATS_PERMISSION)
+    def db_pool(self):
+        """A view which reports the database connection pool usage"""
+        return self.request.registry["db_engine"].pool.stats()
+
+    @view_config(name="db_replicas", renderer="json", permission=CHECK_STATS_PERMISSION)
+    def db_replicas(self):
+        """A view which reports the health and lag of the read replicas"""
+        replicas = self.request.registry["db_replicas"]
+        return replicas.stats() if replicas is not None else {}
+
+    @view_config(name="db_retries", renderer="json", permission=CHECK_STATS_PERMISSION)
+    def db_retries(self):
+        """A view which reports the retries of serialization and deadlock failures"""
+        return self.request.registry["db_retry_stats"].stats()
+
+    @view_config(name="rq_write_groups", renderer="json", permission=CHECK_STATS_PERMISSION)
+    def rq_write_groups(self):
+        """A view which reports the jobs routed to each write group and the hottest keys"""
+        return self.request.registry["rq_write_group_stats"].stats()
+
     @view_config(name="redis")
     def redis(self):
         """A view which checks database connectivity"""
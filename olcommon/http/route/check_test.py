@@ -0,0 +1,51 @@
+# -*- coding:utf-8 -*-
+
+from .check import CHECK_STATS_PERMISSION
+from pyramid.config import Configurator
+from pyramid.request import Request
+from unittest.mock import MagicMock
+
+import unittest
+
+
+class SecurityPolicy:
+    def __init__(self, permissions):
+        self.permissions = permissions
+
+    def identity(self, request):
+        return None
+
+    def authenticated_userid(self, request):
+        return None
+
+    def permits(self, request, context, permission):
+        return permission in self.permissions
+
+
+def make_app(permissions=()):
+    config = Configurator()
+    config.set_security_policy(SecurityPolicy(permissions))
+    config.include("olcommon.http.route.check")
+    config.registry["db_engine"] = MagicMock()
+    config.registry["db_engine"].pool.stats.return_value = {"in_use": 1}
+    config.registry["db_replicas"] = None
+    return config.make_wsgi_app()
+
+
+class TestCheckViews(unittest.TestCase):
+    def test_stats_need_permission(self):
+        app = make_app()
+        for name in ("db_pool", "db_replicas", "db_retries", "rq_write_groups"):
+            response = Request.blank(f"/_check/{name}").get_response(app)
+            self.assertEqual(response.status_code, 403, name)
+
+    def test_stats_with_permission(self):
+        app = make_app([CHECK_STATS_PERMISSION])
+        response = Request.blank("/_check/db_pool").get_response(app)
+        self.assertEqual(response.json, {"in_use": 1})
+        response = Request.blank("/_check/db_replicas").get_response(app)
+        self.assertEqual(response.json, {})
+
+    def test_health_check_open(self):
+        response = Request.blank("/_check/app").get_response(make_app())
+        self.assertEqual(response.status_code, 200)
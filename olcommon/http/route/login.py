@@ -1,7 +1,6 @@
 # -*- coding:utf-8 -*-
 
-from ..authentication.jwt import JWTNotConfiguredError
-from ..login import ILoginProvider
+from ...exc import JWTNotConfiguredError
 from datetime import datetime
 from pyramid.decorator import reify
 from pyramid.httpexceptions import HTTPForbidden
@@ -27,12 +26,10 @@ class LoginView(object):
 
     @reify
     def userid(self):
-        for provider in self.request.registry.getAllUtilitiesRegisteredFor(
-            ILoginProvider
-        ):
-            userid = provider.userid_for_login_request(self.request)
-            if userid:
-                return userid
+        login_providers = self.request.registry["login_providers"]
+        userid = login_providers.userid_for_login_request(self.request)
+        if userid:
+            return userid
         return self.request.authenticated_userid
 
     @reify
@@ -85,6 +82,9 @@ class LoginView(object):
         if self.request.method.lower() != "post":
             raise HTTPForbidden("Request method not allowed")
 
+        # Reject brute force attempts before any login provider runs
+        self.request.registry["login_rate_limiter"].check(self.request)
+
         # If no userid then have failed to login
         if not self.userid:
             logger.warning(
@@ -1,7 +1,36 @@
+from pyramid.authorization import ACLAllowed
+from pyramid.authorization import ACLDenied
 from pyramid.authorization import ACLHelper
+from pyramid.authorization import Allow
+from pyramid.authorization import AllPermissionsList
+from pyramid.location import lineage
+from pyramid.util import is_nonstr_iter
+
+import cachetools
+import threading
+import time
 
 
 class SecurityPolicy:
+    """Security policy using JWT identities and ACL authorization.
+
+    With ``compile_static_acls`` an ``__acl__`` that is a list or tuple on the
+    resource class is compiled once per class into ACEs indexed by
+    permission. ACLs set on an instance or computed by a callable are
+    evaluated as usual.
+
+    Also with ``compile_static_acls``, the result of ``permits`` for a
+    context whose lineage only has compiled class ACLs is memoized on the
+    request by (context, permission, principals), so repeated checks of the
+    same item are free. A view which then sets an ``__acl__`` on an instance
+    in the lineage, or changes the principals it checks with, must call
+    ``request.permits_memo.clear()`` for later checks to see the change.
+    """
+
+    def __init__(self, compile_static_acls=False):
+        self.compile_static_acls = compile_static_acls
+        self.acl_helper = ACLHelper()
+        self.compiled_acls = {}
 
     def identity(self, request):
         claims = request.jwt_claims
@@ -14,5 +43,146 @@ class SecurityPolicy:
             return identity["sub"]
         return None
 
-    def permits(self,request, context, permission):
-        return ACLHelper().permits(context, request.principals, permission)
+    def permits(self, request, context, permission):
+        principals = frozenset(request.principals)
+        if not self.compile_static_acls:
+            return self.acl_helper.permits(context, principals, permission)
+        memo = request.permits_memo
+        key = (id(context), permission, principals)
+        entry = memo.get(key)
+        if entry is not None and entry[0] is context:
+            return entry[1]
+        result = self.compiled_permits(context, principals, permission)
+        if self.has_static_acls(context):
+            memo[key] = (context, result)  # Hold context so its id is not reused
+        return result
+
+    def has_static_acls(self, context):
+        """Returns: True if every ACL in the lineage of context is a
+        compiled class ACL, so the result of permits can be memoized
+        """
+        for location in lineage(context):
+            if "__acl__" in getattr(location, "__dict__", ()):
+                return False
+            if hasattr(type(location), "__acl__") and self.get_compiled_acl(type(location)) is None:
+                return False
+        return True
+
+    def compiled_permits(self, context, principals, permission):
+        """The same as ``ACLHelper.permits`` but using compiled static ACLs"""
+        acl = '<No ACL found on any object in resource lineage>'
+
+        for location in lineage(context):
+            compiled = None
+            if "__acl__" not in getattr(location, "__dict__", ()):
+                compiled = self.get_compiled_acl(type(location))
+
+            if compiled is not None:
+                acl = compiled.acl
+                for ace, ace_action, ace_principal in compiled.aces_for(permission):
+                    if ace_principal in principals:
+                        if ace_action == Allow:
+                            return ACLAllowed(ace, acl, permission, principals, location)
+                        else:
+                            return ACLDenied(ace, acl, permission, principals, location)
+                continue
+
+            try:
+                acl = location.__acl__
+            except AttributeError:
+                continue
+
+            if acl and callable(acl):
+                acl = acl()
+
+            for ace in acl:
+                ace_action, ace_principal, ace_permissions = ace
+                if ace_principal in principals:
+                    if not is_nonstr_iter(ace_permissions):
+                        ace_permissions = [ace_permissions]
+                    if permission in ace_permissions:
+                        if ace_action == Allow:
+                            return ACLAllowed(ace, acl, permission, principals, location)
+                        else:
+                            return ACLDenied(ace, acl, permission, principals, location)
+
+        return ACLDenied('<default deny>', acl, permission, principals, context)
+
+    def get_compiled_acl(self, cls):
+        """Returns: A CompiledACL for a static class ACL or None"""
+        try:
+            return self.compiled_acls[cls]
+        except KeyError:
+            pass
+        acl = getattr(cls, "__acl__", None)
+        compiled = CompiledACL(acl) if isinstance(acl, (list, tuple)) else None
+        self.compiled_acls[cls] = compiled
+        return compiled
+
+
+class CompiledACL:
+    """An ACL with its ACEs indexed by permission"""
+
+    def __init__(self, acl):
+        self.acl = acl
+        self.aces = []
+        for ace in acl:
+            ace_action, ace_principal, ace_permissions = ace
+            if not isinstance(ace_permissions, AllPermissionsList):
+                if not is_nonstr_iter(ace_permissions):
+                    ace_permissions = [ace_permissions]
+                ace_permissions = frozenset(ace_permissions)
+            self.aces.append((ace, ace_action, ace_principal, ace_permissions))
+        self.by_permission = {}
+
+    def aces_for(self, permission):
+        """Returns: The ACEs which apply to a permission in ACL order"""
+        try:
+            return self.by_permission[permission]
+        except KeyError:
+            pass
+        aces = tuple(
+            (ace, ace_action, ace_principal)
+            for ace, ace_action, ace_principal, ace_permissions in self.aces
+            if permission in ace_permissions
+        )
+        self.by_permission[permission] = aces
+        return aces
+
+
+def get_permits_memo(request):
+    """Returns: A dictionary for SecurityPolicy to memoize permits results.
+    Clear it after changing an ACL or the principals during a request.
+    """
+    return {}
+
+
+class PrincipalsCache:
+    """A small TTL cache of frozen principal sets.
+
+    Entries are keyed by ``SiteBase.principals_cache_key``, which includes
+    the user's nounce, so changing a user's nounce, e.g. with
+    ``UserPasswordBase.change_nounce``, stops the old entry from being used.
+    Other changes to a user's principals are picked up when the entry expires.
+    """
+
+    def __init__(self, maxsize=1000, ttl=60, timer=time.monotonic):
+        self.ttl = ttl
+        self.cache = cachetools.TTLCache(maxsize=max(maxsize, 1), ttl=max(ttl, 1), timer=timer)
+        self.lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Returns: The cached principals for key, calling factory on a miss"""
+        if self.ttl <= 0:
+            return frozenset(factory())
+        with self.lock:
+            principals = self.cache.get(key)
+        if principals is None:
+            principals = frozenset(factory())
+            with self.lock:
+                self.cache[key] = principals
+        return principals
+
+    def discard(self, key):
+        with self.lock:
+            self.cache.pop(key, None)
@@ -0,0 +1,139 @@
+# -*- coding:utf-8 -*-
+
+from .security import PrincipalsCache
+from .security import SecurityPolicy
+from pyramid.authorization import ALL_PERMISSIONS
+from pyramid.authorization import ACLHelper
+from pyramid.authorization import Allow
+from pyramid.authorization import Deny
+from pyramid.authorization import Everyone
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import unittest
+
+
+class Root:
+    __parent__ = None
+    __name__ = ""
+    __acl__ = [
+        (Allow, "role:admin", ALL_PERMISSIONS),
+        (Allow, Everyone, "view"),
+    ]
+
+
+class Item:
+    __acl__ = (
+        (Deny, "user:blocked", ("view", "edit")),
+        (Allow, "user:owner", "edit"),
+    )
+
+    def __init__(self, parent, name):
+        self.__parent__ = parent
+        self.__name__ = name
+
+
+class DynamicItem(Item):
+    def __acl__(self):
+        return [(Allow, "user:dynamic", "edit")]
+
+
+class TestSecurityPolicy(unittest.TestCase):
+    def make_request(self, principals):
+        request = MagicMock()
+        request.principals = principals
+        request.permits_memo = {}
+        return request
+
+    def test_compiled_matches_acl_helper(self):
+        root = Root()
+        contexts = [root, Item(root, "a"), DynamicItem(root, "b")]
+        instance_item = Item(root, "c")
+        instance_item.__acl__ = [(Allow, "user:instance", "edit")]
+        contexts.append(instance_item)
+        principal_sets = [
+            [Everyone],
+            [Everyone, "role:admin"],
+            [Everyone, "user:blocked"],
+            [Everyone, "user:owner"],
+            [Everyone, "user:dynamic"],
+            [Everyone, "user:instance"],
+        ]
+        policy = SecurityPolicy(compile_static_acls=True)
+        for context in contexts:
+            for principals in principal_sets:
+                for permission in ("view", "edit", "delete"):
+                    expected = ACLHelper().permits(context, principals, permission)
+                    result = policy.permits(self.make_request(principals), context, permission)
+                    self.assertEqual(bool(result), bool(expected), (context, principals, permission))
+                    self.assertEqual(result.ace, expected.ace)
+
+    def test_memo(self):
+        policy = SecurityPolicy(compile_static_acls=True)
+        request = self.make_request([Everyone])
+        context = Item(Root(), "a")
+        with patch.object(policy, "compiled_permits", wraps=policy.compiled_permits) as compiled_permits:
+            first = policy.permits(request, context, "view")
+            second = policy.permits(request, context, "view")
+            self.assertIs(first, second)
+            self.assertEqual(compiled_permits.call_count, 1)
+            policy.permits(request, context, "edit")
+            self.assertEqual(compiled_permits.call_count, 2)
+            # An equal but different context is not aliased
+            policy.permits(request, Item(Root(), "a"), "view")
+            self.assertEqual(compiled_permits.call_count, 3)
+
+    def test_dynamic_acls_not_memoized(self):
+        policy = SecurityPolicy(compile_static_acls=True)
+        request = self.make_request([Everyone, "user:x"])
+        context = Item(Root(), "a")
+        context.__acl__ = [(Allow, "user:x", "edit")]
+        self.assertTrue(policy.permits(request, context, "edit"))
+        context.__acl__ = []
+        self.assertFalse(policy.permits(request, context, "edit"))
+        self.assertEqual(request.permits_memo, {})
+
+    def test_memo_stale_until_cleared(self):
+        policy = SecurityPolicy(compile_static_acls=True)
+        request = self.make_request([Everyone, "user:x"])
+        context = Item(Root(), "a")
+        self.assertFalse(policy.permits(request, context, "edit"))
+        # A view grants access during the request
+        context.__acl__ = [(Allow, "user:x", "edit")]
+        self.assertFalse(policy.permits(request, context, "edit"))
+        request.permits_memo.clear()
+        self.assertTrue(policy.permits(request, context, "edit"))
+
+    def test_not_memoized_without_compiled_acls(self):
+        policy = SecurityPolicy()
+        request = self.make_request([Everyone])
+        policy.permits(request, Root(), "view")
+        self.assertEqual(request.permits_memo, {})
+
+
+class TestPrincipalsCache(unittest.TestCase):
+    def test_cached(self):
+        cache = PrincipalsCache()
+        factory = MagicMock(return_value=["user:a"])
+        self.assertEqual(cache.get(("n1", "a"), factory), frozenset(["user:a"]))
+        self.assertEqual(cache.get(("n1", "a"), factory), frozenset(["user:a"]))
+        factory.assert_called_once_with()
+
+    def test_ttl_expiry(self):
+        now = [0]
+        cache = PrincipalsCache(ttl=60, timer=lambda: now[0])
+        factory = MagicMock(return_value=["user:a"])
+        cache.get("key", factory)
+        now[0] = 59
+        cache.get("key", factory)
+        self.assertEqual(factory.call_count, 1)
+        now[0] = 60
+        cache.get("key", factory)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_disabled(self):
+        cache = PrincipalsCache(ttl=0)
+        factory = MagicMock(return_value=["user:a"])
+        cache.get("key", factory)
+        cache.get("key", factory)
+        self.assertEqual(factory.call_count, 2)
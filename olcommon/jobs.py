@@ -1,21 +1,160 @@
+from ctq import ResourceCache
 from ctq import emit
 
 
+def site_job(func):
+    """Mark a job function as taking the site as its first argument.
+    See olcommon.worker.SiteWorker
+    """
+    func.site_job = True
+    return func
+
+
+@site_job
 def resource_call(site, path, method_name, *args, **kwargs):
     context = _traverse(site, path)
     func = getattr(context, method_name)
     func(*args, **kwargs)
 
 
+@site_job
 def resource_emit(site, path, event_name, data=None, /):
     context = _traverse(site, path)
     emit(event_name, data, target=context)
 
 
-def _traverse(root, path):
-    context = {"": root}
-    if isinstance(path, str):
-        path = path.split("/")
-    for key in path:
-        context = context[key]   
+@site_job
+def resource_emit_many(site, paths, event_name, data=None, /):
+    """Emit an event on many resources in one job.
+
+    The targets are found with resolve_many. Each target is emitted to in a
+    savepoint, so one which fails is rolled back, along with any jobs it
+    queued, and logged without failing the others.
+
+    Returns:
+        dict: The number of targets emitted to and the paths which failed
+    """
+    logger = site.get_logger()
+    found = resolve_many(site, paths)
+    failed = []
+    for path in paths:
+        context = found.get(_path_tuple(path))
+        if context is None:
+            failed.append(path)
+            logger.error(f'Emit "{event_name}" failed on {path}: not found')
+            continue
+        db_session = site.db_session
+        if db_session is not None:
+            db_session.connection()  # Join the transaction so the savepoint covers it
+        savepoint = site.transaction.savepoint(optimistic=True)
+        pending = site.pending_commit_work_snapshot()
+        try:
+            emit(event_name, data, target=context)
+            if db_session is not None:
+                db_session.flush()
+        except Exception:
+            savepoint.rollback()
+            site.restore_pending_commit_work(pending)
+            failed.append(path)
+            logger.exception(f'Emit "{event_name}" failed on {path}')
+    if failed:
+        logger.warning(f'Emit "{event_name}" failed on {len(failed)} of {len(paths)} targets')
+    return {"emitted": len(paths) - len(failed), "failed": failed}
+
+
+def resolve_many(root, paths):
+    """Returns: A dict of the resources found at paths, by path tuple.
+    Paths which are not found are left out.
+
+    Paths are resolved a level at a time and each container is looked up
+    one name at a time, unless it implements the optional
+    ``resource_bulk_getitem(names)`` hook. The hook returns a dict of the
+    children the container has of names, set up as ``__getitem__`` would
+    set them up, and is called once for all of the names needed from the
+    container. No container in olcommon implements it; it is for an
+    application's containers, such as one loading its records with a
+    single ``IN`` query. Resources are cached as for _traverse.
+    """
+    (cache_get, cache_set) = _prefix_cache(root, {})
+    paths = [_path_tuple(path) for path in paths]
+    resolved = {(): {"": root}}
+    for depth in range(1, max(map(len, paths), default=0) + 1):
+        wanted = {}
+        for path in paths:
+            if len(path) < depth or path[:depth] in resolved:
+                continue
+            parent = resolved.get(path[:depth - 1])
+            if parent is None:
+                continue  # Parent not found
+            cached = cache_get(path[:depth]) if depth > 1 else None
+            if cached is not None:
+                resolved[path[:depth]] = cached
+            else:
+                wanted.setdefault(path[:depth - 1], set()).add(path[depth - 1])
+        for (parent_path, names) in wanted.items():
+            for (name, child) in _getitems(resolved[parent_path], names).items():
+                resolved[parent_path + (name,)] = child
+                if depth > 1:
+                    cache_set(parent_path + (name,), child)
+    return {path: resolved[path] for path in paths if resolved.get(path) is not None}
+
+
+def _getitems(container, names):
+    bulk_getitem = getattr(container, "resource_bulk_getitem", None)
+    if bulk_getitem is not None:
+        return bulk_getitem(names)
+    children = {}
+    for name in names:
+        try:
+            children[name] = container[name]
+        except KeyError:
+            pass
+    return children
+
+
+def _traverse(root, path, resolved=None):
+    """Returns: The resource at path from root
+
+    Path prefixes are memoized in the root's resource cache when it is a
+    ctq ResourceCache, so they live as long as the site's cache. Otherwise
+    they are memoized in resolved, if it is given.
+    """
+    path = _path_tuple(path)
+    (cache_get, cache_set) = _prefix_cache(root, resolved)
+    depth = len(path)
+    context = None
+    while depth > 1:
+        context = cache_get(path[:depth])
+        if context is not None:
+            break
+        depth -= 1
+    if context is None:
+        (context, depth) = ({"": root}, 0)
+    for index in range(depth, len(path)):
+        context = context[path[index]]
+        if index:
+            cache_set(path[:index + 1], context)
     return context
+
+
+def _path_tuple(path):
+    if isinstance(path, str):
+        return tuple(path.split("/"))
+    return tuple(path)
+
+
+def _prefix_cache(root, resolved):
+    """Returns: (get, set) functions of the path prefix cache"""
+    if isinstance(root, ResourceCache):
+        return (root.resource_cache_get, root.resource_cache_set)
+    if resolved is not None:
+        return (resolved.get, resolved.__setitem__)
+    return (_no_cache_get, _no_cache_set)
+
+
+def _no_cache_get(path):
+    return None
+
+
+def _no_cache_set(path, resource):
+    pass
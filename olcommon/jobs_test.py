@@ -0,0 +1,140 @@
+# -*- coding:utf-8 -*-
+
+from .jobs import _traverse
+from .jobs import resolve_many
+from .jobs import resource_emit_many
+from .resource.job_behavior import JobBehavior
+from ctq import ResourceCache
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import transaction
+import unittest
+
+
+class Container(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookups = []
+
+    def __getitem__(self, key):
+        self.lookups.append(key)
+        return super().__getitem__(key)
+
+
+class BulkContainer(Container):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bulk_lookups = []
+
+    def resource_bulk_getitem(self, names):
+        self.bulk_lookups.append(set(names))
+        return {name: dict.__getitem__(self, name) for name in names if name in self}
+
+
+class CachingRoot(ResourceCache, Container):
+    pass
+
+
+class CommitWorkContainer(Container):
+    def pending_commit_work_snapshot(self):
+        return {}
+
+    def restore_pending_commit_work(self, snapshot):
+        return
+
+
+class JobSite(JobBehavior, CommitWorkContainer):
+    pass
+
+
+def make_tree(root_class=Container):
+    users = Container(a="user a", b="user b")
+    root = root_class(users=users)
+    return (root, users)
+
+
+class TestTraverse(unittest.TestCase):
+    def test_traverse(self):
+        (root, users) = make_tree()
+        self.assertEqual(_traverse(root, ("", "users", "a")), "user a")
+        self.assertEqual(_traverse(root, "/users/b"), "user b")
+        with self.assertRaises(KeyError):
+            _traverse(root, ("", "users", "c"))
+
+    def test_shared_prefixes_resolved_once(self):
+        (root, users) = make_tree()
+        resolved = {}
+        self.assertEqual(_traverse(root, ("", "users", "a"), resolved), "user a")
+        self.assertEqual(_traverse(root, ("", "users", "b"), resolved), "user b")
+        self.assertEqual(root.lookups, ["users"])
+        self.assertEqual(users.lookups, ["a", "b"])
+
+    def test_memoized_in_resource_cache(self):
+        (root, users) = make_tree(CachingRoot)
+        self.assertEqual(_traverse(root, ("", "users", "a")), "user a")
+        self.assertEqual(_traverse(root, ("", "users", "a")), "user a")
+        self.assertEqual(_traverse(root, ("", "users", "b")), "user b")
+        self.assertEqual(root.lookups, ["users"])
+        self.assertEqual(users.lookups, ["a", "b"])
+        self.assertIs(root.resource_cache_get(("", "users")), users)
+
+        root.resource_cache_clear()
+        _traverse(root, ("", "users", "a"))
+        self.assertEqual(root.lookups, ["users", "users"])
+
+
+class TestResolveMany(unittest.TestCase):
+    def test_bulk_getitem_once_per_container(self):
+        users = BulkContainer(a="user a", b="user b")
+        groups = BulkContainer(x="group x")
+        root = CachingRoot(users=users, groups=groups)
+        root.resource_cache_set(("", "users", "b"), "cached b")
+        paths = [("", "users", "a"), "/users/b", ("", "users", "c"), ("", "groups", "x"), ("", "missing", "y")]
+        self.assertEqual(resolve_many(root, paths), {
+            ("", "users", "a"): "user a",
+            ("", "users", "b"): "cached b",
+            ("", "groups", "x"): "group x",
+        })
+        self.assertEqual(users.bulk_lookups, [{"a", "c"}])
+        self.assertEqual(groups.bulk_lookups, [{"x"}])
+        self.assertEqual(users.lookups, [])
+        self.assertEqual(root.resource_cache_get(("", "users", "a")), "user a")
+
+
+class TestResourceEmitMany(unittest.TestCase):
+    def make_site(self):
+        (site, users) = make_tree(JobSite)
+        site.transaction = transaction.TransactionManager(explicit=True)
+        site.transaction.begin()
+        site.db_session = None
+        site.get_logger = MagicMock()
+        return site
+
+    @patch("olcommon.jobs.emit")
+    def test_failures_isolated(self, emit):
+        site = self.make_site()
+        emit.side_effect = lambda event_name, data, target: target.startswith("user b") and 1 / 0
+        paths = [("", "users", "a"), ("", "users", "b"), ("", "users", "c"), ("", "users", "a")]
+        result = resource_emit_many(site, paths, "changed", {"n": 1})
+        self.assertEqual(result, {"emitted": 2, "failed": [("", "users", "b"), ("", "users", "c")]})
+        self.assertEqual([c.kwargs["target"] for c in emit.call_args_list], ["user a", "user b", "user a"])
+        self.assertEqual(site.lookups, ["users"])
+
+    @patch("olcommon.jobs.emit")
+    def test_failed_targets_enqueue_nothing(self, emit):
+        site = self.make_site()
+        queue = MagicMock()
+        queue.name = "default"
+
+        def enqueue_then_fail(event_name, data, target):
+            site.enqueue(queue, print, target, job_coalesce=target)
+            if target == "user b":
+                raise ValueError(target)
+
+        emit.side_effect = enqueue_then_fail
+        paths = [("", "users", "b"), ("", "users", "a")]
+        result = resource_emit_many(site, paths, "changed")
+        self.assertEqual(result["failed"], [("", "users", "b")])
+        self.assertEqual([args for (q, f, args, kwargs, d) in site._job_enqueue_pending], [("user a",)])
+        self.assertEqual(list(site._job_coalesce_keys), ["user a"])
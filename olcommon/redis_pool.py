@@ -0,0 +1,130 @@
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+
+import os
+import redis
+import threading
+
+
+def redact_url(url):
+    """Returns: url with any password replaced by ``***``"""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = parts.netloc.rsplit("@", 1)[1]
+    userinfo = f"{parts.username}:***" if parts.username else ":***"
+    return urlunsplit(parts._replace(netloc=f"{userinfo}@{netloc}"))
+
+
+class CountingConnectionPool(redis.BlockingConnectionPool):
+    """A ``BlockingConnectionPool`` that counts the connections it makes
+    and hands out, so stats don't depend on the pool's internals.
+    """
+
+    def reset(self):
+        self.stats_lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        super().reset()
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self.stats_lock:
+            self.created += 1
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        with self.stats_lock:
+            self.in_use += 1
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        with self.stats_lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def stats(self):
+        """Returns: Connection counts of the pool"""
+        with self.stats_lock:
+            created, in_use = self.created, self.in_use
+        return {
+            "max_connections": self.max_connections,
+            "created": created,
+            "idle": max(created - in_use, 0),
+            "in_use": in_use,
+        }
+
+
+class RedisPools:
+    """Process wide redis clients, one per url, sharing a connection pool.
+
+    A ``BlockingConnectionPool`` is used so that when ``max_connections``
+    are in use a caller waits up to ``timeout`` seconds for a connection
+    rather than failing straight away.
+    """
+
+    def __init__(self, **kwargs):
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.configure(**kwargs)
+
+    def configure(
+        self,
+        max_connections=50,
+        timeout=5,
+        socket_keepalive=True,
+        health_check_interval=30,
+    ):
+        """Set the pool options. Existing pools are disconnected and replaced."""
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.socket_keepalive = socket_keepalive
+        self.health_check_interval = health_check_interval
+        with self.lock:
+            clients, self.clients = self.clients, {}
+        for client in clients.values():
+            client.connection_pool.disconnect()
+
+    def get(self, url, decode_responses=False):
+        """Returns: A redis client for url using the shared pool"""
+        key = (url, decode_responses)
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    pool = CountingConnectionPool.from_url(
+                        url,
+                        max_connections=self.max_connections,
+                        timeout=self.timeout,
+                        socket_keepalive=self.socket_keepalive,
+                        health_check_interval=self.health_check_interval,
+                        decode_responses=decode_responses,
+                    )
+                    client = redis.StrictRedis(connection_pool=pool)
+                    self.clients[key] = client
+        return client
+
+    def reset(self):
+        """Forget all pools. Used in a forked child, where the parent's
+        sockets must not be used.
+        """
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def stats(self):
+        """Returns: Connection counts for each pool, keyed by the url with
+        its password redacted and the client options
+        """
+        stats = {}
+        for (url, decode_responses), client in list(self.clients.items()):
+            key = f"{redact_url(url)} decode_responses={decode_responses}"
+            stats[key] = client.connection_pool.stats()
+        return stats
+
+
+redis_pools = RedisPools()
+
+
+os.register_at_fork(after_in_child=redis_pools.reset)
@@ -1,16 +1,155 @@
+from .bcrypt_executor import DEFAULT_BCRYPT_ROUNDS
+from .bcrypt_executor import calibrate_bcrypt_rounds
+from .bcrypt_executor import configure_bcrypt_executor
+from .bcrypt_executor import get_bcrypt_executor
+from .db_pool import create_db_engine
+from .db_pool import dispose_after_fork
+from .db_replicas import ReplicaSet
+from .db_replicas import RoutingSession
+from .db_retry import RetryStats
 from .utils import yesish
 from .utils.sendgrid_mailer import SendgridMailer
 from .logging import ActorLoggerAdapter
+from .redis_pool import redis_pools
+from .write_groups import WriteGroupStats
 
 import os
+import pyramid.registry
 import sqlalchemy.orm
 import sqlalchemy.pool
-import redis
 import logging
+import threading
+
+
+class LazyRegistryMixin:
+    """A dict mixin whose entries can be built on first access.
+
+    ``set_lazy(key, factory)`` stores a factory which is called the first
+    time ``registry[key]``, ``registry.get(key)``, ``registry.setdefault(key)``
+    or ``registry.pop(key)`` is used, and ``key in registry`` is true for it.
+    The result is stored as a normal entry. Lazy entries which have not been
+    built yet don't show up in ``keys()``, ``values()``, ``items()`` or
+    ``len()``, as the factories are kept apart from the dict itself. Setting
+    or deleting a key drops its pending factory.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_factories = {}
+        self.lazy_lock = threading.RLock()
+
+    def set_lazy(self, key, factory):
+        with self.lazy_lock:
+            dict.pop(self, key, None)
+            self.lazy_factories[key] = factory
+
+    def __missing__(self, key):
+        with self.lazy_lock:
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+            if key not in self.lazy_factories:
+                raise KeyError(key)
+            value = self.lazy_factories[key]()
+            self[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        self.lazy_factories.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        with self.lazy_lock:
+            if key in self.lazy_factories:
+                del self.lazy_factories[key]
+            else:
+                super().__delitem__(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.lazy_factories
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        with self.lazy_lock:
+            if key in self:
+                return self[key]
+            self[key] = default
+            return default
+
+    def pop(self, key, *default):
+        with self.lazy_lock:
+            if key in self:
+                value = self[key]
+                dict.__delitem__(self, key)
+                return value
+            return dict.pop(self, key, *default)
+
+    def clear(self):
+        with self.lazy_lock:
+            self.lazy_factories.clear()
+            super().clear()
+
+
+class LazyDict(LazyRegistryMixin, dict):
+    """A dict registry with lazy entries, for scripts and workers"""
+
+
+class Registry(LazyRegistryMixin, pyramid.registry.Registry):
+    """A pyramid registry with lazy entries.
+
+    Pass it to the Configurator and set up the registry explicitly::
+
+        config = Configurator(registry=Registry(__name__))
+        config.setup_registry(settings=settings)
+    """
+
+
+def set_lazy(registry: dict, key, factory):
+    """Add a registry entry built on first access if the registry supports
+    it, otherwise build it now.
+    """
+    if isinstance(registry, LazyRegistryMixin):
+        registry.set_lazy(key, factory)
+    else:
+        registry[key] = factory()
+
+
+def session_factory(engine, replicas=None):
+    if replicas is None:
+        factory = sqlalchemy.orm.sessionmaker()
+    else:
+        factory = sqlalchemy.orm.sessionmaker(class_=RoutingSession, replicas=replicas)
+    factory.configure(bind=engine)
+    return factory
+
+
+def create_pooled_db_engine(settings, prefix="db_", url=None):
+    engine = create_db_engine(url or settings["postgresql_url"], settings, prefix=prefix)
+    dispose_after_fork(engine)
+    return engine
+
+
+def create_replica_set(settings):
+    return ReplicaSet(
+        [
+            create_pooled_db_engine(settings, prefix="db_replica_", url=url)
+            for url in settings["postgresql_replica_urls"].split()
+        ],
+        max_lag=int(settings.get("db_replica_max_lag", 30)),
+        lag_check_interval=int(settings.get("db_replica_lag_check_interval", 10)),
+        retry_seconds=int(settings.get("db_replica_retry_seconds", 30)),
+    )
 
 
 def configure_registry(registry: dict, settings: dict):
     """COnfigure a registry with a given set of settings
+
+    Database engines, session factories and the mailer are built when first
+    used if the registry is a LazyDict or Registry, so scripts and workers
+    which don't use them don't pay for them.
     """
     registry["settings"] = settings
     registry["is_debug"] = yesish(settings["is_debug"])
@@ -24,17 +163,46 @@ def configure_registry(registry: dict, settings: dict):
 
     assert registry["root_class"], "No root class defined in the registry"
 
-    registry["null_pool_db_engine"] = sqlalchemy.create_engine(settings["postgresql_url"], poolclass=sqlalchemy.pool.NullPool)
-    registry["null_pool_db_session_factory"] = sqlalchemy.orm.sessionmaker()
-    registry["null_pool_db_session_factory"].configure(bind=registry["null_pool_db_engine"])
-   
-    registry["db_engine"] = sqlalchemy.create_engine(settings["postgresql_url"])
-    registry["db_session_factory"] = sqlalchemy.orm.sessionmaker()
-    registry["db_session_factory"].configure(bind=registry["db_engine"])
+    # Read replicas from postgresql_replica_urls, pools sized by
+    # db_replica_pool_size etc. Sessions with info["read_only"] set send their
+    # reads to a replica. Health and lag from registry["db_replicas"].stats()
+    if settings.get("postgresql_replica_urls", "").strip():
+        set_lazy(registry, "db_replicas", lambda: create_replica_set(settings))
+    else:
+        registry["db_replicas"] = None
+
+    set_lazy(registry, "null_pool_db_engine", lambda: sqlalchemy.create_engine(settings["postgresql_url"], poolclass=sqlalchemy.pool.NullPool))
+    set_lazy(registry, "null_pool_db_session_factory", lambda: session_factory(registry["null_pool_db_engine"], registry["db_replicas"]))
+
+    # Pool sized by db_pool_size, db_max_overflow etc. See create_db_engine.
+    # Live numbers are available from registry["db_engine"].pool.stats()
+    set_lazy(registry, "db_engine", lambda: create_pooled_db_engine(settings))
+    set_lazy(registry, "db_session_factory", lambda: session_factory(registry["db_engine"], registry["db_replicas"]))
+
+    # Sites built by SiteBase.from_registry (jobs and scripts) use a null pool
+    # unless worker_db_pooled is set. Then a pool sized by worker_db_pool_size
+    # etc. is kept, which pays off in workers that don't fork per job.
+    if yesish(settings.get("worker_db_pooled"), False):
+        set_lazy(registry, "worker_db_engine", lambda: create_pooled_db_engine(settings, prefix="worker_db_"))
+        set_lazy(registry, "worker_db_session_factory", lambda: session_factory(registry["worker_db_engine"], registry["db_replicas"]))
+    else:
+        set_lazy(registry, "worker_db_engine", lambda: registry["null_pool_db_engine"])
+        set_lazy(registry, "worker_db_session_factory", lambda: registry["null_pool_db_session_factory"])
 
-    registry["get_redis"] = lambda: redis.StrictRedis.from_url(
-        settings["redis_url"], decode_responses=False
+    # Serialization and deadlock failures are retried up to db_retry_attempts
+    # times, by requests and root_context_attempts. Counts by source from
+    # registry["db_retry_stats"].stats()
+    registry["db_retry_stats"] = RetryStats()
+
+    # Redis clients share one connection pool per process
+    redis_pools.configure(
+        max_connections=int(settings.get("redis_max_connections", 50)),
+        timeout=int(settings.get("redis_pool_timeout", 5)),
+        socket_keepalive=yesish(settings.get("redis_socket_keepalive"), True),
+        health_check_interval=int(settings.get("redis_health_check_interval", 30)),
     )
+    registry["redis_pools"] = redis_pools
+    registry["get_redis"] = lambda: redis_pools.get(settings["redis_url"], decode_responses=False)
 
     registry["application_url"] = settings["application_url"]
     registry["application_id"] = settings["application_id"]
@@ -46,10 +214,31 @@ def configure_registry(registry: dict, settings: dict):
     if registry["use_debug_mailer"] :
         registry["sendgrid_smtp_mailer"] = None
     else:
-        registry["sendgrid_smtp_mailer"] = SendgridMailer(
+        set_lazy(registry, "sendgrid_smtp_mailer", lambda: SendgridMailer(
             hostname=settings["mail.host"],
             port=settings["mail.port"],
             sendgrid_api_key=settings["sendgrid_api_key"],
             sendgrid_template_generic=settings["sendgrid_template_generic"],
+        ))
+    registry["rq_write_group_queues"] = settings["rq_write_group_queues"].split()
+
+    # Jobs routed to each write group and the hottest keys, from
+    # registry["rq_write_group_stats"].stats()
+    registry["rq_write_group_stats"] = WriteGroupStats()
+
+    # Password hashing. bcrypt_target_ms calibrates the cost to a latency
+    # budget on this hardware, otherwise bcrypt_rounds is used. Calibrated
+    # workers may pick neighbouring costs, set bcrypt_rounds to pin one.
+    if settings.get("bcrypt_target_ms"):
+        registry["bcrypt_rounds"] = calibrate_bcrypt_rounds(
+            int(settings["bcrypt_target_ms"]) / 1000,
+            min_rounds=int(settings.get("bcrypt_min_rounds", 10)),
         )
-    registry["rq_write_group_queues"] = settings["rq_write_group_queues"].split()
\ No newline at end of file
+    else:
+        registry["bcrypt_rounds"] = int(settings.get("bcrypt_rounds", DEFAULT_BCRYPT_ROUNDS))
+    configure_bcrypt_executor(
+        max_workers=int(settings.get("bcrypt_max_workers", 2)),
+        max_queue=int(settings.get("bcrypt_max_queue", 64)),
+        rounds=registry["bcrypt_rounds"],
+    )
+    registry["get_bcrypt_executor"] = get_bcrypt_executor
\ No newline at end of file
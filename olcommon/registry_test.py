@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+
+from .registry import LazyDict
+from .registry import Registry
+from .registry import configure_registry
+from .registry import set_lazy
+from unittest.mock import MagicMock
+
+import unittest
+
+
+SETTINGS = {
+    "is_debug": "false",
+    "postgresql_url": "postgresql+psycopg2://test@localhost/test",
+    "redis_url": "redis://localhost:6379/0",
+    "application_url": "http://localhost",
+    "application_id": "test",
+    "site_email": "site@example.com",
+    "site_email_from_name": "Test",
+    "site_noreply_email": "noreply@example.com",
+    "mail.host": "localhost",
+    "mail.port": "25",
+    "sendgrid_api_key": "",
+    "sendgrid_template_generic": "",
+    "rq_write_group_queues": "a b",
+}
+
+
+class TestLazyDict(unittest.TestCase):
+    def test_built_once_on_first_access(self):
+        registry = LazyDict()
+        factory = MagicMock(return_value="value")
+        registry.set_lazy("key", factory)
+        factory.assert_not_called()
+        self.assertIn("key", registry)
+        self.assertNotIn("key", registry.keys())
+        self.assertEqual(registry["key"], "value")
+        self.assertEqual(registry.get("key"), "value")
+        self.assertIn("key", registry.keys())
+        factory.assert_called_once_with()
+
+    def test_missing(self):
+        registry = LazyDict()
+        self.assertIsNone(registry.get("key"))
+        self.assertNotIn("key", registry)
+        with self.assertRaises(KeyError):
+            registry["key"]
+
+    def test_set_lazy_replaces_value(self):
+        registry = LazyDict(key="old")
+        registry.set_lazy("key", lambda: "new")
+        self.assertEqual(registry["key"], "new")
+
+    def test_set_lazy_on_dict_is_eager(self):
+        registry = {}
+        set_lazy(registry, "key", lambda: "value")
+        self.assertEqual(registry, {"key": "value"})
+
+    def test_setdefault_builds_lazy_entry(self):
+        registry = LazyDict()
+        registry.set_lazy("key", lambda: "value")
+        self.assertEqual(registry.setdefault("key", "default"), "value")
+        self.assertEqual(registry["key"], "value")
+        self.assertEqual(registry.setdefault("other", "default"), "default")
+        self.assertEqual(registry["other"], "default")
+
+    def test_pop_builds_lazy_entry(self):
+        registry = LazyDict()
+        registry.set_lazy("key", lambda: "value")
+        self.assertEqual(registry.pop("key"), "value")
+        self.assertNotIn("key", registry)
+        self.assertEqual(registry.pop("key", "default"), "default")
+        with self.assertRaises(KeyError):
+            registry.pop("key")
+
+    def test_values_and_items_skip_unbuilt_entries(self):
+        registry = LazyDict(built="built")
+        registry.set_lazy("key", lambda: "value")
+        self.assertEqual(list(registry.values()), ["built"])
+        self.assertEqual(list(registry.items()), [("built", "built")])
+        self.assertEqual(len(registry), 1)
+        registry["key"]
+        self.assertEqual(sorted(registry.values()), ["built", "value"])
+        self.assertEqual(sorted(registry.items()), [("built", "built"), ("key", "value")])
+
+    def test_set_and_delete_drop_factory(self):
+        registry = LazyDict()
+        factory = MagicMock(return_value="value")
+        registry.set_lazy("key", factory)
+        registry["key"] = "set"
+        del registry["key"]
+        self.assertNotIn("key", registry)
+        registry.set_lazy("key", factory)
+        del registry["key"]
+        self.assertNotIn("key", registry)
+        registry.set_lazy("key", factory)
+        registry.clear()
+        self.assertNotIn("key", registry)
+        factory.assert_not_called()
+
+    def test_pyramid_registry(self):
+        registry = Registry("test")
+        registry.set_lazy("key", lambda: "value")
+        self.assertEqual(registry["key"], "value")
+
+
+class TestConfigureRegistry(unittest.TestCase):
+    def test_engines_and_mailer_are_lazy(self):
+        registry = LazyDict(root_class=MagicMock())
+        configure_registry(registry, dict(SETTINGS))
+        for key in ("db_engine", "null_pool_db_engine", "worker_db_engine", "sendgrid_smtp_mailer"):
+            self.assertIn(key, registry)
+            self.assertNotIn(key, registry.keys())
+        self.assertIs(registry["worker_db_session_factory"], registry["null_pool_db_session_factory"])
+        self.assertIs(registry["db_session_factory"].kw["bind"], registry["db_engine"])
+        registry["db_engine"].dispose()
+
+    def test_eager_for_dict(self):
+        registry = {"root_class": MagicMock()}
+        configure_registry(registry, dict(SETTINGS))
+        self.assertIn("db_engine", registry.keys())
+        self.assertIn("sendgrid_smtp_mailer", registry.keys())
+        registry["db_engine"].dispose()
@@ -1,27 +1,74 @@
+from collections import Counter
 from ctq import resource_path_names
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from decimal import Decimal
+from functools import partial
+from hashlib import sha1
 from inspect import ismethod
+from inspect import signature
 from olcommon.jobs import resource_call
 from olcommon.jobs import resource_emit
+from olcommon.jobs import resource_emit_many
+from rq import Callback
+from rq import Queue
+from typing import NamedTuple
+from uuid import UUID
 
+import json
 import logging
+import math
+import time
 
 
 class JobBehavior:
+    """Jobs enqueued once the transaction commits.
+
+    enqueue, enqueue_call, enqueue_in and enqueue_emit take two optional
+    keyword arguments, named so they don't take keyword arguments meant
+    for the job's function:
+
+    job_coalesce: True, or a key, to collapse identical jobs within the
+        transaction. With True the key is made from the queue, function
+        and arguments, or the target, event and data of an emit, which
+        must be serializable by coalesce_key.
+    job_debounce: Seconds in which no identical job is enqueued while one is
+        still queued, across transactions. The window is held in redis
+        and released when a SiteWorker starts the job, when any worker
+        finishes it, or when it expires. A debounced job can't have its
+        own on_success, on_failure or on_stopped callbacks.
+    """
 
     _job_enqueue_pending = None
     _job_enqueue_in_pending = None
     _job_enqueue_call_pending = None
     _job_enqueue_emit_pending = None
+    _job_enqueue_emit_many_pending = None
+    _job_coalesce_keys = None
+
+    # Most targets of one enqueue_emit_many job
+    job_emit_chunk_size = 500
 
     def enqueue(
         self,
         queue,
         func,
         *args,
+        job_coalesce=None,
+        job_debounce=None,
         **kwargs,
     ):
         func, args, kwargs = ensure_function(func, args, kwargs)
-        item = (queue, func, args, kwargs)
+        coalesced, debounce = self._job_coalesce(
+            job_coalesce, job_debounce, lambda: (queue.name, func_name(func), args, kwargs),
+        )
+        if coalesced:
+            return
+        if debounce:
+            kwargs = with_debounce_meta(kwargs, debounce)
+        item = (queue, func, args, kwargs, debounce)
         if self._job_enqueue_pending is None:
             self._job_enqueue_pending = [item]
         else:
@@ -34,10 +81,19 @@ class JobBehavior:
         args=None,
         kwargs=None,
         *enqueue_call_args,
+        job_coalesce=None,
+        job_debounce=None,
         **enqueue_call_kwargs
     ):
         func, args, kwargs = ensure_function(func, args, kwargs)
-        item = (queue, func, args, kwargs, enqueue_call_args, enqueue_call_kwargs)
+        coalesced, debounce = self._job_coalesce(
+            job_coalesce, job_debounce, lambda: (queue.name, func_name(func), args, kwargs),
+        )
+        if coalesced:
+            return
+        if debounce:
+            enqueue_call_kwargs = with_debounce_meta(enqueue_call_kwargs, debounce)
+        item = (queue, func, args, kwargs, enqueue_call_args, enqueue_call_kwargs, debounce)
         if self._job_enqueue_call_pending is None:
             self._job_enqueue_call_pending = [item]
         else:
@@ -49,10 +105,19 @@ class JobBehavior:
         time_delta,
         func,
         *args,
+        job_coalesce=None,
+        job_debounce=None,
         **kwargs,
     ):
         func, args, kwargs = ensure_function(func, args, kwargs)
-        item = (queue, time_delta, func, args, kwargs)
+        coalesced, debounce = self._job_coalesce(
+            job_coalesce, job_debounce, lambda: (queue.name, time_delta, func_name(func), args, kwargs),
+        )
+        if coalesced:
+            return
+        if debounce:
+            kwargs = with_debounce_meta(kwargs, debounce)
+        item = (queue, time_delta, func, args, kwargs, debounce)
         if self._job_enqueue_in_pending is None:
             self._job_enqueue_in_pending = [item]
         else:
@@ -64,52 +129,401 @@ class JobBehavior:
         target,
         event_name,
         data=None,
+        job_coalesce=None,
+        job_debounce=None,
     ):
         target_path = resource_path_names(target)
-        item = (queue, target_path, event_name, data)
+        coalesced, debounce = self._job_coalesce(
+            job_coalesce, job_debounce, lambda: (queue.name, "emit", target_path, event_name, data),
+        )
+        if coalesced:
+            return
+        item = (queue, target_path, event_name, data, debounce)
         if self._job_enqueue_emit_pending is None:
             self._job_enqueue_emit_pending = [item]
         else:
             self._job_enqueue_emit_pending.append(item)
 
+    def enqueue_emit_many(
+        self,
+        queue,
+        targets,
+        event_name,
+        data=None,
+        chunk_size=None,
+    ):
+        """Emit an event on many resources with resource_emit_many jobs of
+        at most chunk_size (default job_emit_chunk_size) targets each.
+
+        Targets are resources or their path names. Duplicates are dropped
+        and the paths sorted so resources in the same container share a job.
+        """
+        target_paths = sorted({
+            tuple(target) if isinstance(target, (tuple, list)) else resource_path_names(target)
+            for target in targets
+        })
+        if not target_paths:
+            return
+        item = (queue, target_paths, event_name, data, chunk_size or self.job_emit_chunk_size)
+        if self._job_enqueue_emit_many_pending is None:
+            self._job_enqueue_emit_many_pending = [item]
+        else:
+            self._job_enqueue_emit_many_pending.append(item)
+
+    def _job_coalesce(self, coalesce, debounce, get_key_parts):
+        """Returns: (coalesced, debounce) where coalesced is True if an
+        identical job is already pending and debounce is the (redis key,
+        seconds) of the debounce window to claim, if any
+        """
+        if not coalesce and not debounce:
+            return (False, None)
+        if isinstance(coalesce, str):
+            key = coalesce
+        else:
+            try:
+                key = coalesce_key(*get_key_parts())
+            except TypeError as e:
+                raise TypeError(f"{e}. Pass the job's key as job_coalesce") from e
+        # A dict rather than a set so keys are kept in the order added, see
+        # restore_pending_commit_work
+        if self._job_coalesce_keys is None:
+            self._job_coalesce_keys = {key: None}
+        elif key in self._job_coalesce_keys:
+            return (True, None)
+        else:
+            self._job_coalesce_keys[key] = None
+        if not debounce:
+            return (False, None)
+        return (False, (JOB_DEBOUNCE_KEY_PREFIX + key, debounce))
+
+    def has_pending_commit_work(self):
+        return bool(
+            self._job_enqueue_pending
+            or self._job_enqueue_call_pending
+            or self._job_enqueue_in_pending
+            or self._job_enqueue_emit_pending
+            or self._job_enqueue_emit_many_pending
+            or super().has_pending_commit_work()
+        )
+
+    _job_pending_attributes = (
+        "_job_enqueue_pending",
+        "_job_enqueue_call_pending",
+        "_job_enqueue_in_pending",
+        "_job_enqueue_emit_pending",
+        "_job_enqueue_emit_many_pending",
+        "_job_coalesce_keys",
+    )
+
+    def pending_commit_work_snapshot(self):
+        # The pending lists and coalesce keys are only added to within a
+        # transaction, so their lengths are enough to restore them
+        snapshot = super().pending_commit_work_snapshot()
+        for name in self._job_pending_attributes:
+            snapshot[name] = len(getattr(self, name) or ())
+        return snapshot
+
+    def restore_pending_commit_work(self, snapshot):
+        for name in self._job_pending_attributes:
+            pending = getattr(self, name)
+            length = snapshot.get(name, 0)
+            if not pending or len(pending) <= length:
+                continue
+            if isinstance(pending, list):
+                del pending[length:]
+            else:
+                for key in list(pending)[length:]:
+                    del pending[key]
+        super().restore_pending_commit_work(snapshot)
+
+    # Most jobs written to redis in one pipeline round trip
+    job_enqueue_pipeline_size = 1000
+
     def on_after_commit(self, success):
-        logger = self.get_logger()
-
-        if success:
-            # Process enqueue
-            if self._job_enqueue_pending:
-                for item in self._job_enqueue_pending:
-                    (queue, func, args, kwargs) = item
-                    job = queue.enqueue(func, *args, **kwargs)
-                    logger.debug(f"Enqueued: {job.func_name} {args} {kwargs}: {job.get_id()} ({queue.name})")
-
-            # Process enqueue_call
-            if self._job_enqueue_call_pending:
-                for item in self._job_enqueue_call_pending:
-                    (queue, func, args, kwargs, enqueue_call_args, enqueue_call_kwargs) = item
-                    job = queue.enqueue_call(func, args, kwargs, *enqueue_call_args, **enqueue_call_kwargs)
-                    logger.debug(f"Enqueued: {job.func_name} {args} {kwargs}: {job.get_id()} ({queue.name})")
-
-            # Process enqueu_in
-            if self._job_enqueue_in_pending:
-                for item in self._job_enqueue_in_pending:
-                    (queue, time_delta, func, args, kwargs) = item
-                    assert not isinstance(queue, str), f"queue must be a queue, not a string: {queue}"
-                    job = queue.enqueue_in(time_delta, func, *args, **kwargs)
-                    logger.debug(f"Enqueued in {time_delta.total_seconds():.3f}s: {job.func_name} {args} {kwargs}: {job.get_id()} ({queue.name})")
-            
-            if self._job_enqueue_emit_pending:
-                for item in self._job_enqueue_emit_pending:
-                    (queue, target_path, event_name, data) = item
-                    job = queue.enqueue(resource_emit, target_path, event_name, data)
-                    logger.debug(f'Enqueued emit "{event_name}" on {target_path} with {data}: {job.get_id()} ({queue.name})')
-
-        self._job_enqueue_pending = None
-        self._job_enqueue_call_pending = None
-        self._job_enqueue_in_pending = None
+        try:
+            if success:
+                self.flush_pending_jobs()
+        finally:
+            # Cleared even when the flush fails, so a reused site doesn't
+            # enqueue these jobs with its next transaction
+            self._job_enqueue_pending = None
+            self._job_enqueue_call_pending = None
+            self._job_enqueue_in_pending = None
+            self._job_enqueue_emit_pending = None
+            self._job_enqueue_emit_many_pending = None
+            self._job_coalesce_keys = None
 
         super().on_after_commit(success)
 
+    def flush_pending_jobs(self):
+        """Enqueue the jobs pending from the committed transaction.
+
+        Jobs are written with Queue.enqueue_many through one redis pipeline
+        per connection. Jobs with dependencies or a uniqueness check need
+        their own round trips, so are enqueued one at a time afterwards.
+        """
+        started = time.perf_counter()
+        jobs = []  # (queue, EnqueueData or ScheduledData or an enqueue partial, debounce)
+
+        for (queue, func, args, kwargs, debounce) in self._job_enqueue_pending or ():
+            data = enqueue_data(func, args, kwargs)
+            if data is None:
+                data = partial(queue.enqueue, func, *args, **kwargs)
+            jobs.append((queue, data, debounce))
+
+        for item in self._job_enqueue_call_pending or ():
+            (queue, func, args, kwargs, enqueue_call_args, enqueue_call_kwargs, debounce) = item
+            data = enqueue_call_data(func, args, kwargs, enqueue_call_args, enqueue_call_kwargs)
+            if data is None:
+                data = partial(queue.enqueue_call, func, args, kwargs, *enqueue_call_args, **enqueue_call_kwargs)
+            jobs.append((queue, data, debounce))
+
+        if self._job_enqueue_in_pending:
+            now = datetime.now(timezone.utc)
+            for (queue, time_delta, func, args, kwargs, debounce) in self._job_enqueue_in_pending:
+                assert not isinstance(queue, str), f"queue must be a queue, not a string: {queue}"
+                jobs.append((queue, ScheduledData(now + time_delta, func, args, kwargs), debounce))
+
+        for (queue, target_path, event_name, data, debounce) in self._job_enqueue_emit_pending or ():
+            options = with_debounce_meta({}, debounce) if debounce else {}
+            jobs.append((queue, Queue.prepare_data(resource_emit, (target_path, event_name, data), **options), debounce))
+
+        for (queue, target_paths, event_name, data, chunk_size) in self._job_enqueue_emit_many_pending or ():
+            for start in range(0, len(target_paths), chunk_size):
+                chunk = target_paths[start:start + chunk_size]
+                jobs.append((queue, Queue.prepare_data(resource_emit_many, (chunk, event_name, data)), None))
+
+        jobs, debounced = claim_debounce_windows(jobs)
+
+        pipelines = {}
+        direct = []
+        for (queue, data, debounce) in jobs:
+            if isinstance(data, partial):
+                direct.append((queue, data))
+                continue
+            pipeline = pipelines.get(id(queue.connection))
+            if pipeline is None:
+                pipeline = pipelines[id(queue.connection)] = EnqueuePipeline(queue.connection)
+            pipeline.add(queue, data)
+
+        counts = Counter()
+        try:
+            for pipeline in pipelines.values():
+                counts.update(pipeline.execute(self.job_enqueue_pipeline_size))
+            for (queue, enqueue) in direct:
+                enqueue()
+                counts[queue.name] += 1
+        except Exception:
+            # Don't hold off identical jobs for jobs which may not be queued
+            release_debounce_windows(jobs, self.get_logger())
+            raise
+
+        if counts or debounced:
+            elapsed = (time.perf_counter() - started) * 1000
+            by_queue = ", ".join(f"{name}: {count}" for (name, count) in counts.items())
+            self.get_logger().debug(
+                f"Enqueued {sum(counts.values())} jobs in {elapsed:.1f}ms "
+                f"with {len(pipelines)} pipelines ({by_queue}), {debounced} debounced"
+            )
+
+
+class ScheduledData(NamedTuple):
+    """A job to be written with Queue.enqueue_at"""
+
+    at: datetime
+    func: object
+    args: tuple
+    kwargs: dict
+
+
+class EnqueuePipeline:
+    """Jobs to enqueue through one redis connection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queues = {}
+
+    def add(self, queue, data):
+        if queue.name in self.queues:
+            self.queues[queue.name][1].append(data)
+        else:
+            self.queues[queue.name] = (queue, [data])
+
+    def execute(self, size):
+        """Returns: The number of jobs enqueued on each queue"""
+        counts = Counter()
+        pipe = self.connection.pipeline()
+        pending = 0
+        for (queue, datas) in self.queues.values():
+            for start in range(0, len(datas), size):
+                chunk = datas[start:start + size]
+                write_jobs(queue, chunk, pipe)
+                pending += len(chunk)
+                if pending >= size:
+                    pipe.execute()
+                    pending = 0
+            counts[queue.name] += len(datas)
+        if pending:
+            pipe.execute()
+        return counts
+
+
+def write_jobs(queue, datas, pipe):
+    enqueue_datas = [d for d in datas if not isinstance(d, ScheduledData)]
+    if enqueue_datas:
+        queue.enqueue_many(enqueue_datas, pipeline=pipe)
+    for data in datas:
+        if isinstance(data, ScheduledData):
+            queue.enqueue_at(data.at, data.func, *data.args, pipeline=pipe, **data.kwargs)
+
+
+# Options of Queue.enqueue_call after func, args and kwargs, in order
+ENQUEUE_CALL_OPTIONS = tuple(signature(Queue.enqueue_call).parameters)[4:]
+
+# Options which need round trips of their own so can't be pipelined
+UNPIPELINED_OPTIONS = frozenset(("depends_on", "unique", "pipeline"))
+
+
+def enqueue_data(func, args, kwargs):
+    """Returns: EnqueueData for queue.enqueue(func, *args, **kwargs), or None
+    if the job can't be pipelined
+    """
+    parsed = Queue.parse_args(func, *args, **kwargs)
+    if parsed.depends_on or parsed.unique or parsed.pipeline is not None:
+        return None
+    return Queue.prepare_data(
+        parsed.func,
+        parsed.args,
+        parsed.kwargs,
+        timeout=parsed.timeout,
+        result_ttl=parsed.result_ttl,
+        ttl=parsed.ttl,
+        failure_ttl=parsed.failure_ttl,
+        description=parsed.description,
+        job_id=parsed.job_id,
+        at_front=parsed.at_front,
+        meta=parsed.meta,
+        retry=parsed.retry,
+        on_success=parsed.on_success,
+        on_failure=parsed.on_failure,
+        on_stopped=parsed.on_stopped,
+        repeat=parsed.repeat,
+        webhooks=parsed.webhooks,
+    )
+
+
+def enqueue_call_data(func, args, kwargs, enqueue_call_args, enqueue_call_kwargs):
+    """Returns: EnqueueData for queue.enqueue_call(...), or None if the job
+    can't be pipelined
+    """
+    options = dict(zip(ENQUEUE_CALL_OPTIONS, enqueue_call_args), **enqueue_call_kwargs)
+    if any(options.get(name) for name in UNPIPELINED_OPTIONS):
+        return None
+    options = {name: value for (name, value) in options.items() if name not in UNPIPELINED_OPTIONS}
+    return Queue.prepare_data(func, args, kwargs, **options)
+
+
+JOB_DEBOUNCE_KEY_PREFIX = "olcommon:job-debounce:"
+
+
+def func_name(func):
+    if isinstance(func, str):
+        return func
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def coalesce_key(*parts):
+    """Returns: A key for a job made from its queue, function and
+    arguments, the same in every process. The arguments need not be
+    hashable but must be JSON serializable, or UUIDs, dates, times,
+    decimals, sets or bytes.
+
+    Raises:
+        TypeError: If an argument can't be serialized
+    """
+    serialized = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=coalesce_key_default)
+    return sha1(serialized.encode("utf-8")).hexdigest()
+
+
+def coalesce_key_default(value):
+    if isinstance(value, (UUID, date, timedelta, Decimal)):
+        # datetime is a date
+        return [type(value).__name__, str(value)]
+    elif isinstance(value, (set, frozenset)):
+        return ["set", sorted(value, key=coalesce_key)]
+    elif isinstance(value, bytes):
+        return ["bytes", value.hex()]
+    raise TypeError(f"Can't make a job key from {type(value).__name__} {value!r}")
+
+
+def release_debounce(job, connection, *args):
+    """An rq callback releasing the job's debounce window as it finishes.
+    Set for each debounced job so every kind of worker releases it.
+    """
+    debounce_key = job.meta.get("debounce_key")
+    if debounce_key:
+        connection.delete(debounce_key)
+
+
+DEBOUNCE_CALLBACKS = ("on_success", "on_failure", "on_stopped")
+
+
+def with_debounce_meta(kwargs, debounce):
+    """Returns: kwargs with the debounce key added to the job's meta and
+    callbacks releasing it
+    """
+    if any(kwargs.get(name) for name in DEBOUNCE_CALLBACKS):
+        raise ValueError("A debounced job can't have its own on_success, on_failure or on_stopped callbacks")
+    callback = Callback(release_debounce)
+    return dict(
+        kwargs,
+        meta=dict(kwargs.get("meta") or {}, debounce_key=debounce[0]),
+        **{name: callback for name in DEBOUNCE_CALLBACKS},
+    )
+
+
+def claim_debounce_windows(jobs):
+    """Claim the debounce window of each debounced job, with one round trip
+    per redis connection.
+
+    Returns: (jobs, debounced) the jobs which claimed their window or were
+        not debounced, and the number dropped as an identical job is queued
+    """
+    pipes = {}
+    for (queue, data, debounce) in jobs:
+        if debounce:
+            pipe = pipes.get(id(queue.connection))
+            if pipe is None:
+                pipe = pipes[id(queue.connection)] = queue.connection.pipeline(transaction=False)
+            (key, seconds) = debounce
+            pipe.set(key, 1, nx=True, ex=int(math.ceil(seconds)))
+    if not pipes:
+        return (jobs, 0)
+    claimed = {connection_id: iter(pipe.execute()) for (connection_id, pipe) in pipes.items()}
+    kept = [
+        job for job in jobs
+        if not job[2] or next(claimed[id(job[0].connection)])
+    ]
+    return (kept, len(jobs) - len(kept))
+
+
+def release_debounce_windows(jobs, logger):
+    """Delete the debounce windows claimed for jobs, with one round trip
+    per redis connection
+    """
+    pipes = {}
+    for (queue, data, debounce) in jobs:
+        if debounce:
+            pipe = pipes.get(id(queue.connection))
+            if pipe is None:
+                pipe = pipes[id(queue.connection)] = queue.connection.pipeline(transaction=False)
+            pipe.delete(debounce[0])
+    for pipe in pipes.values():
+        try:
+            pipe.execute()
+        except Exception:
+            logger.exception("Failed to release the debounce windows of jobs not enqueued")
+
 
 def ensure_function(func, args, kwargs):
     if ismethod(func):
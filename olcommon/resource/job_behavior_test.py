@@ -0,0 +1,279 @@
+# -*- coding:utf-8 -*-
+
+from ..jobs import resource_emit
+from ..jobs import resource_emit_many
+from .job_behavior import JobBehavior
+from .job_behavior import coalesce_key
+from .job_behavior import release_debounce
+from datetime import datetime
+from datetime import timedelta
+from rq import Queue
+from rq import SimpleWorker
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from uuid import UUID
+
+import fakeredis
+import redis.exceptions
+import unittest
+
+
+class Base:
+    def on_after_commit(self, success):
+        pass
+
+    def has_pending_commit_work(self):
+        return False
+
+
+class Site(JobBehavior, Base):
+    def __init__(self):
+        self.get_logger = MagicMock()
+
+
+def make_queue(name, connection):
+    queue = MagicMock()
+    queue.name = name
+    queue.connection = connection
+    return queue
+
+
+def make_target(name):
+    root = MagicMock(__name__=None, __parent__=None)
+    return MagicMock(__name__=name, __parent__=root)
+
+
+class TestFlushPendingJobs(unittest.TestCase):
+    def test_one_pipeline_per_connection(self):
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+        queue_a = make_queue("a", connection)
+        queue_b = make_queue("b", connection)
+        site = Site()
+        site.enqueue_emit(queue_a, make_target("x"), "changed", {"n": 1})
+        site.enqueue(queue_a, "os.getcwd", job_timeout=5)
+        site.enqueue_call(queue_b, "os.getcwd", None, None, 7)
+        site.enqueue_in(queue_b, timedelta(seconds=60), "os.getcwd")
+        site.on_after_commit(True)
+
+        connection.pipeline.assert_called_once_with()
+        pipe.execute.assert_called_once_with()
+        ((datas,), kwargs) = queue_a.enqueue_many.call_args
+        self.assertIs(kwargs["pipeline"], pipe)
+        self.assertEqual([d.func for d in datas], ["os.getcwd", resource_emit])
+        self.assertEqual(datas[0].timeout, 5)
+        self.assertEqual(datas[1].args, (("", "x"), "changed", {"n": 1}))
+        ((datas,), kwargs) = queue_b.enqueue_many.call_args
+        self.assertEqual(datas[0].timeout, 7)
+        queue_b.enqueue_at.assert_called_once()
+        self.assertIs(queue_b.enqueue_at.call_args.kwargs["pipeline"], pipe)
+        queue_a.enqueue.assert_not_called()
+        self.assertFalse(site.has_pending_commit_work())
+
+    def test_dependent_jobs_enqueued_after_pipeline(self):
+        connection = MagicMock()
+        queue = make_queue("a", connection)
+        site = Site()
+        site.enqueue(queue, "os.getcwd", depends_on="job-id")
+        site.enqueue_emit(queue, make_target("x"), "changed")
+        calls = []
+        connection.pipeline.return_value.execute.side_effect = lambda: calls.append("pipeline")
+        queue.enqueue.side_effect = lambda *args, **kwargs: calls.append("enqueue")
+        site.on_after_commit(True)
+        self.assertEqual(calls, ["pipeline", "enqueue"])
+        queue.enqueue.assert_called_once_with("os.getcwd", depends_on="job-id")
+
+    def test_pipeline_chunked(self):
+        connection = MagicMock()
+        queue = make_queue("a", connection)
+        site = Site()
+        site.job_enqueue_pipeline_size = 2
+        for name in "abcde":
+            site.enqueue_emit(queue, make_target(name), "changed")
+        site.on_after_commit(True)
+        self.assertEqual([len(c.args[0]) for c in queue.enqueue_many.call_args_list], [2, 2, 1])
+        self.assertEqual(connection.pipeline.return_value.execute.call_count, 3)
+
+    def test_nothing_enqueued_on_abort(self):
+        connection = MagicMock()
+        queue = make_queue("a", connection)
+        site = Site()
+        site.enqueue_emit(queue, make_target("x"), "changed")
+        site.on_after_commit(False)
+        connection.pipeline.assert_not_called()
+        self.assertFalse(site.has_pending_commit_work())
+
+
+class TestCoalesce(unittest.TestCase):
+    def test_identical_jobs_collapse(self):
+        queue = make_queue("a", MagicMock())
+        site = Site()
+        for n in (1, 1, 2):
+            site.enqueue(queue, "os.getcwd", n, job_coalesce=True)
+            site.enqueue_emit(queue, make_target("x"), "changed", {"n": n}, job_coalesce=True)
+        site.enqueue(queue, "os.getcwd", 1)
+        self.assertEqual(len(site._job_enqueue_pending), 3)
+        self.assertEqual(len(site._job_enqueue_emit_pending), 2)
+
+    def test_explicit_key(self):
+        queue = make_queue("a", MagicMock())
+        site = Site()
+        site.enqueue(queue, "os.getcwd", 1, job_coalesce="recompute")
+        site.enqueue(queue, "os.getcwd", 2, job_coalesce="recompute")
+        self.assertEqual(len(site._job_enqueue_pending), 1)
+
+    def test_keys_reset_after_commit(self):
+        queue = make_queue("a", MagicMock())
+        site = Site()
+        site.enqueue(queue, "os.getcwd", job_coalesce=True)
+        site.on_after_commit(False)
+        site.enqueue(queue, "os.getcwd", job_coalesce=True)
+        self.assertEqual(len(site._job_enqueue_pending), 1)
+
+    def test_debounced_while_queued(self):
+        connection = MagicMock()
+        claim_pipe = MagicMock()
+        claim_pipe.execute.return_value = [True, None]
+        enqueue_pipe = MagicMock()
+        connection.pipeline.side_effect = lambda transaction=True: claim_pipe if not transaction else enqueue_pipe
+        queue = make_queue("a", connection)
+        site = Site()
+        site.enqueue(queue, "os.getcwd", 1, job_debounce=30)
+        site.enqueue_emit(queue, make_target("x"), "changed", job_debounce=2.5)
+        site.enqueue(queue, "os.getcwd", 3)
+        site.on_after_commit(True)
+
+        self.assertEqual([c.kwargs for c in claim_pipe.set.call_args_list], [{"nx": True, "ex": 30}, {"nx": True, "ex": 3}])
+        ((datas,), _) = queue.enqueue_many.call_args
+        self.assertEqual([d.args for d in datas], [(1,), (3,)])
+        self.assertEqual(datas[0].meta, {"debounce_key": claim_pipe.set.call_args_list[0].args[0]})
+        self.assertEqual(datas[0].on_success.func, release_debounce)
+
+
+class TestCoalesceKey(unittest.TestCase):
+    def test_deterministic(self):
+        uuid = UUID("12345678-1234-5678-1234-567812345678")
+        self.assertEqual(
+            coalesce_key("a", "f", (uuid, {"b": 1, "a": 2}), {"s": {3, 1, 2}}),
+            coalesce_key("a", "f", (uuid, {"a": 2, "b": 1}), {"s": {2, 3, 1}}),
+        )
+        # Pinned so a change to the serialization is noticed, as keys are
+        # shared between processes through redis
+        self.assertEqual(coalesce_key("a", 1, datetime(2020, 1, 2)), "c41f2974c9ef1f8b1afc6c030fb81a4543147167")
+
+    def test_distinguishes_types(self):
+        self.assertNotEqual(coalesce_key(1), coalesce_key("1"))
+        self.assertNotEqual(coalesce_key(b"a"), coalesce_key("a"))
+
+    def test_unserializable(self):
+        with self.assertRaises(TypeError):
+            coalesce_key(object())
+        site = Site()
+        with self.assertRaisesRegex(TypeError, "Pass the job's key as job_coalesce"):
+            site.enqueue(make_queue("a", MagicMock()), "os.getcwd", object(), job_coalesce=True)
+        site.enqueue(make_queue("a", MagicMock()), "os.getcwd", object(), job_coalesce="key")
+
+    def test_debounce_with_own_callbacks(self):
+        site = Site()
+        with self.assertRaises(ValueError):
+            site.enqueue(make_queue("a", MagicMock()), "os.getcwd", job_debounce=30, on_success="os.getcwd")
+
+
+class TestDebounceWithWorker(unittest.TestCase):
+    def test_released_by_any_worker(self):
+        connection = fakeredis.FakeRedis()
+        queue = Queue("a", connection=connection)
+        site = Site()
+        site.enqueue(queue, "os.getcwd", job_debounce=30)
+        site.enqueue(queue, "os.rmdir", "/no/such/dir", job_debounce=30)
+        site.on_after_commit(True)
+        self.assertEqual(len(connection.keys("olcommon:job-debounce:*")), 2)
+
+        # Held while queued
+        site.enqueue(queue, "os.getcwd", job_debounce=30)
+        site.on_after_commit(True)
+        self.assertEqual(queue.count, 2)
+
+        SimpleWorker([queue], connection=connection).work(burst=True)
+        self.assertEqual(connection.keys("olcommon:job-debounce:*"), [])
+        self.assertEqual(queue.finished_job_registry.count, 1)
+        self.assertEqual(queue.failed_job_registry.count, 1)
+
+        site.enqueue(queue, "os.getcwd", job_debounce=30)
+        site.on_after_commit(True)
+        self.assertEqual(queue.count, 1)
+
+
+class TestDebounceEnqueueFailure(unittest.TestCase):
+    def test_windows_released_when_enqueue_fails(self):
+        connection = fakeredis.FakeRedis()
+        queue = Queue("a", connection=connection)
+        site = Site()
+        site.enqueue(queue, "os.getcwd", job_debounce=30)
+        site.enqueue(queue, "os.path.join", "a", job_debounce=30)
+        with patch.object(Queue, "enqueue_many", side_effect=redis.exceptions.ConnectionError()):
+            with self.assertRaises(redis.exceptions.ConnectionError):
+                site.on_after_commit(True)
+        self.assertEqual(connection.keys("olcommon:job-debounce:*"), [])
+
+        site.enqueue(queue, "os.getcwd", job_debounce=30)
+        site.on_after_commit(True)
+        self.assertEqual(queue.count, 1)
+
+
+class TestJobKeywordArguments(unittest.TestCase):
+    def test_coalesce_and_debounce_passed_to_job(self):
+        connection = fakeredis.FakeRedis()
+        queue = Queue("a", connection=connection)
+        site = Site()
+        site.enqueue(queue, "builtins.dict", coalesce=True, debounce=5)
+        site.on_after_commit(True)
+        (job,) = queue.jobs
+        self.assertEqual(job.kwargs, {"coalesce": True, "debounce": 5})
+        self.assertEqual(connection.keys("olcommon:job-debounce:*"), [])
+
+
+class TestFlushWithRedis(unittest.TestCase):
+    def test_flush_coalesce_and_run(self):
+        connection = fakeredis.FakeRedis()
+        queue = Queue("a", connection=connection)
+        emit_queue = Queue("emit", connection=connection)
+        site = Site()
+        for n in range(5):
+            site.enqueue(queue, "os.getcwd", job_coalesce=True)
+            site.enqueue(queue, "os.path.join", "a", str(n))
+        site.enqueue_call(queue, "os.path.join", ("a", "b"), job_id="call")
+        site.enqueue_in(queue, timedelta(hours=1), "os.getcwd")
+        site.enqueue_emit(emit_queue, make_target("x"), "changed", job_coalesce=True)
+        site.enqueue_emit(emit_queue, make_target("x"), "changed", job_coalesce=True)
+        site.enqueue_emit_many(emit_queue, [("", str(n)) for n in range(5)], "changed", chunk_size=2)
+        site.on_after_commit(True)
+
+        self.assertEqual(queue.count, 7)
+        self.assertEqual(queue.scheduled_job_registry.count, 1)
+        self.assertEqual(emit_queue.count, 4)
+        self.assertEqual(queue.fetch_job("call").args, ("a", "b"))
+
+        SimpleWorker([queue], connection=connection).work(burst=True)
+        self.assertEqual(queue.count, 0)
+        self.assertEqual(queue.finished_job_registry.count, 7)
+        self.assertEqual(queue.fetch_job("call").return_value(), "a/b")
+
+
+class TestEnqueueEmitMany(unittest.TestCase):
+    def test_chunked_sorted_and_deduplicated(self):
+        queue = make_queue("a", MagicMock())
+        site = Site()
+        targets = [make_target("c"), ("", "b"), make_target("a"), ("", "b"), make_target("d")]
+        site.enqueue_emit_many(queue, targets, "changed", {"n": 1}, chunk_size=2)
+        self.assertTrue(site.has_pending_commit_work())
+        site.on_after_commit(True)
+        ((datas,), _) = queue.enqueue_many.call_args
+        self.assertEqual([d.func for d in datas], [resource_emit_many] * 2)
+        self.assertEqual(
+            [d.args for d in datas],
+            [
+                ([("", "a"), ("", "b")], "changed", {"n": 1}),
+                ([("", "c"), ("", "d")], "changed", {"n": 1}),
+            ],
+        )
@@ -1,10 +1,8 @@
 from ctq import acquire
 from functools import lru_cache
-from uuid import UUID
-from hashlib import md5
+from olcommon.write_groups import write_group_index
 
 import rq
-import math
 
 
 class RqBehavior:
@@ -13,26 +11,14 @@ class RqBehavior:
     def get_queue(self, name):
         return rq.Queue(name, connection=acquire().redis)
 
-    @lru_cache(1000)
     def get_write_queue(self, key):
         group_name = self.get_write_group_name(key)
+        write_group_stats = acquire().registry.get("rq_write_group_stats")
+        if write_group_stats is not None:
+            write_group_stats.count(group_name, key)
         return self.get_queue(group_name)
 
     def get_write_group_name(self, key):
-        # Cast our key to md5 hashable bytes
-        if isinstance(key, UUID):
-            key = key.bytes
-        elif isinstance(key, str):
-            key = key.encode('utf-8')
-        else:
-            raise NotImplementedError(f"Not implemented for key of type {type(key)}")
-
-        # Calculate a hash of key that is a float between 0.0 and 1.0
-        key_hash = md5(key).digest()
-        key_hash = key_hash[0]
-        key_hash = key_hash / 256
-
-        # Convert the key_hash to a group name
+        # Jump consistent hash of the key, see olcommon.write_groups
         write_groups = acquire().registry["rq_write_group_queues"]
-        index = int(math.floor(key_hash * len(write_groups)))
-        return write_groups[index]
\ No newline at end of file
+        return write_groups[write_group_index(key, len(write_groups))]
@@ -1,64 +1,167 @@
 from ctq import ResourceCache
 from pyramid.authorization import Everyone
 
+import json
 import logging
 import pyramid_mailer
 import zope.sqlalchemy
 import transaction as zope_transaction
 import transaction.interfaces as zope_transaction_interfaces
 
+
+# Values of Transaction.status, which the transaction package documents as
+# strings but doesn't export
+TRANSACTION_COMMITTING = "Committing"
+TRANSACTION_COMMITTED = "Committed"
+
+
+class SiteSynchronizer:
+    """A transaction synchronizer calling a site's after commit and after
+    abort hooks.
+    """
+
+    def __init__(self, site):
+        self.site = site
+
+    def newTransaction(self, tx):
+        pass
+
+    def beforeCompletion(self, tx):
+        pass
+
+    def afterCompletion(self, tx):
+        # A failed commit completes while still COMMITTING, the abort which
+        # follows it completes again as COMMITFAILED
+        if tx.status == TRANSACTION_COMMITTED:
+            self.site.on_after_commit(True)
+        elif tx.status == TRANSACTION_COMMITTING:
+            self.site.on_after_commit(False)
+        else:
+            self.site.on_after_abort_hook()
+
+
 class SiteBase(object):
     """A primitive site"""
     
     user_email_store_lower_case = True
 
-    def __init__(self, *args, registry, transaction, db_session, redis, mailer, get_logger, **kwargs):
+    _db_session = None
+    _db_session_loader = None
+    _transaction_synchronizer = None
+
+    use_transaction_synchronizer = False
+
+    def __init__(self, *args, registry, transaction, db_session=None, db_session_loader=None, redis, mailer, get_logger, **kwargs):
         super().__init__(*args, **kwargs)
         self.registry = registry
         self.mailer = mailer
         self.transaction = transaction
         self.db_session = db_session
+        self._db_session_loader = db_session_loader
         self.redis = redis
         self.get_logger = get_logger
 
+    @property
+    def db_session(self):
+        """The database session. If the site was given a db_session_loader
+        the session is only created when first used.
+        """
+        if self._db_session is None and self._db_session_loader is not None:
+            self._db_session = self._db_session_loader()
+            self._db_session_loader = None
+        return self._db_session
+
+    @db_session.setter
+    def db_session(self, value):
+        self._db_session = value
+
     def init_transaction(self):
+        """Register the site's transaction hooks, once per transaction.
+
+        With use_transaction_synchronizer the after commit and after abort
+        hooks are handled by a single synchronizer registered with the
+        transaction manager for the life of the site.
+        """
         try:
             tx = self.transaction.get()
         except zope_transaction_interfaces.NoTransaction:
             self.transaction.begin()
             tx = self.transaction.get()
 
-        before_commit_hooks = (h[0] for h in tx.getBeforeCommitHooks())
-        if self.on_before_commit not in before_commit_hooks:
-            tx.addBeforeCommitHook(self.on_before_commit)
-
-        after_commit_hooks = (h[0] for h in tx.getAfterCommitHooks())
-        if self.on_after_commit not in after_commit_hooks:
+        try:
+            tx.data(self)
+            return  # Already initialised for this transaction
+        except KeyError:
+            tx.set_data(self, True)
+
+        tx.addBeforeCommitHook(self.on_before_commit)
+        if self.use_transaction_synchronizer:
+            if self._transaction_synchronizer is None:
+                self._transaction_synchronizer = SiteSynchronizer(self)
+                self.transaction.registerSynch(self._transaction_synchronizer)
+        else:
             tx.addAfterCommitHook(self.on_after_commit)
-
-        after_abort_hooks = (h[0] for h in tx.getAfterAbortHooks())
-        if self.on_after_abort_hook not in after_abort_hooks:
             tx.addAfterAbortHook(self.on_after_abort_hook)
 
         self.transaction.begin = lambda: tx  # Neuter the begin method.
 
+    def begin_next_transaction(self):
+        """Begin a new transaction once the current one has committed, for a
+        site which is used for more than one transaction.
+        """
+        # init_transaction neuters begin so code using the site can't start
+        # another transaction. Restore it to begin the next one.
+        vars(self.transaction).pop("begin", None)
+        self.init_transaction()
+
     def on_before_commit(self):
         return
 
+    def has_pending_commit_work(self):
+        """Returns: True if on_before_commit or on_after_commit have work to
+        do. Read only requests with no pending work and no database changes
+        are aborted rather than committed, skipping the commit hooks.
+        Behaviors which queue work for the commit hooks extend this.
+        """
+        return False
+
+    def pending_commit_work_snapshot(self):
+        """Returns: A snapshot of the work queued for the commit hooks, for
+        restore_pending_commit_work when part of a transaction is rolled
+        back to a savepoint. Behaviors which queue work extend this.
+        """
+        return {}
+
+    def restore_pending_commit_work(self, snapshot):
+        """Drop the work queued for the commit hooks since snapshot was
+        taken by pending_commit_work_snapshot
+        """
+        return
+
     def on_after_commit(self, success):
         return
 
     def on_after_abort_hook(self):
-        # Close down this resource tree from furuther use.
+        # Close down this resource tree from furuther use. Closing the session
+        # returns its connection to the pool.
+        if self._db_session is not None:
+            self._db_session.close()
+        self._db_session_loader = None
         self.transaction = None
         self.redis = None
         if isinstance(self, ResourceCache):
             self.resource_cache_clear()
 
     @classmethod
-    def from_registry(cls, registry, *args, **kwargs):
+    def from_registry(cls, registry, *args, read_only=False, **kwargs):
+        """Create a site object for a job or script.
+
+        With read_only the database reads go to a replica if
+        postgresql_replica_urls is set.
+        """
         tm = zope_transaction.TransactionManager(explicit=True)
-        db_session = registry["null_pool_db_session_factory"]()
+        db_session = registry["worker_db_session_factory"]()
+        db_session.info["read_only"] = read_only
         zope.sqlalchemy.register(db_session, transaction_manager=tm, keep_session=True)
 
         class MailerTmp(pyramid_mailer.Mailer):
@@ -89,7 +192,7 @@ class SiteBase(object):
         """Create a site object from a request object"""
         site = cls(**{
             'registry': request.registry,
-            'db_session': request.db_session,
+            'db_session_loader': lambda: request.db_session,
             'redis': request.redis,
             'mailer': request.mailer,
             'transaction': request.tm,
@@ -105,6 +208,26 @@ class SiteBase(object):
     def get_principals(self, identity, user):
         return [Everyone]
 
+    # Claims which differ between tokens of the same grant, left out of the
+    # default principals cache key
+    principals_cache_ignored_claims = frozenset(("exp", "iat", "nbf", "jti"))
+
+    def principals_cache_key(self, identity, user):
+        """Returns: A hashable key of everything get_principals depends on,
+        or None to not cache the principals.
+
+        By default this is the user's nounce and every claim of the identity
+        apart from principals_cache_ignored_claims, so principals which
+        depend on scope, aud or impersonation claims are not shared between
+        tokens. Override to return a coarser key when get_principals only
+        depends on the user.
+        """
+        nounce = getattr(user, "nounce", None)
+        if identity is None or nounce is None:
+            return None
+        claims = {k: v for (k, v) in identity.items() if k not in self.principals_cache_ignored_claims}
+        return (nounce, json.dumps(claims, sort_keys=True, default=str))
+
     @property
     def application_url(self):
         return self.registry["application_url"]
@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+
+from .site_base import SiteBase
+from unittest.mock import MagicMock
+
+import transaction
+import unittest
+
+
+class HookedSite(SiteBase):
+    def __init__(self, **kwargs):
+        super().__init__(
+            registry={},
+            transaction=transaction.TransactionManager(explicit=True),
+            db_session=None,
+            redis=None,
+            mailer=None,
+            get_logger=MagicMock(),
+            **kwargs,
+        )
+        self.calls = []
+
+    def on_before_commit(self):
+        self.calls.append("before_commit")
+
+    def on_after_commit(self, success):
+        self.calls.append(("after_commit", success))
+
+    def on_after_abort_hook(self):
+        self.calls.append("after_abort")
+
+
+class SynchronizedSite(HookedSite):
+    use_transaction_synchronizer = True
+
+
+class FailingResource:
+    def sortKey(self):
+        return "failing"
+
+    def tpc_begin(self, tx):
+        pass
+
+    def commit(self, tx):
+        raise ValueError("failed")
+
+    def abort(self, tx):
+        pass
+
+    def tpc_abort(self, tx):
+        pass
+
+
+class TestInitTransaction(unittest.TestCase):
+    def test_hooks_registered_once(self):
+        site = HookedSite()
+        site.init_transaction()
+        site.init_transaction()
+        tx = site.transaction.get()
+        self.assertEqual(len(list(tx.getBeforeCommitHooks())), 1)
+        self.assertEqual(len(list(tx.getAfterCommitHooks())), 1)
+        self.assertEqual(len(list(tx.getAfterAbortHooks())), 1)
+        site.transaction.commit()
+        self.assertEqual(site.calls, ["before_commit", ("after_commit", True)])
+
+    def test_abort(self):
+        site = HookedSite()
+        site.init_transaction()
+        site.transaction.abort()
+        self.assertEqual(site.calls, ["after_abort"])
+
+
+class TestSiteSynchronizer(unittest.TestCase):
+    def test_commit(self):
+        site = SynchronizedSite()
+        site.init_transaction()
+        site.init_transaction()
+        tx = site.transaction.get()
+        self.assertEqual(len(list(tx.getAfterCommitHooks())), 0)
+        site.transaction.commit()
+        self.assertEqual(site.calls, ["before_commit", ("after_commit", True)])
+
+    def test_abort(self):
+        site = SynchronizedSite()
+        site.init_transaction()
+        site.transaction.abort()
+        self.assertEqual(site.calls, ["after_abort"])
+
+    def test_failed_commit(self):
+        site = SynchronizedSite()
+        site.init_transaction()
+        site.transaction.get().join(FailingResource())
+        with self.assertRaises(ValueError):
+            site.transaction.commit()
+        site.transaction.abort()
+        self.assertEqual(site.calls, ["before_commit", ("after_commit", False), "after_abort"])
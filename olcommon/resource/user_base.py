@@ -1,4 +1,6 @@
 
+from ..bcrypt_executor import bcrypt_hash_rounds
+from ..bcrypt_executor import get_bcrypt_executor
 from ..exc import UserPasswordBaseInvalidTokenError
 from datetime import datetime
 from datetime import timedelta
@@ -18,13 +20,27 @@ class UserPasswordBase:
     - password_reset_expiry (datetime)
     - nounce (big int)
 
+    Hashing and checking run on the process wide BcryptExecutor, which
+    bounds how many run at once. ``hash_password_async`` and
+    ``check_password_async`` can be awaited from asyncio code.
+
+    New hashes use the executor's bcrypt cost. A stored hash with a lower
+    cost is replaced the next time its password is checked. Hashes with a
+    higher cost are kept, so workers which calibrate to different costs
+    don't keep replacing each other's hashes.
     """
 
     PASSWORD_RESET_TOKEN_SIZE = 24
 
     @classmethod
     def hash_password(cls, password):
-        return bcrypt.hashpw(password.encode("utf8"), bcrypt.gensalt())
+        executor = get_bcrypt_executor()
+        return executor.call(bcrypt.hashpw, password.encode("utf8"), executor.gensalt())
+
+    @classmethod
+    async def hash_password_async(cls, password):
+        executor = get_bcrypt_executor()
+        return await executor.call_async(bcrypt.hashpw, password.encode("utf8"), executor.gensalt())
 
     def set_password(self, password):
         logger.info(f"Set password for: {self}")
@@ -54,7 +70,29 @@ class UserPasswordBase:
             return False
         if not self.password_hash:
             return False
-        return bcrypt.checkpw(password.encode("utf8"), self.password_hash)
+        executor = get_bcrypt_executor()
+        if not executor.call(bcrypt.checkpw, password.encode("utf8"), self.password_hash):
+            return False
+        if self.password_needs_rehash():
+            self.password_hash = self.hash_password(password)
+        return True
+
+    async def check_password_async(self, password):
+        if not password:
+            return False
+        if not self.password_hash:
+            return False
+        executor = get_bcrypt_executor()
+        if not await executor.call_async(bcrypt.checkpw, password.encode("utf8"), self.password_hash):
+            return False
+        if self.password_needs_rehash():
+            self.password_hash = await self.hash_password_async(password)
+        return True
+
+    def password_needs_rehash(self):
+        """Returns: True if the password hash cost is below the configured cost"""
+        rounds = bcrypt_hash_rounds(self.password_hash)
+        return rounds is None or rounds < get_bcrypt_executor().rounds
 
     def initiate_password_reset(self):
         """Generates and sets the password_reset_token and
@@ -68,6 +106,9 @@ class UserPasswordBase:
         self.password_reset_expiry = now + timedelta(days=1)
 
     def change_nounce(self):
+        """Bump the nounce. Cached principals are keyed by (sub, nounce) so this
+        also invalidates them.
+        """
         logger.info(f"Change nounce for: {self}")
         if self.nounce is None:
             self.nounce = 0
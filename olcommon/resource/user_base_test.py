@@ -0,0 +1,43 @@
+# -*- coding:utf-8 -*-
+
+from ..bcrypt_executor import configure_bcrypt_executor
+from .user_base import UserPasswordBase
+
+import bcrypt
+import unittest
+
+
+class User(UserPasswordBase):
+    nounce = 1
+
+    def change_nounce(self):
+        self.nounce += 1
+
+
+class TestPasswordRehash(unittest.TestCase):
+    def setUp(self):
+        self.executor = configure_bcrypt_executor(max_workers=1, max_queue=4, rounds=5)
+        self.addCleanup(configure_bcrypt_executor)
+
+    def make_user(self, rounds):
+        user = User()
+        user.password_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds))
+        return user
+
+    def test_lower_cost_rehashed(self):
+        user = self.make_user(4)
+        self.assertTrue(user.check_password("secret"))
+        self.assertTrue(user.password_hash.startswith(b"$2b$05$"))
+
+    def test_higher_cost_kept(self):
+        # A worker which calibrated lower must not undo another's hash
+        user = self.make_user(6)
+        password_hash = user.password_hash
+        self.assertTrue(user.check_password("secret"))
+        self.assertIs(user.password_hash, password_hash)
+
+    def test_wrong_password(self):
+        user = self.make_user(4)
+        password_hash = user.password_hash
+        self.assertFalse(user.check_password("wrong"))
+        self.assertIs(user.password_hash, password_hash)
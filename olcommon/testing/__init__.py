@@ -3,3 +3,4 @@
 
 from .postgresql import POSTGRESQL_LAYER
 from .redis import REDIS_LAYER
+from .site import make_site_registry
@@ -0,0 +1,31 @@
+# -*- coding:utf-8 -*-
+
+from ..db_retry import RetryStats
+from unittest.mock import MagicMock
+
+import sqlalchemy
+import sqlalchemy.orm
+
+
+def make_site_registry(root_class, engine=None, **entries):
+    """Returns: A registry with what SiteBase.from_registry needs, for
+    testing sites outside of a configured app.
+
+    The database is an in memory sqlite one unless engine is given. Redis
+    and logging are mocks. The entries given replace the defaults.
+    """
+    if engine is None:
+        engine = sqlalchemy.create_engine("sqlite://")
+    registry = {
+        "root_class": root_class,
+        "db_engine": engine,
+        "worker_db_session_factory": sqlalchemy.orm.sessionmaker(bind=engine),
+        "use_debug_mailer": False,
+        "sendgrid_smtp_mailer": None,
+        "get_redis": MagicMock(),
+        "get_logger": MagicMock(),
+        "settings": {},
+        "db_retry_stats": RetryStats(),
+    }
+    registry.update(entries)
+    return registry
@@ -2,15 +2,19 @@
 
 from ..const import PATTERN_API_DOMAIN  # noqa
 from ..const import ORM_NAMING_CONVENTION  # noqa
+from ..db_retry import is_retryable_error
+from ..db_retry import retry_backoff
 from ..exc import UserPasswordBaseInvalidTokenError  # noqa
 from ..resource.user_base import UserPasswordBase  # noqa
 from ..resource.record_extras import RecordExtras  # noqa
 from numbers import Number
 from pyramid.decorator import reify
+from transaction.interfaces import NoTransaction
 from contextlib import contextmanager
 from olcommon import logger
 
 import logging
+import time
 import urllib.parse
 
 
@@ -104,12 +108,179 @@ def map_context_reify(*names):
     return wrapper
 
 
+def root_from_registry(registry, read_only=False):
+    if read_only:
+        return registry["root_class"].from_registry(registry, read_only=True)
+    return registry["root_class"].from_registry(registry)
+
+
 @contextmanager
-def root_context(registry):
-    root = registry["root_class"].from_registry(registry)
+def root_context(registry, read_only=False):
+    """Yield a root whose transaction is committed at the end of the block,
+    or aborted if it raises. See root_context_attempts to retry
+    serialization and deadlock failures.
+    """
+    root = root_from_registry(registry, read_only)
     try:
         yield root
         root.transaction.commit()
     except Exception as e:
         root.transaction.abort()
         raise e
+
+
+class RootContextAttempt:
+    """A single attempt of root_context_attempts"""
+
+    def __init__(self, registry, read_only, last, retry_stats=None):
+        self.registry = registry
+        self.read_only = read_only
+        self.last = last
+        self.retry_stats = retry_stats
+        self.root = None
+        self.succeeded = False
+        self.error = None
+
+    def __enter__(self):
+        self.root = root_from_registry(self.registry, self.read_only)
+        return self.root
+
+    def __exit__(self, exc_type, exc, tb):
+        transaction = self.root.transaction
+        if exc is None:
+            try:
+                transaction.commit()
+                self.succeeded = True
+                return False
+            except Exception as e:
+                exc = e
+                raise_error = True
+        else:
+            raise_error = False
+        try:
+            tx = transaction.get()
+        except NoTransaction:
+            tx = None
+        retryable = is_retryable_error(exc, tx)
+        transaction.abort()
+        if retryable and not self.last:
+            self.error = exc
+            return True  # Suppress and try again
+        if retryable and self.retry_stats is not None:
+            self.retry_stats.count("root_context", "exhausted")
+        if raise_error:
+            raise exc
+        return False
+
+
+def root_context_attempts(registry, attempts=None, read_only=False):
+    """Like root_context, but serialization and deadlock failures are retried
+    in a new transaction after a jittered backoff::
+
+        for attempt in root_context_attempts(registry):
+            with attempt as root:
+                ...
+
+    Args:
+        registry: The registry
+        attempts (int): Attempts to make, by default the db_retry_attempts
+            setting or 3
+        read_only (bool): As for root_context
+    """
+    if attempts is None:
+        attempts = int(registry["settings"].get("db_retry_attempts", 3))
+    retry_stats = registry.get("db_retry_stats")
+    for number in range(attempts):
+        attempt = RootContextAttempt(registry, read_only, number == attempts - 1, retry_stats)
+        yield attempt
+        if attempt.succeeded:
+            if number and retry_stats is not None:
+                retry_stats.count("root_context", "recovered")
+            return
+        if attempt.error is None:
+            return  # The block raised a non retryable error, or was left early
+        if retry_stats is not None:
+            retry_stats.count("root_context", "retries")
+        logger.warning(f"Retrying transaction after {attempt.error.__class__.__name__} (attempt {number + 1} of {attempts})")
+        time.sleep(retry_backoff(number))
+
+
+def bulk_root_context(
+    registry,
+    items,
+    func,
+    commit_every=100,
+    commit_seconds=30,
+    resource_cache_size=None,
+    max_failures=None,
+):
+    """Call func(root, item) for each of a stream of work items with one site.
+
+    The transaction is committed every commit_every items or commit_seconds
+    seconds, whichever comes first. Each item runs in a savepoint, so an
+    item which raises is rolled back, along with any jobs it queued, and
+    logged without losing the rest of its batch. The resource cache is
+    cleared at each commit and can be limited to resource_cache_size
+    resources.
+
+    Args:
+        registry: The registry, as for root_context
+        items (Iterable): The work items
+        func (Callable): Called with the root and an item
+        commit_every (int): Items per commit
+        commit_seconds (float): Longest time between commits
+        resource_cache_size (int): Size of the root's resource cache
+        max_failures (int): Raise after this many failed items
+
+    Returns:
+        dict: Counts of items, failures and commits, and items per second
+    """
+    root = root_from_registry(registry)
+    if resource_cache_size is not None:
+        root.resource_cache_max_size = resource_cache_size
+        root.resource_cache_clear()
+
+    stats = {"items": 0, "failed": 0, "commits": 0, "seconds": 0.0, "items_per_second": 0.0}
+    start = batch_start = time.perf_counter()
+    batch_size = 0
+
+    def commit():
+        root.transaction.commit()
+        stats["commits"] += 1
+        stats["seconds"] = time.perf_counter() - start
+        stats["items_per_second"] = stats["items"] / stats["seconds"] if stats["seconds"] else 0.0
+        logger.info(
+            f"Bulk commit {stats['commits']}: {stats['items']} items, {stats['failed']} failed, "
+            f"{stats['items_per_second']:.1f} items/s"
+        )
+        if hasattr(root, "resource_cache_clear"):
+            root.resource_cache_clear()
+
+    try:
+        for item in items:
+            # Join the session to the transaction so the savepoint covers it
+            root.db_session.connection()
+            savepoint = root.transaction.savepoint()
+            pending = root.pending_commit_work_snapshot()
+            try:
+                func(root, item)
+                root.db_session.flush()
+            except Exception:
+                savepoint.rollback()
+                root.restore_pending_commit_work(pending)
+                stats["failed"] += 1
+                logger.exception(f"Bulk item failed: {item!r}")
+                if max_failures is not None and stats["failed"] > max_failures:
+                    raise
+            stats["items"] += 1
+            batch_size += 1
+            if batch_size >= commit_every or time.perf_counter() - batch_start >= commit_seconds:
+                commit()
+                root.begin_next_transaction()
+                batch_size = 0
+                batch_start = time.perf_counter()
+        commit()
+    except Exception as e:
+        root.transaction.abort()
+        raise e
+    return stats
@@ -1,33 +1,191 @@
+"""Password strength checks.
+
+The common password list is searched through a prebuilt index,
+``passwords-common.idx``. It holds the sorted, normalized passwords as
+fixed width records and is memory mapped, so every process shares the same
+pages and nothing is parsed on first use. ``date-words.txt`` holds the month,
+weekday and relative date words that dateparser knows in any language and is
+used to skip dateparser for passwords which can't be a date.
+
+Rebuild both files after changing ``passwords-common.txt`` or upgrading
+dateparser with::
+
+    python -m olcommon.utils.password
+"""
+
 from pathlib import Path
 
 import dateparser
+import mmap
+import re
+import threading
+
+
+MIN_PASSWORD_LENGTH = 8
+
+DATA_DIR = Path(__file__).parent
+COMMON_PASSWORDS_SOURCE = DATA_DIR / "passwords-common.txt"
+COMMON_PASSWORDS_INDEX = DATA_DIR / "passwords-common.idx"
+DATE_WORDS = DATA_DIR / "date-words.txt"
+
+INDEX_RECORD_SIZE = 24
+
+PATTERN_DIGIT = re.compile(r"\d")
+
+
+def normalize_password(password):
+    return "".join(password.lower().split())
+
 
 def is_valid_password(password, invalid_contents=None):
-    password = "".join(password.lower().split())
-    if len(password) < 8:
+    password = normalize_password(password)
+    if len(password) < MIN_PASSWORD_LENGTH:
         return False
-    if common_passwords_cache is None:
-        load_common_password_cache()
-    if password in common_passwords_cache:
+    if password in get_common_password_index():
         return False
     for part in invalid_contents or []:
-        part = "".join(part.lower().split())
+        part = normalize_password(part)
         if part in password:
             return False
-    if dateparser.parse(password) is not None:
+    if might_be_date(password) and dateparser.parse(password) is not None:
         return False
     return True
 
 
-common_passwords_cache = None
+def validate_passwords(passwords, invalid_contents=None):
+    """Validate many passwords, such as during an account import.
+
+    Args:
+        passwords (Iterable[str]): The passwords to check
+        invalid_contents (Iterable[str]): Values that no password may contain
+
+    Returns:
+        list[bool]: Weather each password is valid, in the same order
+    """
+    invalid_contents = [normalize_password(p) for p in invalid_contents or []]
+    results = {}
+    validated = []
+    for password in passwords:
+        if password not in results:
+            results[password] = is_valid_password(password, invalid_contents)
+        validated.append(results[password])
+    return validated
+
+
+def might_be_date(password):
+    """A cheap check to skip dateparser for passwords which are not dates.
+
+    dateparser only parses a value without digits if it contains a date word.
+    """
+    if PATTERN_DIGIT.search(password) is not None:
+        return True
+    date_words, lengths = get_date_words()
+    for start in range(len(password)):
+        for length in lengths:
+            if password[start:start + length] in date_words:
+                return True
+    return False
+
+
+class CommonPasswordIndex:
+    """Membership test against a sorted file of fixed width records"""
 
+    def __init__(self, path):
+        with open(path, "rb") as fin:
+            self.data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = len(self.data) // INDEX_RECORD_SIZE
 
-def load_common_password_cache():
-    global common_passwords_cache
-    path = Path(__file__).parent / "passwords-common.txt"
-    common_passwords = set()
-    with path.open() as fin:
+    def record(self, index):
+        start = index * INDEX_RECORD_SIZE
+        return self.data[start:start + INDEX_RECORD_SIZE].rstrip(b"\0")
+
+    def __contains__(self, password):
+        key = password.encode("utf-8")
+        if len(key) > INDEX_RECORD_SIZE:
+            return False
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self.record(mid)
+            if record < key:
+                lo = mid + 1
+            elif record > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __len__(self):
+        return self.count
+
+
+_common_password_index = None
+_date_words = None
+_load_lock = threading.Lock()
+
+
+def get_common_password_index():
+    global _common_password_index
+    if _common_password_index is None:
+        with _load_lock:
+            if _common_password_index is None:
+                _common_password_index = CommonPasswordIndex(COMMON_PASSWORDS_INDEX)
+    return _common_password_index
+
+
+def get_date_words():
+    """Returns: A tuple of the date words and their distinct lengths"""
+    global _date_words
+    if _date_words is None:
+        with _load_lock:
+            if _date_words is None:
+                words = frozenset(DATE_WORDS.read_text("utf-8").split())
+                _date_words = (words, tuple(sorted({len(w) for w in words})))
+    return _date_words
+
+
+def build_common_password_index(source=COMMON_PASSWORDS_SOURCE, target=COMMON_PASSWORDS_INDEX):
+    """Write the fixed width index of the common passwords.
+
+    Passwords shorter than MIN_PASSWORD_LENGTH are left out as they are
+    rejected before the index is consulted.
+    """
+    passwords = set()
+    with open(source, encoding="utf-8") as fin:
         for line in fin:
-            word = line.strip()
-            common_passwords.add(word)
-    common_passwords_cache = common_passwords
+            password = normalize_password(line)
+            if len(password) >= MIN_PASSWORD_LENGTH:
+                encoded = password.encode("utf-8")
+                assert len(encoded) <= INDEX_RECORD_SIZE, f"Password too long for index: {password}"
+                passwords.add(encoded)
+    with open(target, "wb") as fout:
+        for password in sorted(passwords):
+            fout.write(password.ljust(INDEX_RECORD_SIZE, b"\0"))
+
+
+def build_date_words(target=DATE_WORDS):
+    """Write the date words known to dateparser in any language"""
+    from dateparser.languages.loader import default_loader
+
+    keys = (
+        "january", "february", "march", "april", "may", "june", "july",
+        "august", "september", "october", "november", "december",
+        "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+        "sunday",
+    )
+    words = {"midnight", "noon"}
+    for locale in default_loader.get_locales():
+        info = locale.info
+        candidates = [w for key in keys for w in info.get(key, [])]
+        candidates.extend(w for values in info.get("relative-type", {}).values() for w in values)
+        candidates.extend(str(k) for simplification in info.get("simplifications", []) for k in simplification)
+        for word in candidates:
+            word = normalize_password(word)
+            if len(word) >= 3 and re.search(r"[\d\\()\[\]|+*?{}^$]", word) is None:
+                words.add(word)
+    target.write_text("\n".join(sorted(words)) + "\n", "utf-8")
+
+
+if __name__ == "__main__":
+    build_common_password_index()
+    build_date_words()
@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+
+from .password import CommonPasswordIndex
+from .password import build_common_password_index
+from .password import get_common_password_index
+from .password import is_valid_password
+from .password import might_be_date
+from .password import validate_passwords
+from unittest.mock import patch
+
+import os
+import tempfile
+import unittest
+
+
+class TestCommonPasswordIndex(unittest.TestCase):
+    def test_indexed_hit(self):
+        index = get_common_password_index()
+        self.assertIn("baseball", index)
+        self.assertIn("12345678", index)
+        self.assertNotIn("zq8-unlikely-to-be-common", index)
+        self.assertFalse(is_valid_password("Base Ball"))
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "passwords.txt")
+            target = os.path.join(directory, "passwords.idx")
+            with open(source, "w", encoding="utf-8") as fout:
+                fout.write("zebracorn\nshort\nAardvark1\nzebracorn\n")
+            build_common_password_index(source, target)
+            index = CommonPasswordIndex(target)
+            self.assertEqual(len(index), 2)  # Short and duplicate passwords left out
+            self.assertIn("aardvark1", index)
+            self.assertIn("zebracorn", index)
+            self.assertNotIn("short", index)
+            self.assertNotIn("aardvark", index)
+
+
+class TestDatePrefilter(unittest.TestCase):
+    def test_prefilter_skips_dateparser(self):
+        self.assertFalse(might_be_date("fuzzywuzzyzq"))
+        with patch("olcommon.utils.password.dateparser.parse") as parse:
+            self.assertTrue(is_valid_password("fuzzy wuzzy zq"))
+        parse.assert_not_called()
+
+    def test_dates_still_rejected(self):
+        self.assertTrue(might_be_date("january2020"))
+        self.assertTrue(might_be_date("novembertenth"))
+        self.assertFalse(is_valid_password("1 January 2020"))
+
+
+class TestValidatePasswords(unittest.TestCase):
+    def test_matches_single_validation(self):
+        passwords = [
+            "baseball", "short", "fuzzy wuzzy zq", "1 January 2020",
+            "alice-in-chains", "fuzzy wuzzy zq",
+        ]
+        invalid_contents = ["Alice"]
+        self.assertEqual(
+            validate_passwords(passwords, invalid_contents),
+            [is_valid_password(p, invalid_contents) for p in passwords],
+        )
+        self.assertEqual(
+            validate_passwords(passwords, invalid_contents),
+            [False, False, True, False, False, True],
+        )
@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+
+from ..resource.job_behavior import JobBehavior
+from ..resource.site_base import SiteBase
+from ..testing import make_site_registry
+from . import bulk_root_context
+from . import root_context_attempts
+from ctq import ResourceCache
+from sqlalchemy import event
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import sqlalchemy
+import unittest
+import zope.sqlalchemy
+
+
+class Site(ResourceCache, SiteBase):
+    pass
+
+
+class JobSite(JobBehavior, ResourceCache, SiteBase):
+    pass
+
+
+def make_registry():
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=sqlalchemy.pool.StaticPool)
+
+    # Let SQLAlchemy, rather than pysqlite, begin transactions so that
+    # savepoints work
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE item (value INTEGER)")
+    return make_site_registry(Site, engine=engine)
+
+
+def insert(root, value):
+    root.db_session.execute(sqlalchemy.text("INSERT INTO item VALUES (:value)"), {"value": value})
+    zope.sqlalchemy.mark_changed(root.db_session, root.transaction, keep_session=True)
+    if value < 0:
+        raise ValueError(value)
+    root.resource_cache_set((str(value),), value)
+
+
+def stored(registry):
+    with registry["db_engine"].connect() as connection:
+        return [r[0] for r in connection.exec_driver_sql("SELECT value FROM item ORDER BY value")]
+
+
+class TestBulkRootContext(unittest.TestCase):
+    def setUp(self):
+        # zope.sqlalchemy refuses savepoints on sqlite, which work with the
+        # begin handling in make_registry
+        patcher = patch("zope.sqlalchemy.datamanager.NO_SAVEPOINT_SUPPORT", set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_commits_in_batches(self):
+        registry = make_registry()
+        stats = bulk_root_context(registry, range(10), insert, commit_every=4)
+        self.assertEqual(stored(registry), list(range(10)))
+        self.assertEqual(stats["items"], 10)
+        self.assertEqual(stats["commits"], 3)
+        self.assertGreater(stats["items_per_second"], 0)
+
+    def test_failed_items_rolled_back(self):
+        registry = make_registry()
+        stats = bulk_root_context(registry, [1, -1, 2, -2, 3], insert, commit_every=2)
+        self.assertEqual(stored(registry), [1, 2, 3])
+        self.assertEqual(stats["failed"], 2)
+
+    def test_max_failures(self):
+        registry = make_registry()
+        with self.assertRaises(ValueError):
+            bulk_root_context(registry, [1, 2, -1, 3, -2, 4], insert, commit_every=2, max_failures=1)
+        self.assertEqual(stored(registry), [1, 2, 3])  # -2 is in an uncommitted batch with 4
+
+    def test_resource_cache_bounded(self):
+        registry = make_registry()
+        roots = []
+        bulk_root_context(
+            registry, range(5), lambda root, item: (roots.append(root), insert(root, item)),
+            commit_every=100, resource_cache_size=2,
+        )
+        self.assertEqual(roots[0].resource_cache_max_size, 2)
+
+    def test_failed_items_enqueue_nothing(self):
+        registry = make_registry()
+        registry["root_class"] = JobSite
+        queue = MagicMock()
+        queue.name = "default"
+        flushed = []
+
+        def enqueue_and_insert(root, item):
+            root.enqueue(queue, print, item, job_coalesce=f"key{abs(item)}")
+            root.enqueue_emit_many(queue, [("", "items", str(item))], "changed")
+            insert(root, item)
+
+        def flush_pending_jobs(root):
+            flushed.append((
+                [args for (queue, func, args, kwargs, debounce) in root._job_enqueue_pending],
+                [paths for (queue, paths, *rest) in root._job_enqueue_emit_many_pending],
+            ))
+
+        with patch.object(JobSite, "flush_pending_jobs", flush_pending_jobs):
+            bulk_root_context(registry, [-1, 1, 2, -2], enqueue_and_insert, commit_every=4)
+        # The failed -1 neither enqueued its job nor kept its coalesce key
+        self.assertEqual(flushed, [
+            ([(1,), (2,)], [[("", "items", "1")], [("", "items", "2")]]),
+        ])
+
+
+class Conflict(Exception):
+    pgcode = "40P01"
+
+
+@patch("olcommon.utils.time.sleep")
+class TestRootContextAttempts(unittest.TestCase):
+    def run_attempts(self, registry, errors, **kwargs):
+        errors = list(errors)
+        calls = []
+        for attempt in root_context_attempts(registry, **kwargs):
+            with attempt as root:
+                calls.append(root)
+                insert(root, len(calls))
+                if errors:
+                    raise errors.pop(0)
+        return calls
+
+    def test_retried_until_success(self, sleep):
+        registry = make_registry()
+        calls = self.run_attempts(registry, [Conflict(), Conflict()])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(stored(registry), [3])
+        self.assertEqual(
+            registry["db_retry_stats"].stats(),
+            {"root_context": {"retries": 2, "recovered": 1}},
+        )
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_exhausted(self, sleep):
+        registry = make_registry()
+        with self.assertRaises(Conflict):
+            self.run_attempts(registry, [Conflict(), Conflict()], attempts=2)
+        self.assertEqual(stored(registry), [])
+        self.assertEqual(registry["db_retry_stats"].stats()["root_context"]["exhausted"], 1)
+
+    def test_other_errors_not_retried(self, sleep):
+        registry = make_registry()
+        with self.assertRaises(ValueError):
+            self.run_attempts(registry, [ValueError()])
+        self.assertEqual(stored(registry), [])
+        sleep.assert_not_called()
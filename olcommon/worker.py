@@ -0,0 +1,124 @@
+"""An RQ worker which keeps one site for the life of the process
+
+Building a site with SiteBase.from_registry makes a transaction manager,
+database session, redis client and mailer. ``SiteWorker`` runs its jobs in
+the worker process, without forking a work horse per job, so one site is
+built and reset between jobs instead::
+
+    worker = SiteWorker(queues, registry=registry, connection=registry["get_redis"]())
+    worker.work()
+
+Jobs marked with ``olcommon.jobs.site_job``, such as ``resource_call`` and
+``resource_emit``, are called with the site as their first argument. The
+job's transaction is committed when it returns and aborted if it raises.
+Serialization and deadlock failures are retried up to the
+``db_retry_attempts`` setting (default 3) times before the job fails.
+A job's debounce window (see JobBehavior) is released as it starts, rather
+than by the callbacks when it finishes as in other workers.
+"""
+
+from .db_retry import is_retryable_error
+from .db_retry import retry_backoff
+from ctq import ResourceCache
+from rq import SimpleWorker
+from rq.job import Job
+
+import logging
+import time
+
+
+logger = logging.getLogger("app")
+
+
+class WorkerSiteFactory:
+    """Keep one site and reset it between jobs.
+
+    A reset begins a new transaction, closes the database session, which
+    returns its connection, and clears the resource cache. A site whose
+    transaction was aborted has been closed by on_after_abort_hook, so it
+    is replaced.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.site = None
+        self.sites_created = 0
+        self.sites_reused = 0
+
+    def get(self):
+        """Returns: The site ready for the next job"""
+        site = self.site
+        if site is None or site.transaction is None:
+            site = self.site = self.registry["root_class"].from_registry(self.registry)
+            self.sites_created += 1
+        else:
+            self.reset(site)
+            self.sites_reused += 1
+        return site
+
+    def reset(self, site):
+        if site.db_session is not None:
+            site.db_session.close()
+        if isinstance(site, ResourceCache):
+            site.resource_cache_clear()
+        site.begin_next_transaction()
+
+    def stats(self):
+        return {
+            "sites_created": self.sites_created,
+            "sites_reused": self.sites_reused,
+        }
+
+
+class SiteJob(Job):
+    """A job which calls site jobs with the worker's site"""
+
+    site_factory = None
+
+    def _execute(self):
+        debounce_key = self.meta.get("debounce_key")
+        if debounce_key:
+            # Identical work enqueued from now on may need this job's result
+            # to be recomputed, so let it through
+            self.connection.delete(debounce_key)
+        if self.site_factory is None or not getattr(self.func, "site_job", False):
+            return super()._execute()
+        registry = self.site_factory.registry
+        retry_stats = registry.get("db_retry_stats")
+        attempts = int(registry["settings"].get("db_retry_attempts", 3))
+        for number in range(attempts):
+            site = self.site_factory.get()
+            transaction = site.transaction
+            try:
+                result = self.func(site, *self.args, **self.kwargs)
+                transaction.commit()
+            except Exception as e:
+                retryable = is_retryable_error(e, transaction.get())
+                transaction.abort()
+                if not retryable:
+                    raise
+                if number == attempts - 1:
+                    if retry_stats is not None:
+                        retry_stats.count("job", "exhausted")
+                    raise
+                if retry_stats is not None:
+                    retry_stats.count("job", "retries")
+                logger.warning(f"Retrying job {self.id} after {e.__class__.__name__} (attempt {number + 1} of {attempts})")
+                time.sleep(retry_backoff(number))
+                continue
+            if number and retry_stats is not None:
+                retry_stats.count("job", "recovered")
+            return result
+
+
+class SiteWorker(SimpleWorker):
+    """A worker which runs jobs in process with a reused site"""
+
+    def __init__(self, *args, registry, **kwargs):
+        kwargs.setdefault("job_class", SiteJob)
+        super().__init__(*args, **kwargs)
+        self.site_factory = WorkerSiteFactory(registry)
+
+    def execute_job(self, job, queue):
+        job.site_factory = self.site_factory
+        return super().execute_job(job, queue)
@@ -0,0 +1,115 @@
+# -*- coding:utf-8 -*-
+
+from .jobs import resource_call
+from .resource.site_base import SiteBase
+from .testing import make_site_registry
+from .worker import SiteJob
+from .worker import WorkerSiteFactory
+from ctq import ResourceCache
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import sqlalchemy
+import unittest
+
+
+class Site(ResourceCache, SiteBase):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+
+    def record(self, value):
+        self.db_session.execute(sqlalchemy.text("SELECT 1"))
+        self.calls.append(value)
+
+    def fail(self):
+        raise ValueError("failed")
+
+    def conflict(self, failures):
+        self.calls.append("conflict")
+        attempts = self.registry.setdefault("conflict_attempts", [])
+        attempts.append(self)
+        if len(attempts) <= failures:
+            raise Conflict()
+
+
+class Conflict(Exception):
+    pgcode = "40001"
+
+
+def make_registry():
+    return make_site_registry(Site, settings={"db_retry_attempts": "2"})
+
+
+class TestWorkerSiteFactory(unittest.TestCase):
+    def test_site_reused_between_jobs(self):
+        factory = WorkerSiteFactory(make_registry())
+        site = factory.get()
+        first_tx = site.transaction.get()
+        site.resource_cache_set(("a",), "cached")
+        site.transaction.commit()
+
+        self.assertIs(factory.get(), site)
+        self.assertIsNot(site.transaction.get(), first_tx)
+        self.assertIsNone(site.resource_cache_get(("a",)))
+        self.assertEqual(factory.stats(), {"sites_created": 1, "sites_reused": 1})
+
+    def test_site_replaced_after_abort(self):
+        factory = WorkerSiteFactory(make_registry())
+        site = factory.get()
+        site.transaction.abort()
+        self.assertIsNot(factory.get(), site)
+        self.assertEqual(factory.stats()["sites_created"], 2)
+
+
+class TestSiteJob(unittest.TestCase):
+    def make_job(self, factory, *args):
+        job = SiteJob.create(resource_call, args=args, connection=MagicMock())
+        job.site_factory = factory
+        return job
+
+    def test_site_job_called_with_site(self):
+        factory = WorkerSiteFactory(make_registry())
+        for value in ("a", "b"):
+            self.make_job(factory, [""], "record", value)._execute()
+        self.assertEqual(factory.site.calls, ["a", "b"])
+        self.assertEqual(factory.sites_created, 1)
+
+    def test_failed_job_aborts(self):
+        factory = WorkerSiteFactory(make_registry())
+        with self.assertRaises(ValueError):
+            self.make_job(factory, [""], "fail")._execute()
+        self.assertIsNone(factory.site.transaction)
+
+    @patch("olcommon.worker.time.sleep")
+    def test_serialization_failure_retried(self, sleep):
+        registry = make_registry()
+        factory = WorkerSiteFactory(registry)
+        self.make_job(factory, [""], "conflict", 1)._execute()
+        first, second = registry["conflict_attempts"]
+        self.assertIsNot(first, second)  # The aborted site is replaced
+        self.assertEqual(second.calls, ["conflict"])
+        self.assertEqual(registry["db_retry_stats"].stats(), {"job": {"retries": 1, "recovered": 1}})
+        sleep.assert_called_once()
+
+    @patch("olcommon.worker.time.sleep")
+    def test_retries_exhausted(self, sleep):
+        registry = make_registry()
+        factory = WorkerSiteFactory(registry)
+        with self.assertRaises(Conflict):
+            self.make_job(factory, [""], "conflict", 2)._execute()
+        self.assertEqual(registry["db_retry_stats"].stats(), {"job": {"retries": 1, "exhausted": 1}})
+
+    def test_debounce_window_released(self):
+        factory = WorkerSiteFactory(make_registry())
+        job = self.make_job(factory, [""], "record", "a")
+        job.meta["debounce_key"] = "olcommon:job-debounce:key"
+        job._execute()
+        job.connection.delete.assert_called_once_with("olcommon:job-debounce:key")
+
+    def test_other_jobs_unchanged(self):
+        func = MagicMock(return_value=1, __name__="func")
+        job = SiteJob.create(func, args=(2,), connection=MagicMock())
+        job.site_factory = WorkerSiteFactory(make_registry())
+        self.assertEqual(job._execute(), 1)
+        func.assert_called_once_with(2)
@@ -0,0 +1,139 @@
+"""Routing of keys to the write group queues
+
+Jobs for one key, such as a record's UUID, are sent to the same queue of
+the ``rq_write_group_queues`` setting so they run in order. Keys are mapped
+with jump consistent hashing (Lamping and Veach, "A Fast, Minimal Memory,
+Consistent Hash Algorithm"). When a queue is added to the end of the
+setting only about 1/N of the keys move, all of them to the new queue, so
+ordering holds for the rest during a scale out. Queues must be added and
+removed at the end of the list.
+
+Run as a script to report how keys spread over queues and how many move
+when a queue is added::
+
+    python -m olcommon.write_groups "write0 write1 write2" [--add write3] [--keys-file keys.txt]
+"""
+
+from collections import Counter
+from hashlib import md5
+from uuid import UUID
+from uuid import uuid4
+
+import argparse
+import json
+import sys
+import threading
+
+
+def key_bytes(key):
+    """Returns: The bytes of a UUID or str key"""
+    if isinstance(key, UUID):
+        return key.bytes
+    elif isinstance(key, str):
+        return key.encode('utf-8')
+    raise NotImplementedError(f"Not implemented for key of type {type(key)}")
+
+
+def key_hash(key):
+    """Returns: A 64 bit int hash of the key"""
+    return int.from_bytes(md5(key_bytes(key)).digest()[:8], "big")
+
+
+def jump_hash(key_hash, buckets):
+    """Returns: The bucket, from 0 to buckets - 1, of a 64 bit key hash"""
+    bucket = -1
+    j = 0
+    while j < buckets:
+        bucket = j
+        key_hash = (key_hash * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key_hash >> 33) + 1)))
+    return bucket
+
+
+def write_group_index(key, groups):
+    """Returns: The index of the write group of key out of groups"""
+    return jump_hash(key_hash(key), groups)
+
+
+class WriteGroupStats:
+    """Counts of jobs routed to each write group, and the keys seen most.
+
+    Only the most frequent ``hot_key_capacity`` keys are kept, so the key
+    counts are approximate once there are more keys than that.
+    """
+
+    def __init__(self, hot_key_capacity=100):
+        self.hot_key_capacity = hot_key_capacity
+        self.groups = Counter()
+        self.keys = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, group_name, key):
+        with self.lock:
+            self.groups[group_name] += 1
+            self.keys[str(key)] += 1
+            if len(self.keys) > self.hot_key_capacity * 10:
+                self.keys = Counter(dict(self.keys.most_common(self.hot_key_capacity)))
+
+    def stats(self, hot_keys=10):
+        """Returns: The count of each group, the skew (the busiest group's
+        count over the mean) and the hottest keys
+        """
+        with self.lock:
+            groups = dict(self.groups)
+            hot = self.keys.most_common(hot_keys)
+        total = sum(groups.values())
+        return {
+            "total": total,
+            "groups": groups,
+            "skew": max(groups.values()) / (total / len(groups)) if total else None,
+            "hot_keys": [{"key": key, "count": count} for (key, count) in hot],
+        }
+
+
+def distribution_report(keys, queues, add=()):
+    """Returns: How keys spread over queues, and the keys moved when the
+    queues in add are appended.
+    """
+    keys = list(keys)
+    before = [write_group_index(k, len(queues)) for k in keys]
+    counts = Counter(queues[i] for i in before)
+    mean = len(keys) / len(queues)
+    report = {
+        "keys": len(keys),
+        "queues": {name: counts[name] for name in queues},
+        "min_over_mean": min(counts[name] for name in queues) / mean,
+        "max_over_mean": max(counts[name] for name in queues) / mean,
+    }
+    if add:
+        grown = list(queues) + list(add)
+        after = [write_group_index(k, len(grown)) for k in keys]
+        moved = sum(1 for (b, a) in zip(before, after) if b != a)
+        report["added"] = list(add)
+        report["moved"] = moved
+        report["moved_fraction"] = moved / len(keys)
+        report["ideal_moved_fraction"] = len(add) / len(grown)
+        counts_after = Counter(grown[i] for i in after)
+        report["queues_after"] = {name: counts_after[name] for name in grown}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report how keys spread over write group queues")
+    parser.add_argument("queues", help="The rq_write_group_queues setting, space separated")
+    parser.add_argument("--add", default="", help="Queues to append, space separated")
+    parser.add_argument("--keys-file", help="Keys, one per line. Random UUIDs when not given")
+    parser.add_argument("--keys", type=int, default=100000, help="Number of random UUIDs")
+    args = parser.parse_args(argv)
+    if args.keys_file:
+        with open(args.keys_file, encoding="utf-8") as fin:
+            keys = [line.strip() for line in fin if line.strip()]
+    else:
+        keys = [uuid4() for i in range(args.keys)]
+    report = distribution_report(keys, args.queues.split(), args.add.split())
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
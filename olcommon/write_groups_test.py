@@ -0,0 +1,56 @@
+# -*- coding:utf-8 -*-
+
+from .write_groups import WriteGroupStats
+from .write_groups import distribution_report
+from .write_groups import jump_hash
+from .write_groups import write_group_index
+from uuid import UUID
+
+import unittest
+
+
+class TestJumpHash(unittest.TestCase):
+    def test_in_range(self):
+        for key_hash in range(0, 2 ** 64, 2 ** 58):
+            self.assertEqual(jump_hash(key_hash, 1), 0)
+            self.assertIn(jump_hash(key_hash, 7), range(7))
+
+    def test_keys_only_move_to_added_queue(self):
+        for n in range(2000):
+            key = f"key-{n}"
+            for groups in range(1, 10):
+                before = write_group_index(key, groups)
+                after = write_group_index(key, groups + 1)
+                self.assertIn(after, (before, groups))
+
+    def test_key_types(self):
+        key = UUID("12345678-1234-5678-1234-567812345678")
+        self.assertEqual(write_group_index(key, 5), write_group_index(key, 5))
+        with self.assertRaises(NotImplementedError):
+            write_group_index(1, 5)
+
+
+class TestDistributionReport(unittest.TestCase):
+    def test_report(self):
+        report = distribution_report([f"key-{n}" for n in range(4000)], ["a", "b", "c"], ["d"])
+        self.assertEqual(sum(report["queues"].values()), 4000)
+        self.assertLess(report["max_over_mean"], 1.1)
+        self.assertAlmostEqual(report["moved_fraction"], 0.25, delta=0.03)
+        self.assertEqual(report["moved"], report["queues_after"]["d"])
+
+
+class TestWriteGroupStats(unittest.TestCase):
+    def test_counts_and_hot_keys(self):
+        stats = WriteGroupStats(hot_key_capacity=2)
+        for n in range(30):
+            stats.count("a", f"key-{n}")
+        for n in range(5):
+            stats.count("b", "hot")
+        result = stats.stats(hot_keys=1)
+        self.assertEqual(result["total"], 35)
+        self.assertEqual(result["groups"], {"a": 30, "b": 5})
+        self.assertAlmostEqual(result["skew"], 30 / 17.5)
+        self.assertEqual(result["hot_keys"], [{"key": "hot", "count": 5}])
+
+    def test_empty(self):
+        self.assertEqual(WriteGroupStats().stats()["skew"], None)
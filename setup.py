@@ -13,12 +13,14 @@ setup(name='olcommon',
         'setuptools',
 
         'plone.testing',
+        'fakeredis[lua]',
         'requests',
 
         'pyramid',
         'pyramid_chameleon',
         'pyramid_exclog',
         'pyramid_tm',
+        'pyramid_retry',
         'pyramid_mailer',
 
         'sqlalchemy',
@@ -26,6 +28,7 @@ setup(name='olcommon',
         'zope.sqlalchemy',
 
         'redis',
+        'rq>=2,<3',
         'pyramid-session-redis',
 
         'jsonschema',
@@ -33,6 +36,7 @@ setup(name='olcommon',
         'bcrypt',
 
         'ctq',
+        'cachetools',
         'ctq-sqlalchemy',
 
         'psycopg2-binary',